@@ -0,0 +1,371 @@
+"""
+Бенчмарки коллектора и комбинатора на синтетических данных.
+Результаты пишутся строками JSON, чтобы их можно было сравнивать между версиями.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from typing import Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from database import connect, init_db_schema, insert_directory, insert_file_records, make_file_record
+from walker import join_relative_path, split_parent_path, to_native_path
+
+
+WORK_DIR = "benchmark_data"
+SHARED_NAMES = 1000         # size of the pool of colliding file names
+MAX_FILE_SIZE = 1 << 24
+COMMIT_ROWS = 100000
+
+
+class TreeShape:
+    """Parameters of a synthetic tree. The same shape and seed always give the same tree."""
+    files: int
+    depth: int
+    fanout: int
+    collisions: float
+    case_variants: float
+    seed: int
+
+    def __init__(self, files: int, depth: int, fanout: int, collisions: float,
+                 case_variants: float, seed: int) -> None:
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.collisions = collisions
+        self.case_variants = case_variants
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    pass
+
+
+def iter_tree(shape: TreeShape, volume_index: int) -> Iterator[tuple[str, list[tuple[str, int]]]]:
+    """
+    Yields (relative directory path, [(file name, size)]) in depth-first order.
+    Every volume has the same directory skeleton, so the paths of different volumes overlap.
+    With probability `collisions` a file takes a name from a shared pool, so the same path
+    exists on several volumes; with probability `case_variants` a directory or a file name
+    differs from the other volumes only by case (a file also gets an upper-case twin).
+    """
+    rng = random.Random(f"{shape.seed}:{volume_index}")
+    dir_count = sum(shape.fanout ** level for level in range(shape.depth + 1))
+    per_dir, remainder = divmod(shape.files, dir_count)
+    file_number = 0
+    dir_number = 0
+
+    stack = [("", 0)]
+    while stack:
+        path, level = stack.pop()
+        count = per_dir + (1 if dir_number < remainder else 0)
+        dir_number += 1
+
+        files = {}
+        while count > 0:
+            name = None
+            if rng.random() < shape.collisions:
+                name = f"shared_{rng.randrange(SHARED_NAMES)}.txt"
+            if name is None or name in files:
+                name = f"v{volume_index}_file_{file_number}.dat"
+                file_number += 1
+            files[name] = min(int(rng.lognormvariate(9, 2.5)), MAX_FILE_SIZE)
+            count -= 1
+            if count > 0 and rng.random() < shape.case_variants and name.upper() not in files:
+                files[name.upper()] = files[name]
+                count -= 1
+        yield path, list(files.items())
+
+        if level < shape.depth:
+            for index in reversed(range(shape.fanout)):
+                name = f"dir_{level}_{index}"
+                if rng.random() < shape.case_variants:
+                    name = name.upper()
+                stack.append((join_relative_path(path, name), level + 1))
+
+def generate_tree(root: str, shape: TreeShape, volumes: int) -> list[str]:
+    """
+    Creates the tree of every volume under root/volN with sparse files of the generated sizes.
+    An existing tree of the same shape is reused. Returns the volume roots.
+    """
+    marker_path = os.path.join(root, "shape.json")
+    description = json.dumps({"shape": shape.as_dict(), "volumes": volumes}, sort_keys=True)
+    volume_roots = [os.path.join(root, f"vol{index}") for index in range(volumes)]
+    if os.path.exists(marker_path):
+        with open(marker_path, encoding="utf-8") as marker:
+            if marker.read() == description:
+                return volume_roots
+    shutil.rmtree(root, ignore_errors=True)
+
+    for index, volume_root in enumerate(volume_roots):
+        for path, files in iter_tree(shape, index):
+            dir_path = to_native_path(volume_root, path)
+            os.makedirs(dir_path, exist_ok=True)
+            for name, size in files:
+                with open(os.path.join(dir_path, name), "wb") as f:
+                    f.truncate(size)
+
+    with open(marker_path, "w", encoding="utf-8") as marker:
+        marker.write(description)
+    return volume_roots
+
+def generate_index(db_path: str, shape: TreeShape, volumes: int) -> str:
+    """
+    Writes the synthetic trees straight into an index database, without touching the disk.
+    An existing database of the same shape is reused. Returns db_path.
+    """
+    marker_path = db_path + ".json"
+    description = json.dumps({"shape": shape.as_dict(), "volumes": volumes}, sort_keys=True)
+    if os.path.exists(marker_path) and os.path.exists(db_path):
+        with open(marker_path, encoding="utf-8") as marker:
+            if marker.read() == description:
+                return db_path
+    for suffix in ("", "-wal", "-shm", ".json"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    init_db_schema(db_path)
+    db_conn = connect(db_path)
+    dir_stat = synthetic_stat(0o40755, 0)
+    for index in range(volumes):
+        cursor = db_conn.execute(
+            "INSERT INTO volumes (volume_guid, letter, label, filesystem, drive_name) VALUES (?, ?, ?, ?, ?)",
+            (f"bench-{index}", f"vol{index}", f"vol{index}", "synthetic", f"drive{index}")
+        )
+        volume_id = cursor.lastrowid
+        pending = 0
+        dir_ids = {}
+        for path, files in iter_tree(shape, index):
+            parent_path, name = split_parent_path(path)
+            dir_id = insert_directory(db_conn, volume_id, dir_ids.get(parent_path) if path else None, name,
+                                      dir_stat, time.time())
+            dir_ids[path] = dir_id
+            insert_file_records(db_conn, [
+                make_file_record(dir_id, name, synthetic_stat(0o100644, size)) for name, size in files
+            ])
+            pending += len(files) + 1
+            if pending >= COMMIT_ROWS:
+                db_conn.commit()
+                pending = 0
+        db_conn.commit()
+    db_conn.execute("ANALYZE")
+    db_conn.close()
+
+    with open(marker_path, "w", encoding="utf-8") as marker:
+        marker.write(description)
+    return db_path
+
+
+def synthetic_stat(mode: int, size: int) -> os.stat_result:
+    now = time.time_ns()
+    seconds = now / 1e9
+    return os.stat_result((mode, 0, 0, 1, 0, 0, size, seconds, seconds, seconds),
+                          {"st_atime_ns": now, "st_mtime_ns": now, "st_ctime_ns": now})
+
+def read_proc_io() -> dict[str, int]:
+    """I/O counters of the current process (syscr, syscw, read_bytes, ...) where /proc is available."""
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f if ":" in line)}
+    except OSError:
+        return {}
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of the current process in bytes."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+def database_size(db_path: str) -> int:
+    return sum(os.path.getsize(db_path + suffix) for suffix in ("", "-wal")
+               if os.path.exists(db_path + suffix))
+
+
+def run_collector(params: dict) -> dict:
+    """Scans the volume roots into a fresh database. Runs in the child process."""
+    import collector
+    import instrumentation
+    from get_volumes import DirectoryVolumeProvider
+
+    db_path = params["db_path"]
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    init_db_schema(db_path)
+    provider = DirectoryVolumeProvider(params["roots"])
+    letters = [volume.letter for volume in provider.get_volumes()]
+    if params.get("instrument"):
+        instrumentation.enable()
+
+    io_before = read_proc_io()
+    started = time.perf_counter()
+    collector.scan_and_index_volumes(db_path, letters, "benchmark", params["mode"], params["workers"],
+                                     provider=provider)
+    elapsed = time.perf_counter() - started
+    io_after = read_proc_io()
+
+    db_conn = connect(db_path)
+    files = db_conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    directories = db_conn.execute("SELECT COUNT(*) FROM directories").fetchone()[0]
+    db_conn.close()
+    result = {
+        "seconds": elapsed,
+        "files": files,
+        "directories": directories,
+        "files_per_second": files / elapsed,
+        "directories_per_second": directories / elapsed,
+        "db_rows_per_second": (files + directories) / elapsed,
+        "db_bytes": database_size(db_path),
+        # one scandir per directory, one stat per file and per subdirectory
+        "metadata_calls_estimated": 2 * directories + files,
+        "io": {key: io_after[key] - io_before.get(key, 0) for key in io_after},
+        "peak_rss_bytes": peak_rss(),
+    }
+    if instrumentation.enabled:
+        result["phases"] = instrumentation.snapshot()
+    return result
+
+def run_combinator(params: dict) -> dict:
+    """Runs combinator.main over an existing database. Runs in the child process."""
+    import combinator
+
+    db_path = params["db_path"]
+    started = time.perf_counter()
+    combinator.main(db_path, params["engine"], params.get("workers"))
+    elapsed = time.perf_counter() - started
+
+    db_conn = connect(db_path)
+    rows = db_conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    output_rows = db_conn.execute("SELECT COUNT(*) FROM output_files").fetchone()[0]
+    db_conn.close()
+    return {
+        "seconds": elapsed,
+        "rows": rows,
+        "output_rows": output_rows,
+        "rows_per_second": rows / elapsed,
+        "peak_rss_bytes": peak_rss(),
+    }
+
+CHILD_RUNNERS = {
+    "collector": run_collector,
+    "combinator": run_combinator,
+}
+
+
+def run_child(kind: str, params: dict, cwd: str) -> dict:
+    """
+    Runs one measurement in a fresh interpreter, so the peak RSS and the page cache
+    state of one run don't leak into the next. The child prints its result as the last line.
+    """
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "child", kind, json.dumps(params)],
+        cwd=cwd, stdout=subprocess.PIPE, check=True, text=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def emit(record: dict, output: Optional[str]):
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        **record,
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    print(line, flush=True)
+
+def shape_from_args(args, files: Optional[int] = None) -> TreeShape:
+    return TreeShape(files if files is not None else args.files, args.depth, args.fanout,
+                     args.collisions, args.case_variants, args.seed)
+
+def add_shape_arguments(parser: argparse.ArgumentParser, files: bool = True):
+    if files:
+        parser.add_argument("--files", type=int, default=100000, help="files per volume")
+    parser.add_argument("--depth", type=int, default=4, help="directory levels below the root")
+    parser.add_argument("--fanout", type=int, default=8, help="subdirectories per directory")
+    parser.add_argument("--collisions", type=float, default=0.3,
+                        help="share of file names taken from a pool shared by all volumes")
+    parser.add_argument("--case-variants", type=float, default=0.05,
+                        help="share of names that differ from the other volumes only by case")
+    parser.add_argument("--volumes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir", default=WORK_DIR, help="where trees and databases are generated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the collector and the combinator on synthetic data")
+    parser.add_argument("--output", help="also append the JSON lines to this file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    tree_parser = commands.add_parser("tree", help="only generate a synthetic tree")
+    add_shape_arguments(tree_parser)
+
+    collector_parser = commands.add_parser("collector", help="scan a synthetic tree")
+    add_shape_arguments(collector_parser)
+    collector_parser.add_argument("--mode", default="serial", help="collector scan mode")
+    collector_parser.add_argument("--workers", type=int, default=4)
+    collector_parser.add_argument("--repeat", type=int, default=1)
+    collector_parser.add_argument("--instrument", action="store_true", help="add the phase timings of the scan")
+
+    combinator_parser = commands.add_parser("combinator", help="run the combinator over a synthetic index")
+    add_shape_arguments(combinator_parser, files=False)
+    combinator_parser.add_argument("--rows", type=int, nargs="+", default=[1000000],
+                                   help="total file rows of the generated indexes")
+    combinator_parser.add_argument("--engine", nargs="+", default=["memory"], help="combinator engines")
+    combinator_parser.add_argument("--workers", type=int, help="processes of the parallel engine")
+
+    child_parser = commands.add_parser("child")
+    child_parser.add_argument("kind", choices=CHILD_RUNNERS)
+    child_parser.add_argument("params")
+
+    args = parser.parse_args()
+
+    if args.command == "child":
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = CHILD_RUNNERS[args.kind](json.loads(args.params))
+        print(json.dumps(result))
+
+    elif args.command == "tree":
+        shape = shape_from_args(args)
+        started = time.perf_counter()
+        roots = generate_tree(os.path.join(args.work_dir, "tree"), shape, args.volumes)
+        emit({"benchmark": "tree", "shape": shape.as_dict(), "volumes": args.volumes,
+              "roots": roots, "seconds": time.perf_counter() - started}, args.output)
+
+    elif args.command == "collector":
+        shape = shape_from_args(args)
+        work_dir = os.path.abspath(args.work_dir)
+        roots = generate_tree(os.path.join(work_dir, "tree"), shape, args.volumes)
+        params = {"db_path": os.path.join(work_dir, "collector.db"), "roots": roots,
+                  "mode": args.mode, "workers": args.workers, "instrument": args.instrument}
+        for run in range(args.repeat):
+            result = run_child("collector", params, work_dir)
+            emit({"benchmark": "collector", "shape": shape.as_dict(), "volumes": args.volumes,
+                  "mode": args.mode, "workers": args.workers, "run": run, **result}, args.output)
+
+    elif args.command == "combinator":
+        work_dir = os.path.abspath(args.work_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        for rows in args.rows:
+            shape = shape_from_args(args, files=rows // args.volumes)
+            db_path = generate_index(os.path.join(work_dir, f"index_{rows}.db"), shape, args.volumes)
+            for engine in args.engine:
+                result = run_child("combinator", {"db_path": db_path, "engine": engine, "workers": args.workers},
+                                   work_dir)
+                emit({"benchmark": "combinator", "shape": shape.as_dict(), "volumes": args.volumes,
+                      "engine": engine, "workers": args.workers, **result}, args.output)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Контрольные точки сканирования: граница обхода тома (стек каталогов и позиция
+внутри текущего каталога) сохраняется в index.db, и прерванный скан
+продолжается с неё, а не обходит дерево заново.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Optional
+
+from database import load_scan_checkpoint, save_scan_checkpoint
+from walker import to_native_path
+
+
+DEFAULT_CHECKPOINT_INTERVAL = 30.0   # seconds
+FRONTIER_VERSION = 1
+
+
+class ScanCheckpoint:
+    """
+    Frontier of the serial scan of one volume. scan_volume_tree shares its stack with
+    the checkpoint and reports the directory whose files it is adding together with the
+    name of the last file handled; files are handled in name order, so that name is a cursor.
+    save() is meant to run from IndexWriter.on_commit: the frontier is then committed
+    together with the rows it describes. Resuming from an older frontier is safe, only
+    slower: directories indexed since are skipped, files already stored are ignored.
+    """
+    db_conn: sqlite3.Connection
+    volume_id: int
+    interval: float
+    stack: list[tuple]
+    current: Optional[tuple[str, Optional[int]]]
+    cursor: Optional[str]
+
+    def __init__(self, db_conn: sqlite3.Connection, volume_id: int,
+                 interval: float = DEFAULT_CHECKPOINT_INTERVAL) -> None:
+        self.db_conn = db_conn
+        self.volume_id = volume_id
+        self.interval = interval
+        self.stack = []
+        self.current = None
+        self.cursor = None
+        self._last_save = time.monotonic()
+
+    def load(self, root_path: str) -> Optional[list[tuple]]:
+        """
+        Returns the stack items of scan_volume_tree saved for the volume, or None if there
+        is no checkpoint. Items referring to directories deleted since (e.g. by a rescan)
+        are dropped.
+        """
+        frontier = load_scan_checkpoint(self.db_conn, self.volume_id)
+        if frontier is None:
+            return None
+        state = json.loads(frontier)
+        if state.get("version") != FRONTIER_VERSION:
+            return None
+
+        stack = []
+        for item in state["stack"]:
+            if item[0] == "done":
+                if self._directory_exists(item[1]):
+                    stack.append(("done", item[1]))
+            else:
+                _, path, parent_id, start_after = item
+                if parent_id is None or self._directory_exists(parent_id):
+                    stack.append(("visit", to_native_path(root_path, path), path, None, parent_id, start_after))
+        return stack
+
+    def set_current(self, path: str, parent_id: Optional[int]):
+        self.current = (path, parent_id)
+        self.cursor = None
+
+    def on_commit(self):
+        if time.monotonic() - self._last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        """Writes the frontier; the caller commits."""
+        items = []
+        for item in self.stack:
+            if item[0] == "done":
+                items.append(["done", item[1]])
+            else:
+                items.append(["visit", item[2], item[4], item[5] if len(item) > 5 else None])
+        if self.current is not None:
+            # popped from the stack while its files are added; resumed after the cursor
+            items.append(["visit", self.current[0], self.current[1], self.cursor])
+        save_scan_checkpoint(self.db_conn, self.volume_id,
+                             json.dumps({"version": FRONTIER_VERSION, "stack": items}, separators=(",", ":")))
+        self._last_save = time.monotonic()
+
+    def _directory_exists(self, dir_id: int) -> bool:
+        return self.db_conn.execute("SELECT 1 FROM directories WHERE id = ?", (dir_id,)).fetchone() is not None
+
+    pass
\ No newline at end of file
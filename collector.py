@@ -1,190 +1,514 @@
-"""
-Индексирует файлы на разделах жесткого диска
-и собирает БД index.db для дальнейшего анализа.
-"""
-
-import os
-import sqlite3
-import time
-import signal
-from typing import List
-from get_volumes import get_volumes, VolumeInfo
-from utils import format_bytes
-from ignored import ignored_files, ignored_folders
-from console import clear, write, write_line
-from database import (ensure_directory_exists, 
-    ensure_volume_exists, get_volume_drive_name, 
-    init_db_schema, insert_file_record, is_directory_fully_indexed, 
-    mark_directory_as_indexed)
-
-
-stop_event: bool
-is_empty_line: bool
-
-def signal_handler(signum, frame):
-    global stop_event
-    write_line("Stop signal received. Stopping gracefully...")
-    stop_event = True
-
-def should_stop():
-    global stop_event
-    return stop_event
-
-def stop_requested():
-    global stop_event
-    stop_event = True
-
-def scan_single_volume_recursive(db_conn: sqlite3.Connection, volume_id: int, current_path: str, root_drive_path: str, progress_counter, current_volume_letter):
-    global is_empty_line
-    path = os.path.relpath(current_path, root_drive_path).replace("/", "\\")
-    if path == ".":
-        path = ""
-
-    if path.upper() in [folder.upper() for folder in ignored_folders]:
-        write_line(f"Found ignored folder: {path}")
-        return
-
-    dir_already_indexed = is_directory_fully_indexed(db_conn, volume_id, path)
-    if not dir_already_indexed:
-        try:
-            items = os.listdir(current_path)
-        except PermissionError:
-            write_line(f"Permission denied: {current_path}")
-            return
-
-        files_in_dir = [item for item in items if os.path.isfile(os.path.join(current_path, item))]
-        subdirs_in_dir = [item for item in items if os.path.isdir(os.path.join(current_path, item))]
-
-        dir_stat = os.stat(current_path)
-        dir_id = ensure_directory_exists(db_conn, volume_id, path, dir_stat, indexed_at=None)
-
-        for file_name in files_in_dir:
-            file_path = os.path.join(current_path, file_name)
-            
-            _, file_path_wo_drive = os.path.splitdrive(file_path)
-            file_path_wo_drive = file_path_wo_drive.lstrip(os.sep)
-            
-            if file_path_wo_drive.upper() in [file.upper() for file in ignored_files]:
-                write_line(f"Found ignored file: {file_path_wo_drive}")
-                break
-
-            try:
-                file_stat = os.stat(file_path)
-                insert_file_record(db_conn, dir_id, file_name, file_stat)
-                
-                progress_counter['processed_files'] += 1
-                progress_counter['processed_size'] += file_stat.st_size
-                size_str = format_bytes(progress_counter['processed_size'])
-                write(f"\rIndexed {progress_counter['processed_files']} files, {size_str}")
-
-                if should_stop():
-                    return
-            except (OSError, PermissionError) as e:
-                write_line(f"Error accessing file {file_path}: {e}")
-
-        for subdir_name in subdirs_in_dir:
-            subdir_abs_path = os.path.join(current_path, subdir_name)
-            scan_single_volume_recursive(db_conn, volume_id, subdir_abs_path, root_drive_path, progress_counter, current_volume_letter)
-            if should_stop():
-                return
-
-        mark_directory_as_indexed(db_conn, dir_id, time.time())
-    
-    pass
-
-def scan_single_volume(db_conn: sqlite3.Connection, volume_info: VolumeInfo, progress_counter, 
-                       drive_name: str|None):
-    volume_id = ensure_volume_exists(db_conn, volume_info, drive_name)
-    root_path = volume_info.letter + ":\\"
-    scan_single_volume_recursive(db_conn, volume_id, root_path, 
-                                 root_drive_path=root_path, 
-                                 progress_counter=progress_counter, 
-                                 current_volume_letter=volume_info.letter)
-
-def scan_and_index_volumes(db_path: str, target_letters: List[str], drive_name: str|None):
-    """Main function to scan and index specified volumes."""
-    global stop_event
-    stop_event = False
-
-    db_conn = sqlite3.connect(db_path)
-
-    volumes = get_volumes()
-    target_volumes = [v for v in volumes if v.letter in target_letters]
-
-    if not target_volumes:
-        write_line("No matching volumes found for the provided drive letters")
-        return
-
-    progress_counter = {'processed_files': 0, 'processed_size': 0, 'processed_dirs': 0}
-
-    signal.signal(signal.SIGINT, signal_handler)
-
-    for vol_info in target_volumes:
-        write_line(f"Scanning volume {vol_info.letter} ({vol_info.label})")
-        scan_single_volume(db_conn, vol_info, progress_counter, drive_name)
-        if should_stop():
-            break
-
-    db_conn.commit()
-    db_conn.close()
-    
-    if stop_event:
-        write_line("Scanning stopped by user request")
-    else:
-        write_line("Scanning completed successfully")
-
-
-if __name__ == "__main__":
-    DB_PATH = "index.db"
-    stop_event = False
-    is_empty_line = True
-    init_db_schema(DB_PATH)
-    
-    clear()
-    write_line("-== FILES SCANER ==-")
-    write_line("Available volumes:")
-    available_volumes = get_volumes()
-    if not available_volumes:
-        write_line("No volumes are available")
-        raise KeyboardInterrupt()
-
-    for index, volume in enumerate(available_volumes):
-        write_line(f"  {volume.letter} - {volume.label} ({volume.filesystem})")
-
-    try:
-        input_letters_str = input(f"Enter volume letters to index ({", ".join(volume.letter for volume in available_volumes)}): ")
-        if not input_letters_str:
-            write_line("Nothing is selected")
-            raise KeyboardInterrupt()
-
-        input_letters_str = input_letters_str.upper()
-
-        letters = []
-        drive_names = []
-        letters_without_drive_name = []
-        for letter in input_letters_str.split():
-            volumes = list(filter(lambda vol: vol.letter == letter, available_volumes))
-            if len(volumes) != 1:
-                write_line(f"Letter `{letter}` is unknown")
-                raise KeyboardInterrupt()
-            volume = volumes[0]
-
-            drive_name = get_volume_drive_name(DB_PATH, volume.volume_guid)
-            if drive_name:
-                drive_names.append(drive_name)
-            else:
-                letters_without_drive_name.append(volume.letter)
-            
-            letters.append(volume.letter)
-
-            pass
-
-        input_drive_name = None
-        if len(drive_names) != 1:
-            input_drive_name = input(f"Enter a drive name to identify volumes ({", ".join(letters_without_drive_name)}): ")
-        else:
-            input_drive_name = drive_names[0]
-
-        scan_and_index_volumes(DB_PATH, letters, input_drive_name)
-    except KeyboardInterrupt:
+"""
+Индексирует файлы на разделах жесткого диска
+и собирает БД index.db для дальнейшего анализа.
+"""
+
+import argparse
+import os
+import shlex
+import time
+import signal
+import threading
+from typing import List
+from get_volumes import DirectoryVolumeProvider, get_volumes, VolumeInfo, VolumeProvider
+from ignored import IgnoreRules, default_ignore_rules, load_ignore_rules
+from console import ask, clear, set_messages_to_stderr, write_line
+from walker import get_volume_device, join_relative_path, list_directory
+from index_writer import IndexWriter
+from pipeline import DEFAULT_WORKERS, ScanPipeline
+from progress import TOTAL_SOURCE_FILESYSTEM, ScanProgress, get_used_bytes
+from directory_cache import DirectoryCache
+from checkpoint import DEFAULT_CHECKPOINT_INTERVAL, ScanCheckpoint
+import instrumentation
+from database import (catch_up_search_index, connect, defer_search_index, delete_scan_checkpoint,
+    ensure_volume_exists, get_volume_drive_name, init_db_schema, same_timestamp)
+from shards import get_shard_path
+
+
+SCAN_MODE_SERIAL = "serial"
+SCAN_MODE_PIPELINE = "pipeline"
+SCAN_MODE_INCREMENTAL = "incremental"
+SCAN_MODES = [SCAN_MODE_SERIAL, SCAN_MODE_PIPELINE, SCAN_MODE_INCREMENTAL]
+
+stop_event: bool
+is_empty_line: bool
+
+def signal_handler(signum, frame):
+    global stop_event
+    write_line("Stop signal received. Stopping gracefully...")
+    stop_event = True
+
+def should_stop():
+    global stop_event
+    return stop_event
+
+def stop_requested():
+    global stop_event
+    stop_event = True
+
+def scan_volume_tree(writer: IndexWriter, volume_id: int, root_path: str, progress: ScanProgress,
+                     ignore_rules: IgnoreRules, checkpoint_interval: float|None = None):
+    """
+    Walks the directory tree under root_path iteratively using an explicit stack.
+    A directory is marked as indexed only after its whole subtree has been indexed,
+    so already indexed directories are skipped together with their subtrees.
+    Ignored folders are pruned before they are listed, and so are the file systems mounted
+    below root_path. Files are added in name order.
+    With checkpoint_interval the frontier (the stack and the last file added in the
+    current directory) is saved with the commits at most that often and when the scan
+    is stopped; the next scan of the volume continues from it.
+    """
+    directories = DirectoryCache(writer.db_conn, volume_id)
+
+    # ("visit", abs_path, rel_path, stat_result, parent_id[, start_after]) or ("done", dir_id)
+    stack: list[tuple] = [("visit", root_path, "", None, None)]
+    checkpoint = None
+    if checkpoint_interval is not None:
+        checkpoint = ScanCheckpoint(writer.db_conn, volume_id, checkpoint_interval)
+        resumed = checkpoint.load(root_path)
+        if resumed is not None:
+            write_line(f"Resuming from a checkpoint: {len(resumed)} directories pending")
+            stack = resumed
+        checkpoint.stack = stack
+        writer.on_commit = checkpoint.on_commit
+    try:
+        completed = scan_volume_stack(writer, stack, directories, volume_id, progress, ignore_rules, checkpoint,
+                                      get_volume_device(root_path))
+    finally:
+        # detached before the final commit, which would save the emptied frontier again
+        writer.on_commit = None
+    if completed:
+        delete_scan_checkpoint(writer.db_conn, volume_id)
+    elif checkpoint is not None:
+        checkpoint.save()
+    writer.commit()
+
+def scan_volume_stack(writer: IndexWriter, stack: list[tuple], directories: DirectoryCache, volume_id: int,
+                      progress: ScanProgress, ignore_rules: IgnoreRules, checkpoint: ScanCheckpoint|None,
+                      device: int|None = None) -> bool:
+    """
+    The loop of scan_volume_tree. device is the st_dev of the volume root: subdirectories
+    on other devices are not entered. Returns False if the scan was stopped.
+    """
+    while stack:
+        item = stack.pop()
+        if item[0] == "done":
+            writer.mark_directory_as_indexed(item[1], time.time())
+            continue
+
+        _, current_path, path, dir_stat, parent_id = item[:5]
+        start_after = item[5] if len(item) > 5 else None
+
+        with instrumentation.phase("directory_lookup"):
+            known = directories.get(writer.db_conn, path)
+        if known is not None and known[2]:
+            continue
+
+        try:
+            with instrumentation.phase("list_directory"):
+                listing = list_directory(current_path, start_after=start_after if known else None, device=device)
+            if dir_stat is None:
+                dir_stat = os.stat(current_path)
+        except PermissionError:
+            write_line(f"Permission denied: {current_path}")
+            continue
+        except OSError as e:
+            write_line(f"Error accessing directory {current_path}: {e}")
+            continue
+
+        dir_id = writer.ensure_directory(volume_id, parent_id, path, dir_stat, known[0] if known else None)
+        progress.add_dir()
+        if checkpoint is not None:
+            checkpoint.set_current(path, parent_id)
+
+        for entry_path, e in listing.errors:
+            write_line(f"Error accessing file {entry_path}: {e}")
+
+        listing.files.sort(key=lambda entry: entry[0])
+        for file_name, file_stat in listing.files:
+            file_path = join_relative_path(path, file_name)
+            if ignore_rules.is_ignored_file(file_path, file_name):
+                write_line(f"Found ignored file: {file_path}")
+            else:
+                writer.add_file(dir_id, file_name, file_stat)
+                progress.add_file(file_stat.st_size)
+            if checkpoint is not None:
+                checkpoint.cursor = file_name
+
+            if should_stop():
+                writer.flush()
+                return False
+
+        writer.flush()
+        stack.append(("done", dir_id))
+        for subdir_name, subdir_stat in reversed(listing.subdirs):
+            subdir_path = join_relative_path(path, subdir_name)
+            if ignore_rules.is_ignored_folder(subdir_path, subdir_name):
+                write_line(f"Found ignored folder: {subdir_path}")
+                continue
+            stack.append(("visit", os.path.join(current_path, subdir_name), subdir_path, subdir_stat, dir_id))
+        if checkpoint is not None:
+            checkpoint.current = None
+
+        if should_stop():
+            return False
+    return True
+
+def rescan_volume_tree(writer: IndexWriter, volume_id: int, root_path: str, progress: ScanProgress,
+                       ignore_rules: IgnoreRules) -> tuple[int, int, int]:
+    """
+    Incremental rescan of an already indexed tree. Every directory is visited, but only
+    the directories whose st_mtime differs from the stored modified_at (or which were never
+    fully indexed) have their files stat'ed and synced; for the others only the subdirectories
+    are listed. Folders that became ignored are removed from the index.
+    Returns the (added, updated, removed) file counts.
+    """
+    directories = DirectoryCache(writer.db_conn, volume_id)
+    device = get_volume_device(root_path)
+    added = updated = removed = 0
+
+    # (abs_path, rel_path, stat_result, parent_id)
+    stack: list[tuple] = [(root_path, "", None, None)]
+    while stack:
+        current_path, path, dir_stat, parent_id = stack.pop()
+
+        try:
+            if dir_stat is None:
+                dir_stat = os.stat(current_path)
+            with instrumentation.phase("directory_lookup"):
+                state = directories.get(writer.db_conn, path)
+            unchanged = state is not None and state[2] and same_timestamp(state[1], dir_stat.st_mtime_ns)
+            with instrumentation.phase("list_directory"):
+                listing = list_directory(current_path, include_files=not unchanged, device=device)
+        except PermissionError:
+            write_line(f"Permission denied: {current_path}")
+            continue
+        except OSError as e:
+            write_line(f"Error accessing directory {current_path}: {e}")
+            continue
+
+        subdirs = []
+        ignored_ids = []
+        for subdir_name, subdir_stat in listing.subdirs:
+            subdir_path = join_relative_path(path, subdir_name)
+            if ignore_rules.is_ignored_folder(subdir_path, subdir_name):
+                write_line(f"Found ignored folder: {subdir_path}")
+                # sync_directory drops it from a changed directory, an unchanged one keeps it otherwise
+                if unchanged:
+                    with instrumentation.phase("directory_lookup"):
+                        ignored = directories.get(writer.db_conn, subdir_path)
+                    if ignored is not None:
+                        ignored_ids.append(ignored[0])
+                continue
+            subdirs.append((subdir_name, subdir_path, subdir_stat))
+
+        dir_id = state[0] if state else None
+        if not unchanged:
+            for entry_path, e in listing.errors:
+                write_line(f"Error accessing file {entry_path}: {e}")
+
+            files = []
+            for file_name, file_stat in listing.files:
+                file_path = join_relative_path(path, file_name)
+                if ignore_rules.is_ignored_file(file_path, file_name):
+                    write_line(f"Found ignored file: {file_path}")
+                    continue
+                files.append((file_name, file_stat))
+                progress.add_file(file_stat.st_size)
+
+            dir_id, dir_added, dir_updated, dir_removed = writer.sync_directory(
+                volume_id, parent_id, path, dir_id, dir_stat,
+                files, [subdir_name for subdir_name, _, _ in subdirs])
+            added += dir_added
+            updated += dir_updated
+            removed += dir_removed
+        elif ignored_ids:
+            removed += writer.remove_subdirectories(dir_id, ignored_ids)
+
+        progress.add_dir()
+        for subdir_name, subdir_path, subdir_stat in reversed(subdirs):
+            stack.append((os.path.join(current_path, subdir_name), subdir_path, subdir_stat, dir_id))
+
+        if should_stop():
+            break
+
+    if not should_stop():
+        # the whole tree is in sync now, a frontier of an interrupted full scan is obsolete
+        delete_scan_checkpoint(writer.db_conn, volume_id)
+    return added, updated, removed
+
+def scan_single_volume(writer: IndexWriter, volume_info: VolumeInfo, progress: ScanProgress, 
+                       drive_name: str|None, incremental: bool = False,
+                       ignore_rules: IgnoreRules|None = None, checkpoint_interval: float|None = None):
+    volume_id = ensure_volume_exists(writer.db_conn, volume_info, drive_name)
+    if ignore_rules is None:
+        ignore_rules = default_ignore_rules()
+    if incremental:
+        added, updated, removed = rescan_volume_tree(writer, volume_id, volume_info.root_path,
+                                                     progress, ignore_rules)
+        write_line(f"Files added: {added}, updated: {updated}, removed: {removed}")
+    else:
+        scan_volume_tree(writer, volume_id, volume_info.root_path, progress, ignore_rules, checkpoint_interval)
+
+def scan_volume_shard(shard_path: str, volume_info: VolumeInfo, progress: ScanProgress, drive_name: str|None,
+                      mode: str, workers: int, ignore_rules: IgnoreRules, checkpoint_interval: float|None = None):
+    """Scans a single volume into its own database with the given mode."""
+    init_db_schema(shard_path)
+    db_conn = connect(shard_path)
+    writer = IndexWriter(db_conn)
+    try:
+        if mode != SCAN_MODE_INCREMENTAL:
+            defer_search_index(db_conn)
+        if mode == SCAN_MODE_PIPELINE:
+            volume_id = ensure_volume_exists(db_conn, volume_info, drive_name)
+            writer.close()
+            ScanPipeline(shard_path, progress, should_stop, workers, ignore_rules).run([(volume_id, volume_info.root_path)])
+        else:
+            scan_single_volume(writer, volume_info, progress, drive_name,
+                               incremental=mode == SCAN_MODE_INCREMENTAL, ignore_rules=ignore_rules,
+                               checkpoint_interval=checkpoint_interval)
+            writer.close()
+        catch_up_search_index(db_conn)
+    finally:
+        db_conn.close()
+
+def scan_volume_shards(shard_dir: str, target_volumes: list[VolumeInfo], progress: ScanProgress,
+                       drive_name: str|None, mode: str, workers: int, ignore_rules: IgnoreRules,
+                       checkpoint_interval: float|None = None):
+    """
+    Scans every volume into its own shard database in shard_dir, one thread per volume.
+    The shards have no writer to share, so the volumes don't wait for each other.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    errors: list[BaseException] = []
+
+    def run(shard_path: str, vol_info: VolumeInfo):
+        try:
+            scan_volume_shard(shard_path, vol_info, progress, drive_name, mode, workers, ignore_rules,
+                              checkpoint_interval)
+        except BaseException as e:
+            errors.append(e)
+            stop_requested()
+
+    threads = []
+    for vol_info in target_volumes:
+        shard_path = get_shard_path(shard_dir, vol_info)
+        write_line(f"Scanning volume {vol_info.letter} ({vol_info.label}) into {shard_path}")
+        threads.append(threading.Thread(target=run, args=(shard_path, vol_info), name=f"scan-shard-{vol_info.letter}"))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+def split_volume_selection(text: str) -> list[str]:
+    """
+    The volume letters entered at the prompt, separated by whitespace or commas.
+    A mount point containing either is entered in quotes, e.g. "/media/My Disk".
+    Raises ValueError on an unclosed quote.
+    """
+    lexer = shlex.shlex(text, posix=True)
+    lexer.whitespace += ","
+    lexer.whitespace_split = True
+    lexer.escape = ""
+    return list(lexer)
+
+def find_volume_by_letter(letter: str, volumes: list[VolumeInfo]) -> VolumeInfo|None:
+    """Drive letters match in any case; POSIX mount points are paths and match exactly."""
+    if os.name == "nt":
+        matches = [volume for volume in volumes if volume.letter.upper() == letter.upper()]
+    else:
+        matches = [volume for volume in volumes if volume.letter == letter]
+    return matches[0] if len(matches) == 1 else None
+
+def scan_and_index_volumes(db_path: str, target_letters: List[str], drive_name: str|None,
+                           mode: str = SCAN_MODE_SERIAL, workers: int = DEFAULT_WORKERS,
+                           ignore_rules: IgnoreRules|None = None, provider: VolumeProvider|None = None,
+                           quiet: bool = False, profile_path: str|None = None, shard_dir: str|None = None,
+                           checkpoint_interval: float|None = None):
+    """
+    Main function to scan and index specified volumes.
+    mode is SCAN_MODE_SERIAL (one thread), SCAN_MODE_PIPELINE
+    (`workers` walker threads feeding a single writer thread) or SCAN_MODE_INCREMENTAL
+    (serial rescan syncing only the directories changed since the last scan).
+    With shard_dir every volume is scanned concurrently into its own database in shard_dir
+    instead of db_path; shards.py merges them into one index.
+    checkpoint_interval (serial mode only) saves the traversal frontier of every volume
+    at most that many seconds apart and on stop; the next scan continues from it.
+    ignore_rules defaults to the built-in lists from ignored.py,
+    provider to the volume provider of the current platform.
+    quiet prints the progress as JSON lines instead of redrawing a console line
+    (collector.py --quiet also sends its other messages to stderr then).
+    The ETA of a full scan is estimated from the used space of the volumes; directories
+    scanned with --root are not mount points and have no ETA.
+    With instrumentation enabled the per-volume phase timings are printed at the end;
+    profile_path dumps cProfile stats of the calling thread (the walkers of the pipeline
+    and the shard threads are not profiled).
+    """
+    global stop_event
+    stop_event = False
+
+    if mode not in SCAN_MODES:
+        raise ValueError(f"Unknown scan mode: {mode}")
+    if checkpoint_interval is not None and mode != SCAN_MODE_SERIAL:
+        raise ValueError(f"Checkpoints are supported in the {SCAN_MODE_SERIAL} mode only, not in {mode}")
+    if ignore_rules is None:
+        ignore_rules = default_ignore_rules()
+
+    volumes = get_volumes(provider)
+    target_volumes = [v for v in volumes if v.letter in target_letters]
+
+    if not target_volumes:
+        write_line("No matching volumes found for the provided drive letters")
+        return
+
+    # Unchanged directories of an incremental rescan are not counted, so its ETA would be meaningless
+    total_bytes = None if mode == SCAN_MODE_INCREMENTAL else get_used_bytes([v.root_path for v in target_volumes])
+    progress = ScanProgress("Rescanned" if mode == SCAN_MODE_INCREMENTAL else "Indexed", total_bytes, quiet,
+                            total_source=TOTAL_SOURCE_FILESYSTEM)
+
+    signal.signal(signal.SIGINT, signal_handler)
+
+    if shard_dir is not None:
+        # volumes are scanned concurrently, so the timings can't be split by volume
+        instrumentation.set_volume(", ".join(vol_info.letter for vol_info in target_volumes))
+        with instrumentation.profile(profile_path), progress:
+            scan_volume_shards(shard_dir, target_volumes, progress, drive_name, mode, workers, ignore_rules,
+                               checkpoint_interval)
+    elif mode == SCAN_MODE_PIPELINE:
+        db_conn = connect(db_path)
+        writer = IndexWriter(db_conn)
+        defer_search_index(db_conn)
+        roots = []
+        for vol_info in target_volumes:
+            write_line(f"Scanning volume {vol_info.letter} ({vol_info.label})")
+            roots.append((ensure_volume_exists(db_conn, vol_info, drive_name), vol_info.root_path))
+        writer.close()
+        db_conn.close()
+        # volumes are scanned concurrently, so the timings can't be split by volume
+        instrumentation.set_volume(", ".join(vol_info.letter for vol_info in target_volumes))
+        with instrumentation.profile(profile_path), progress:
+            ScanPipeline(db_path, progress, should_stop, workers, ignore_rules).run(roots)
+        db_conn = connect(db_path)
+        catch_up_search_index(db_conn)
+        db_conn.close()
+    else:
+        db_conn = connect(db_path)
+        writer = IndexWriter(db_conn)
+        if mode == SCAN_MODE_SERIAL:
+            # a full scan inserts most of its rows, they are indexed for search in bulk at the end
+            defer_search_index(db_conn)
+        with instrumentation.profile(profile_path), progress:
+            for vol_info in target_volumes:
+                write_line(f"Scanning volume {vol_info.letter} ({vol_info.label})")
+                instrumentation.set_volume(vol_info.letter)
+                scan_single_volume(writer, vol_info, progress, drive_name,
+                                   incremental=mode == SCAN_MODE_INCREMENTAL, ignore_rules=ignore_rules,
+                                   checkpoint_interval=checkpoint_interval)
+                if should_stop():
+                    break
+
+        writer.close()
+        # also after a rescan, in case an interrupted full scan left the index deferred
+        catch_up_search_index(db_conn)
+        db_conn.close()
+
+    if instrumentation.enabled:
+        for line in instrumentation.report():
+            write_line(line)
+    
+    if stop_event:
+        write_line("Scanning stopped by user request")
+    else:
+        write_line("Scanning completed successfully")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexes files on the selected volumes into index.db")
+    parser.add_argument("--mode", choices=SCAN_MODES, default=SCAN_MODE_SERIAL)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="walker threads in pipeline mode")
+    parser.add_argument("--ignore-config", help="file with extra [folders] and [files] ignore rules")
+    parser.add_argument("--quiet", action="store_true",
+                        help="print the progress as JSON lines to stdout and other messages to stderr")
+    parser.add_argument("--instrument", action="store_true",
+                        help="time the scan phases and print a per-volume breakdown at the end")
+    parser.add_argument("--profile", help="dump cProfile stats of the scan to this file")
+    parser.add_argument("--root", action="append",
+                        help="index this directory as a volume instead of the mounted volumes (repeatable)")
+    parser.add_argument("--shard-dir",
+                        help="scan every volume concurrently into its own database in this directory; "
+                             "merge them with shards.py")
+    parser.add_argument("--checkpoint-interval", type=float, nargs="?", const=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="save the traversal frontier every N seconds (default "
+                             f"{DEFAULT_CHECKPOINT_INTERVAL:g}) and resume an interrupted scan from it; serial mode only")
+    args = parser.parse_args()
+    if args.checkpoint_interval is not None and args.mode != SCAN_MODE_SERIAL:
+        parser.error(f"--checkpoint-interval requires --mode {SCAN_MODE_SERIAL}")
+
+    DB_PATH = "index.db"
+    stop_event = False
+    is_empty_line = True
+    init_db_schema(DB_PATH)
+    if args.instrument:
+        instrumentation.enable()
+    provider = DirectoryVolumeProvider(args.root) if args.root else None
+    ignore_rules = load_ignore_rules(args.ignore_config) if args.ignore_config else default_ignore_rules()
+    
+    if args.quiet:
+        set_messages_to_stderr(True)
+    else:
+        clear()
+    write_line("-== FILES SCANER ==-")
+    write_line("Available volumes:")
+    available_volumes = get_volumes(provider)
+    if not available_volumes:
+        write_line("No volumes are available")
+        raise KeyboardInterrupt()
+
+    for index, volume in enumerate(available_volumes):
+        write_line(f"  {volume.letter} - {volume.label} ({volume.filesystem})")
+
+    try:
+        input_letters_str = ask(f"Enter volume letters to index ({", ".join(volume.letter for volume in available_volumes)}): ")
+        if not input_letters_str:
+            write_line("Nothing is selected")
+            raise KeyboardInterrupt()
+
+        try:
+            input_letters = split_volume_selection(input_letters_str)
+        except ValueError as e:
+            write_line(f"Cannot read the volume letters: {e}")
+            raise KeyboardInterrupt()
+
+        letters = []
+        drive_names = []
+        letters_without_drive_name = []
+        for letter in input_letters:
+            volume = find_volume_by_letter(letter, available_volumes)
+            if volume is None:
+                write_line(f"Letter `{letter}` is unknown")
+                raise KeyboardInterrupt()
+
+            drive_name = get_volume_drive_name(DB_PATH, volume.volume_guid)
+            if drive_name:
+                drive_names.append(drive_name)
+            else:
+                letters_without_drive_name.append(volume.letter)
+            
+            letters.append(volume.letter)
+
+            pass
+
+        input_drive_name = None
+        if len(drive_names) != 1:
+            input_drive_name = ask(f"Enter a drive name to identify volumes ({", ".join(letters_without_drive_name)}): ")
+        else:
+            input_drive_name = drive_names[0]
+
+        scan_and_index_volumes(DB_PATH, letters, input_drive_name, args.mode, args.workers,
+                               ignore_rules, provider, args.quiet, args.profile, args.shard_dir,
+                               args.checkpoint_interval)
+    except KeyboardInterrupt:
         write_line("Canceled by user")
\ No newline at end of file
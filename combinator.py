@@ -1,154 +1,629 @@
-# combinator.py
-
-import sqlite3
-import logging
-from pathlib import PurePosixPath
-
-DB_PATH = "index.db"
-LOG_PATH = "combinator.log"
-TOP_N = 100
-
-
-def normalize_path(path: str) -> str:
-    """Converts Windows-style path to universal POSIX-style."""
-    return path.replace("\\", "/").rstrip("/")
-
-
-def get_file_extension(name: str) -> str:
-    """Returns file extension including the dot, or empty string if none."""
-    base = PurePosixPath(name)
-    return base.suffix if base.suffix else ""
-
-
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-
-    # 0. Очистка output_files
-    conn.execute("DELETE FROM output_files")
-
-    # Подготовка SQL-запроса для группировки и сортировки
-    query = """
-    WITH grouped AS (
-        SELECT
-            f.id AS file_id,
-            d.path AS dir_path,
-            f.name AS file_name,
-            f.size,
-            f.created_at,
-            f.modified_at,
-            LOWER(d.path) AS norm_dir,
-            LOWER(f.name) AS norm_name
-        FROM files f
-        JOIN directories d ON f.directory_id = d.id
-    ),
-    ranked AS (
-        SELECT
-            file_id,
-            dir_path,
-            file_name,
-            size,
-            norm_dir,
-            norm_name,
-            ROW_NUMBER() OVER (
-                PARTITION BY norm_dir, norm_name
-                ORDER BY
-                    CASE WHEN modified_at IS NULL THEN 1 ELSE 0 END,
-                    modified_at DESC,
-                    CASE WHEN created_at IS NULL THEN 1 ELSE 0 END,
-                    created_at DESC,
-                    CASE WHEN size IS NULL THEN 1 ELSE 0 END,
-                    size DESC
-            ) AS rn,
-            COUNT(*) OVER (PARTITION BY norm_dir, norm_name) AS group_size
-        FROM grouped
-    )
-    SELECT
-        file_id,
-        dir_path,
-        file_name,
-        size,
-        group_size,
-        rn
-    FROM ranked
-    ORDER BY norm_dir, norm_name, rn;
-    """
-
-    total_size = 0
-    duplicate_file_count = 0
-    group_stats = {}  # (dir, name) -> count
-
-    cur = conn.cursor()
-    cur.execute(query)
-    rows = cur.fetchall()
-
-    # Сначала пройдёмся, чтобы собрать статистику
-    groups = {}
-    for row in rows:
-        key = (normalize_path(row["dir_path"]), row["file_name"].lower())
-        if key not in groups:
-            groups[key] = []
-        groups[key].append(row)
-
-    # Собираем дубли и общий объём
-    insert_batch = []
-    for key, group in groups.items():
-        group_size = len(group)
-        if group_size >= 2:
-            duplicate_file_count += group_size
-            group_stats[key] = group_size
-
-        dir_path, file_name = key
-        base_path = f"{dir_path}/{file_name}".lstrip("/")
-        ext = get_file_extension(file_name)
-
-        for idx, row in enumerate(group):
-            total_size += row["size"] if row["size"] else 0
-            if row["rn"] == 1:
-                out_path = base_path
-            else:
-                conflict_dir = base_path
-                out_path = f"{conflict_dir}/{idx}{ext}"
-            insert_batch.append((row["file_id"], out_path))
-
-    # 1. Вставка в output_files
-    conn.executemany(
-        "INSERT INTO output_files (file_id, out_path) VALUES (?, ?)",
-        insert_batch
-    )
-
-    # 2. Общий объём
-    from utils import format_bytes
-    total_human = format_bytes(total_size)
-
-    # 3. Статистика
-    sorted_groups = sorted(group_stats.items(), key=lambda x: x[1], reverse=True)
-    top_groups = sorted_groups[:TOP_N]
-
-    # Настройка логгера
-    logging.basicConfig(
-        filename=LOG_PATH,
-        filemode='w',
-        level=logging.INFO,
-        format='%(message)s'
-    )
-
-    # Логируем всё
-    for (dir_path, name), cnt in sorted_groups:
-        logging.info(f"{dir_path}/{name} -> {cnt} copies")
-
-    # Вывод в консоль
-    print(f"Total output size: {total_human}")
-    print(f"Files with duplicates: {duplicate_file_count}")
-    print(f"Top {TOP_N} duplicated paths:")
-    for (dir_path, name), cnt in top_groups:
-        print(f"  {dir_path}/{name}: {cnt}")
-
-    conn.commit()
-    conn.close()
-    print(f"\nLog written to {LOG_PATH}")
-
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+# combinator.py
+
+import argparse
+import hashlib
+import itertools
+import os
+import sqlite3
+import logging
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+from typing import Iterable, Optional
+from database import connect, connect_readonly
+from directory_cache import DirectoryPaths
+from utils import format_bytes
+
+DB_PATH = "index.db"
+LOG_PATH = "combinator.log"
+TOP_N = 100
+CHUNK_SIZE = 10000
+
+ENGINE_MEMORY = "memory"
+ENGINE_STREAMING = "streaming"
+ENGINE_SQL = "sql"
+ENGINE_PARALLEL = "parallel"
+ENGINES = [ENGINE_MEMORY, ENGINE_STREAMING, ENGINE_SQL, ENGINE_PARALLEL]
+
+PARTITIONS_PER_WORKER = 4   # smaller partitions even out the workers' load
+
+# output_files keeps the Python group key (group_dir, group_name) of every row,
+# so that an incremental combine can find the rows of a group again
+INSERT_OUTPUT = "INSERT INTO output_files (file_id, out_path, group_dir, group_name) VALUES (?, ?, ?, ?)"
+
+# Ранжирование файлов внутри групп (dir, name) без учёта регистра.
+# {source} — файлы f с путями каталогов d и, при необходимости, отбор строк.
+RANKED_QUERY_TEMPLATE = """
+    WITH grouped AS (
+        SELECT
+            f.id AS file_id,
+            d.path AS dir_path,
+            f.name AS file_name,
+            f.size,
+            f.created_at,
+            f.modified_at,
+            LOWER(d.path) AS norm_dir,
+            LOWER(f.name) AS norm_name
+        FROM {source}
+    ),
+    ranked AS (
+        SELECT
+            file_id,
+            dir_path,
+            file_name,
+            size,
+            norm_dir,
+            norm_name,
+            ROW_NUMBER() OVER w AS rn,
+            -- та же сортировка, что и у rn: оба окна считаются за один проход
+            COUNT(*) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS group_size
+        FROM grouped
+        WINDOW w AS (
+            PARTITION BY norm_dir, norm_name
+            ORDER BY
+                CASE WHEN modified_at IS NULL THEN 1 ELSE 0 END,
+                modified_at DESC,
+                CASE WHEN created_at IS NULL THEN 1 ELSE 0 END,
+                created_at DESC,
+                CASE WHEN size IS NULL THEN 1 ELSE 0 END,
+                size DESC,
+                file_id
+        )
+    )
+"""
+
+RANKED_QUERY = RANKED_QUERY_TEMPLATE.format(source="""files f
+        JOIN directory_paths d ON f.directory_id = d.id""")
+
+# Ключ группы на стороне Python: (normalize_path(dir_path), file_name.lower()).
+# PY_LOWER — это str.lower, зарегистрированная в соединении: встроенная LOWER
+# в SQLite понижает регистр только у ASCII.
+STREAMING_SELECT = """
+    SELECT
+        file_id,
+        size,
+        norm_dir,
+        norm_name,
+        rn,
+        RTRIM(REPLACE(dir_path, '\\', '/'), '/') AS group_dir,
+        PY_LOWER(file_name) AS group_name
+    FROM ranked
+    ORDER BY group_dir, group_name, norm_dir, norm_name, rn;
+"""
+
+STREAMING_QUERY = RANKED_QUERY + STREAMING_SELECT
+
+# Одна часть параллельного комбинатора: каталоги раздела с путями берутся из
+# подготовленной базы scratch. Группы (LOWER(dir), LOWER(name)) и группы Python
+# не выходят за пределы раздела, потому что раздел определяется по LOWER(dir).
+PARTITION_QUERY = RANKED_QUERY_TEMPLATE.format(source="""files f
+        JOIN scratch.partition_directories d ON f.directory_id = d.id AND d.partition = :partition"""
+) + STREAMING_SELECT
+
+# Инкрементальный пересчёт: только файлы затронутых групп. Ключ группы —
+# (LOWER(group_dir), group_name): он объединяет и группы ранжирования
+# (LOWER(dir), LOWER(name)), и группы Python (group_dir, PY_LOWER(name)).
+# CROSS JOIN: сначала немногие каталоги затронутых групп, затем их файлы по индексу.
+INCREMENTAL_QUERY = RANKED_QUERY_TEMPLATE.format(source="""temp.combine_directories d
+        CROSS JOIN files f ON f.directory_id = d.id
+        WHERE (LOWER(RTRIM(REPLACE(d.path, '\\', '/'), '/')), PY_LOWER(f.name)) IN
+            (SELECT key_dir, key_name FROM temp.combine_groups)"""
+) + STREAMING_SELECT
+
+DUPLICATE_GROUPS_COLUMNS = """
+    dir_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    copies INTEGER NOT NULL,
+    norm_dir TEXT NOT NULL,
+    norm_name TEXT NOT NULL,
+    first_rn INTEGER NOT NULL
+"""
+
+# Первое появление группы в исходном порядке (norm_dir, norm_name, rn) —
+# тот же порядок равных групп, что даёт устойчивая сортировка dict в памяти
+SORTED_GROUPS_QUERY = """
+    SELECT dir_path, name, copies FROM temp.duplicate_groups
+    ORDER BY copies DESC, norm_dir, norm_name, first_rn
+"""
+
+# Тот же расчёт путей целиком в SQLite: idx — номер строки внутри группы Python,
+# расширение — аналог PurePosixPath.suffix: RTRIM(name, <все символы кроме точки>)
+# оставляет имя до последней точки включительно.
+KEYED_QUERY = RANKED_QUERY + """,
+    keyed AS (
+        SELECT
+            file_id,
+            norm_dir,
+            norm_name,
+            rn,
+            RTRIM(REPLACE(dir_path, '\\', '/'), '/') AS group_dir,
+            PY_LOWER(file_name) AS group_name
+        FROM ranked
+    ),
+    numbered AS (
+        SELECT
+            file_id,
+            norm_dir,
+            norm_name,
+            rn,
+            group_dir,
+            group_name,
+            ROW_NUMBER() OVER g - 1 AS idx,
+            COUNT(*) OVER (g ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS copies,
+            RTRIM(group_name, REPLACE(group_name, '.', '')) AS name_to_dot
+        FROM keyed
+        WINDOW g AS (PARTITION BY group_dir, group_name ORDER BY norm_dir, norm_name, rn)
+    )
+"""
+
+SQL_INSERT_QUERY = KEYED_QUERY + """
+    INSERT INTO output_files (file_id, out_path, group_dir, group_name)
+    SELECT
+        file_id,
+        CASE WHEN rn = 1 THEN LTRIM(group_dir || '/' || group_name, '/')
+        ELSE LTRIM(group_dir || '/' || group_name, '/') || '/' || idx ||
+            CASE WHEN LENGTH(name_to_dot) > 1 AND LENGTH(name_to_dot) < LENGTH(group_name)
+                THEN SUBSTR(group_name, LENGTH(name_to_dot)) ELSE '' END
+        END,
+        group_dir,
+        group_name
+    FROM numbered;
+"""
+
+SQL_GROUPS_QUERY = KEYED_QUERY + """
+    SELECT group_dir, group_name, copies
+    FROM numbered
+    WHERE idx = 0 AND copies >= 2
+    ORDER BY copies DESC, norm_dir, norm_name, rn;
+"""
+
+
+def normalize_path(path: str) -> str:
+    """Converts Windows-style path to universal POSIX-style."""
+    return path.replace("\\", "/").rstrip("/")
+
+
+def get_file_extension(name: str) -> str:
+    """Returns file extension including the dot, or empty string if none."""
+    base = PurePosixPath(name)
+    return base.suffix if base.suffix else ""
+
+
+def combine_in_memory(conn: sqlite3.Connection) -> tuple[int, int, list]:
+    """
+    Fetches the whole ranked index and groups it in a dict.
+    Returns (total_size, duplicate_file_count, duplicate groups sorted by copies).
+    """
+    total_size = 0
+    duplicate_file_count = 0
+    group_stats = {}  # (dir, name) -> count
+
+    cur = conn.cursor()
+    cur.execute(RANKED_QUERY + """
+    SELECT
+        file_id,
+        dir_path,
+        file_name,
+        size,
+        group_size,
+        rn
+    FROM ranked
+    ORDER BY norm_dir, norm_name, rn;
+    """)
+    rows = cur.fetchall()
+
+    # Сначала пройдёмся, чтобы собрать статистику
+    groups = {}
+    for row in rows:
+        key = (normalize_path(row["dir_path"]), row["file_name"].lower())
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(row)
+
+    # Собираем дубли и общий объём
+    insert_batch = []
+    for key, group in groups.items():
+        group_size = len(group)
+        if group_size >= 2:
+            duplicate_file_count += group_size
+            group_stats[key] = group_size
+
+        dir_path, file_name = key
+        base_path = f"{dir_path}/{file_name}".lstrip("/")
+        ext = get_file_extension(file_name)
+
+        for idx, row in enumerate(group):
+            total_size += row["size"] if row["size"] else 0
+            if row["rn"] == 1:
+                out_path = base_path
+            else:
+                conflict_dir = base_path
+                out_path = f"{conflict_dir}/{idx}{ext}"
+            insert_batch.append((row["file_id"], out_path, dir_path, file_name))
+
+    # Вставка в output_files
+    conn.executemany(INSERT_OUTPUT, insert_batch)
+
+    sorted_groups = sorted(group_stats.items(), key=lambda x: x[1], reverse=True)
+    return total_size, duplicate_file_count, sorted_groups
+
+
+def write_streamed_groups(rows: Iterable, output_conn: sqlite3.Connection, groups_table: str) -> tuple[int, int]:
+    """
+    Walks STREAMING_QUERY rows group by group and writes output_files and the duplicate groups
+    of output_conn in CHUNK_SIZE executemany chunks, so memory does not depend on the index size.
+    Returns (total_size, duplicate_file_count).
+    """
+    total_size = 0
+    duplicate_file_count = 0
+    insert_batch = []
+    groups_batch = []
+    insert_groups = f"INSERT INTO {groups_table} VALUES (?, ?, ?, ?, ?, ?)"
+
+    for (dir_path, file_name), group in itertools.groupby(rows, key=lambda row: (row["group_dir"], row["group_name"])):
+        base_path = f"{dir_path}/{file_name}".lstrip("/")
+        ext = get_file_extension(file_name)
+
+        group_size = 0
+        for idx, row in enumerate(group):
+            if idx == 0:
+                first_row = row
+            total_size += row["size"] if row["size"] else 0
+            if row["rn"] == 1:
+                out_path = base_path
+            else:
+                out_path = f"{base_path}/{idx}{ext}"
+            insert_batch.append((row["file_id"], out_path, dir_path, file_name))
+            group_size += 1
+
+        if group_size >= 2:
+            duplicate_file_count += group_size
+            groups_batch.append((dir_path, file_name, group_size,
+                                 first_row["norm_dir"], first_row["norm_name"], first_row["rn"]))
+
+        if len(insert_batch) >= CHUNK_SIZE:
+            output_conn.executemany(INSERT_OUTPUT, insert_batch)
+            insert_batch = []
+        if len(groups_batch) >= CHUNK_SIZE:
+            output_conn.executemany(insert_groups, groups_batch)
+            groups_batch = []
+
+    output_conn.executemany(INSERT_OUTPUT, insert_batch)
+    output_conn.executemany(insert_groups, groups_batch)
+    return total_size, duplicate_file_count
+
+
+def create_duplicate_groups_table(conn: sqlite3.Connection):
+    conn.execute("DROP TABLE IF EXISTS temp.duplicate_groups")
+    conn.execute(f"CREATE TEMP TABLE duplicate_groups ({DUPLICATE_GROUPS_COLUMNS})")
+
+
+def combine_streaming(conn: sqlite3.Connection) -> tuple[int, int, Iterable]:
+    """
+    Walks the ranked index group by group straight from the cursor and writes
+    output_files in CHUNK_SIZE executemany chunks, so memory does not depend on the index size.
+    Rows come ordered by the Python group key and then in the order of the in-memory engine,
+    so the output paths are the same. Duplicate groups are collected in a temp table
+    and returned sorted like the in-memory engine does it.
+    Returns (total_size, duplicate_file_count, duplicate groups sorted by copies).
+    """
+    conn.create_function("PY_LOWER", 1, str.lower, deterministic=True)
+    create_duplicate_groups_table(conn)
+
+    total_size, duplicate_file_count = write_streamed_groups(
+        conn.execute(STREAMING_QUERY), conn, "temp.duplicate_groups")
+
+    sorted_groups = (((row[0], row[1]), row[2]) for row in conn.execute(SORTED_GROUPS_QUERY))
+    return total_size, duplicate_file_count, sorted_groups
+
+
+def get_partition(norm_dir: str, partitions: int) -> int:
+    """Partition of a directory by its LOWER(path), so case variants of a path land together."""
+    return zlib.crc32(norm_dir.encode("utf-8")) % partitions
+
+
+def combine_partition(db_path: str, scratch_path: str, partition: int, part_path: str) -> tuple[int, int]:
+    """
+    Runs in a worker process: streams one partition from a read-only connection to the index
+    and writes its output_files and duplicate groups into the part database at part_path.
+    Returns (total_size, duplicate_file_count) of the partition.
+    """
+    conn = connect_readonly(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("PY_LOWER", 1, str.lower, deterministic=True)
+    conn.execute("ATTACH DATABASE ? AS scratch", (scratch_path,))
+
+    part_conn = sqlite3.connect(part_path)
+    part_conn.execute("PRAGMA journal_mode = OFF")
+    part_conn.execute("PRAGMA synchronous = OFF")
+    part_conn.execute("CREATE TABLE output_files (file_id INTEGER NOT NULL, out_path TEXT NOT NULL, "
+                      "group_dir TEXT NOT NULL, group_name TEXT NOT NULL)")
+    part_conn.execute(f"CREATE TABLE duplicate_groups ({DUPLICATE_GROUPS_COLUMNS})")
+    try:
+        result = write_streamed_groups(conn.execute(PARTITION_QUERY, {"partition": partition}),
+                                       part_conn, "duplicate_groups")
+        part_conn.commit()
+    finally:
+        part_conn.close()
+        conn.close()
+    return result
+
+
+def combine_parallel(conn: sqlite3.Connection, workers: Optional[int] = None) -> tuple[int, int, Iterable]:
+    """
+    The streaming engine split into partitions by crc32(LOWER(directory path)) and run
+    in a pool of `workers` processes (all cores by default). The directory paths and their
+    partitions are computed once into a scratch database; every worker opens the index read-only,
+    streams its partitions and writes the results into a part database of its own.
+    The parts are then copied into output_files and the duplicate groups, sorted like the other engines.
+    The worker connections only see committed data, so the index must not have uncommitted file rows.
+    Returns (total_size, duplicate_file_count, duplicate groups sorted by copies).
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = workers * PARTITIONS_PER_WORKER
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    create_duplicate_groups_table(conn)
+
+    total_size = 0
+    duplicate_file_count = 0
+    # next to the index: the parts hold a copy of output_files, which may not fit into a small /tmp
+    with tempfile.TemporaryDirectory(prefix="combinator-", dir=os.path.dirname(os.path.abspath(db_path))) as work_dir:
+        scratch_path = os.path.join(work_dir, "scratch.db")
+        scratch_conn = sqlite3.connect(scratch_path)
+        scratch_conn.execute("PRAGMA journal_mode = OFF")
+        scratch_conn.execute("PRAGMA synchronous = OFF")
+        scratch_conn.execute("""
+            CREATE TABLE partition_directories (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                partition INTEGER NOT NULL
+            )
+        """)
+        scratch_conn.executemany(
+            "INSERT INTO partition_directories (id, path, partition) VALUES (?, ?, ?)",
+            ((row[0], row[1], get_partition(row[2], partitions))
+             for row in conn.execute("SELECT id, path, LOWER(path) FROM directory_paths"))
+        )
+        scratch_conn.execute("CREATE INDEX idx_partition_directories ON partition_directories (partition, id)")
+        scratch_conn.commit()
+        scratch_conn.close()
+
+        part_paths = [os.path.join(work_dir, f"part-{partition}.db") for partition in range(partitions)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(combine_partition, db_path, scratch_path, partition, part_path)
+                       for partition, part_path in enumerate(part_paths)]
+            for future in futures:
+                part_total_size, part_duplicate_file_count = future.result()
+                total_size += part_total_size
+                duplicate_file_count += part_duplicate_file_count
+
+        # ATTACH is not allowed inside the open transaction of conn, so the parts are read
+        # by their own connections and streamed into executemany
+        for part_path in part_paths:
+            part_conn = sqlite3.connect(part_path)
+            conn.executemany(INSERT_OUTPUT,
+                             part_conn.execute("SELECT file_id, out_path, group_dir, group_name FROM output_files"))
+            conn.executemany("INSERT INTO temp.duplicate_groups VALUES (?, ?, ?, ?, ?, ?)",
+                             part_conn.execute("SELECT * FROM duplicate_groups"))
+            part_conn.close()
+
+    sorted_groups = (((row[0], row[1]), row[2]) for row in conn.execute(SORTED_GROUPS_QUERY))
+    return total_size, duplicate_file_count, sorted_groups
+
+
+def combine_sql(conn: sqlite3.Connection) -> tuple[int, int, list]:
+    """
+    Fills output_files with a single INSERT ... SELECT and takes the statistics from
+    aggregate queries, so no file row passes through Python. The paths match the in-memory engine.
+    Returns (total_size, duplicate_file_count, duplicate groups sorted by copies).
+    """
+    conn.create_function("PY_LOWER", 1, str.lower, deterministic=True)
+    conn.execute(SQL_INSERT_QUERY)
+
+    total_size = conn.execute(
+        "SELECT COALESCE(SUM(f.size), 0) FROM files f JOIN directories d ON f.directory_id = d.id"
+    ).fetchone()[0]
+    sorted_groups = [((row[0], row[1]), row[2]) for row in conn.execute(SQL_GROUPS_QUERY)]
+    duplicate_file_count = sum(cnt for _, cnt in sorted_groups)
+    return total_size, duplicate_file_count, sorted_groups
+
+
+COMBINE_ENGINES = {
+    ENGINE_MEMORY: combine_in_memory,
+    ENGINE_STREAMING: combine_streaming,
+    ENGINE_SQL: combine_sql,
+    ENGINE_PARALLEL: combine_parallel,
+}
+
+
+def record_combine_state(conn: sqlite3.Connection):
+    """Remembers that output_files is complete up to the current files; the change log starts over."""
+    conn.execute(
+        "INSERT OR REPLACE INTO combine_state (id, combined_at, max_file_id) "
+        "SELECT 1, ?, COALESCE(MAX(id), 0) FROM files",
+        (time.time_ns(),)
+    )
+    conn.execute("DELETE FROM combine_changes")
+
+
+def _find_group_directories(conn: sqlite3.Connection, key_dir: str) -> list[int]:
+    """Directories of every volume whose LOWER(path) in POSIX form is key_dir, matched segment by segment."""
+    dir_ids = [row[0] for row in conn.execute("SELECT id FROM directories WHERE parent_id IS NULL")]
+    for name in key_dir.split("/") if key_dir else ():
+        dir_ids = [row[0] for parent_id in dir_ids for row in conn.execute(
+            "SELECT id FROM directories WHERE parent_id = ? AND LOWER(name) = ?", (parent_id, name)
+        )]
+        if not dir_ids:
+            break
+    return dir_ids
+
+
+def combine_incremental(conn: sqlite3.Connection) -> Optional[tuple[int, int, int]]:
+    """
+    Recomputes output_files only for the groups that gained, lost or changed members since
+    the last combine; the rows of the other groups stay as they are. Changed groups are those of
+    the files added, updated or deleted since then (logged into combine_changes by triggers),
+    both under their current key and under the key stored in their output_files rows.
+    The groups are recomputed by the streaming engine, so the paths are the same as a full combine gives.
+    Returns (groups, files, duplicate_file_count) of the recomputed groups,
+    or None if there is no previous combine to start from.
+    """
+    if conn.execute("SELECT 1 FROM combine_state WHERE id = 1").fetchone() is None:
+        return None
+    conn.create_function("PY_LOWER", 1, str.lower, deterministic=True)
+    create_duplicate_groups_table(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.combine_groups")
+    conn.execute("""
+        CREATE TEMP TABLE combine_groups (
+            key_dir TEXT NOT NULL,
+            key_name TEXT NOT NULL,
+            PRIMARY KEY (key_dir, key_name)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("DROP TABLE IF EXISTS temp.combine_directories")
+    conn.execute("CREATE TEMP TABLE combine_directories (id INTEGER PRIMARY KEY, path TEXT NOT NULL)")
+
+    # groups the changed files belonged to at the last combine
+    conn.execute("""
+        INSERT OR IGNORE INTO temp.combine_groups (key_dir, key_name)
+        SELECT LOWER(group_dir), group_name FROM output_files
+        WHERE file_id IN (SELECT file_id FROM combine_changes)
+    """)
+    # and the groups they belong to now, together with the new files
+    directory_paths = DirectoryPaths(conn)
+    changed_files = conn.execute(
+        "SELECT directory_id, name FROM files WHERE id IN (SELECT file_id FROM combine_changes)"
+    ).fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.combine_groups (key_dir, key_name) VALUES (LOWER(?), PY_LOWER(?))",
+        ((normalize_path(dir_path), name) for dir_path, name in
+         ((directory_paths.get(row[0]), row[1]) for row in changed_files) if dir_path is not None)
+    )
+
+    for (key_dir,) in conn.execute("SELECT DISTINCT key_dir FROM temp.combine_groups").fetchall():
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp.combine_directories (id, path) VALUES (?, ?)",
+            [(dir_id, directory_paths.get(dir_id)) for dir_id in _find_group_directories(conn, key_dir)]
+        )
+
+    # one statement per group: the planner doesn't join through the expression index
+    conn.executemany("DELETE FROM output_files WHERE LOWER(group_dir) = ? AND group_name = ?",
+                     conn.execute("SELECT key_dir, key_name FROM temp.combine_groups").fetchall())
+    # counting output_files would read the whole table: count the inserted rows instead
+    changes_before = conn.total_changes
+    _, duplicate_file_count = write_streamed_groups(conn.execute(INCREMENTAL_QUERY), conn, "temp.duplicate_groups")
+    files = (conn.total_changes - changes_before
+             - conn.execute("SELECT COUNT(*) FROM temp.duplicate_groups").fetchone()[0])
+    groups = conn.execute("SELECT COUNT(*) FROM temp.combine_groups").fetchone()[0]
+
+    record_combine_state(conn)
+    return groups, files, duplicate_file_count
+
+
+def verify_engines(db_path: str = DB_PATH) -> bool:
+    """
+    Runs every engine over the same index inside a rolled back transaction
+    and checks that output_files and the statistics are byte-identical.
+    """
+    conn = connect(db_path)
+    conn.row_factory = sqlite3.Row
+    digests = {}
+    for engine, combine in COMBINE_ENGINES.items():
+        conn.execute("DELETE FROM output_files")
+        total_size, duplicate_file_count, sorted_groups = combine(conn)
+        digest = hashlib.sha256()
+        for row in conn.execute("SELECT file_id, out_path, group_dir, group_name FROM output_files ORDER BY file_id"):
+            digest.update(f"{row[0]}\t{row[1]}\t{row[2]}\t{row[3]}\n".encode("utf-8"))
+        digest.update(f"{total_size}\t{duplicate_file_count}\n".encode("utf-8"))
+        for (dir_path, name), cnt in sorted_groups:
+            digest.update(f"{dir_path}/{name}\t{cnt}\n".encode("utf-8"))
+        digests[engine] = digest.hexdigest()
+        conn.rollback()
+    conn.close()
+
+    reference = digests[ENGINE_MEMORY]
+    for engine, value in digests.items():
+        print(f"{engine}: {value} {'OK' if value == reference else 'MISMATCH'}")
+    return all(value == reference for value in digests.values())
+
+
+def main(db_path: str = DB_PATH, engine: str = ENGINE_MEMORY, workers: Optional[int] = None,
+         incremental: bool = False):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown combinator engine: {engine}")
+
+    conn = connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.row_factory = sqlite3.Row
+
+    if incremental:
+        result = combine_incremental(conn)
+        if result is not None:
+            groups, files, duplicate_file_count = result
+            conn.commit()
+            conn.close()
+            print(f"Groups recomputed: {groups}, files mapped: {files}, files with duplicates among them: "
+                  f"{duplicate_file_count}")
+            return
+        print("No previous combine found, combining everything")
+
+    # 0. Очистка output_files
+    conn.execute("DELETE FROM output_files")
+
+    # 1. Заполнение output_files
+    if engine == ENGINE_PARALLEL:
+        total_size, duplicate_file_count, sorted_groups = combine_parallel(conn, workers)
+    else:
+        total_size, duplicate_file_count, sorted_groups = COMBINE_ENGINES[engine](conn)
+
+    record_combine_state(conn)
+
+    # 2. Общий объём
+    total_human = format_bytes(total_size)
+
+    # Настройка логгера
+    logging.basicConfig(
+        filename=LOG_PATH,
+        filemode='w',
+        level=logging.INFO,
+        format='%(message)s'
+    )
+
+    # 3. Логируем всё, первые TOP_N групп запоминаем для консоли
+    top_groups = []
+    for (dir_path, name), cnt in sorted_groups:
+        logging.info(f"{dir_path}/{name} -> {cnt} copies")
+        if len(top_groups) < TOP_N:
+            top_groups.append(((dir_path, name), cnt))
+
+    # Вывод в консоль
+    print(f"Total output size: {total_human}")
+    print(f"Files with duplicates: {duplicate_file_count}")
+    print(f"Top {TOP_N} duplicated paths:")
+    for (dir_path, name), cnt in top_groups:
+        print(f"  {dir_path}/{name}: {cnt}")
+
+    conn.commit()
+    conn.close()
+    print(f"\nLog written to {LOG_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maps indexed files to output paths and reports duplicates")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_MEMORY,
+                        help="memory: fetch everything and group in a dict; "
+                             "streaming: group straight from the cursor with constant memory; "
+                             "sql: compute everything with INSERT ... SELECT inside SQLite; "
+                             "parallel: the streaming engine split by directory over a process pool")
+    parser.add_argument("--workers", type=int, help="processes of the parallel engine, all cores by default")
+    parser.add_argument("--incremental", action="store_true",
+                        help="recompute only the groups changed since the last combine")
+    parser.add_argument("--verify", action="store_true",
+                        help="run all engines without saving and check that their results are identical")
+    args = parser.parse_args()
+    if args.verify:
+        raise SystemExit(0 if verify_engines(args.db) else 1)
+    main(args.db, args.engine, args.workers, args.incremental)
\ No newline at end of file
@@ -1,29 +1,49 @@
-"""
-Утилиты консоли.
-"""
-
-import os
-
-
-is_new_line = True
-
-def write_line(message: str):
-    """
-    Writes a message in the console and starts a new line.
-    If no new line before the message, it will be added.
-    """
-    global is_new_line
-    if not is_new_line:
-        print()
-    print(message)
-    is_new_line = True
-
-def write(message):
-    """Writes a message in the console without a new line before and after."""
-    global is_new_line
-    print(message, end="", flush=True)
-    is_new_line = False
-
-def clear():
-    """Clears the console."""
+"""
+Утилиты консоли.
+"""
+
+import os
+import sys
+
+
+is_new_line = True
+messages_to_stderr = False
+
+def set_messages_to_stderr(enabled: bool):
+    """
+    Sends the messages of write_line and ask to stderr, e.g. while stdout carries
+    the JSON lines of a quiet progress for a log collector.
+    """
+    global messages_to_stderr
+    messages_to_stderr = enabled
+
+def write_line(message: str):
+    """
+    Writes a message in the console and starts a new line.
+    If no new line before the message, it will be added.
+    """
+    global is_new_line
+    if messages_to_stderr:
+        print(message, file=sys.stderr, flush=True)
+        return
+    if not is_new_line:
+        print()
+    print(message)
+    is_new_line = True
+
+def write(message):
+    """Writes a message in the console without a new line before and after."""
+    global is_new_line
+    print(message, end="", flush=True)
+    is_new_line = False
+
+def ask(prompt: str) -> str:
+    """Reads a line from the user, the prompt goes where write_line writes."""
+    if messages_to_stderr:
+        print(prompt, end="", file=sys.stderr, flush=True)
+        return input()
+    return input(prompt)
+
+def clear():
+    """Clears the console."""
     os.system('cls' if os.name == 'nt' else 'clear')
\ No newline at end of file
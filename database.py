@@ -1,163 +1,982 @@
-
-import os
-import sqlite3
-from typing import Optional
-
-from get_volumes import VolumeInfo
-from utils import to_iso
-
-
-def init_db_schema(db_path: str):
-    """
-    Creates the database file (or opens an existing one) and checks/creates/migrates its schema.
-    """
-    import pathlib
-    path = pathlib.Path(db_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS schema_version (
-            version INTEGER PRIMARY KEY,
-            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    current_version = get_current_schema_version(cursor)
-
-    if current_version < 1:
-        apply_migration_v1_to_v2(cursor)
-
-    cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (1);")
-
-    conn.commit()
-    conn.close()
-
-def get_current_schema_version(cursor) -> int:
-    try:
-        cursor.execute("SELECT version FROM schema_version ORDER BY version DESC LIMIT 1;")
-        row = cursor.fetchone()
-        return row[0] if row else 0
-    except sqlite3.OperationalError:
-        return 0
-
-def apply_migration_v1_to_v2(cursor):
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS volumes (
-            id INTEGER PRIMARY KEY,
-            volume_guid TEXT UNIQUE NOT NULL,
-            letter TEXT NOT NULL,
-            label TEXT,
-            filesystem TEXT,
-            drive_name TEXT
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS directories (
-            id INTEGER PRIMARY KEY,
-            volume_id INTEGER NOT NULL,
-            path TEXT NOT NULL,
-            created_at TIMESTAMP NOT NULL,
-            modified_at TIMESTAMP NULL,
-            indexed_at TIMESTAMP,
-            FOREIGN KEY (volume_id) REFERENCES volumes(id),
-            UNIQUE(volume_id, path)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY,
-            directory_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            size INTEGER NOT NULL,
-            created_at TIMESTAMP NOT NULL,
-            modified_at TIMESTAMP NOT NULL,
-            indexed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (directory_id) REFERENCES directories(id),
-            UNIQUE(directory_id, name)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS unique_files (
-            id INTEGER PRIMARY KEY,
-            file_id INTEGER NOT NULL,
-            copied_at TIMESTAMP,
-            hash TEXT,
-            FOREIGN KEY (file_id) REFERENCES files(id)
-        );
-    """)
-
-def get_volume_id_by_guid(db_conn, volume_guid: str) -> Optional[int]:
-    """Fetches the volume ID by its GUID."""
-    cursor = db_conn.execute("SELECT id FROM volumes WHERE volume_guid = ?", (volume_guid,))
-    row = cursor.fetchone()
-    return row[0] if row else None
-
-def get_volume_drive_name(db_path: str, volume_guid: str) -> str|None:
-    """Returns the volume drive name if assigned."""
-    db_conn = sqlite3.connect(db_path)
-    cursor = db_conn.execute(
-        "SELECT drive_name FROM volumes WHERE volume_guid = ?",
-        (volume_guid,)
-    )
-    row = cursor.fetchone()
-    
-    return row[0] if row is not None else None 
-
-def ensure_volume_exists(db_conn, volume_info: VolumeInfo, drive_name: str|None) -> int:
-    """Returns a new or existing volume record ID."""
-    cursor = db_conn.cursor()
-    volume_id = get_volume_id_by_guid(db_conn, volume_info.volume_guid)
-    if not volume_id:
-        cursor.execute(
-            "INSERT INTO volumes (volume_guid, letter, label, filesystem, drive_name) VALUES (?, ?, ?, ?, ?)",
-            (volume_info.volume_guid, volume_info.letter, volume_info.label, volume_info.filesystem, drive_name)
-        )
-        volume_id = cursor.lastrowid
-
-    return volume_id
-
-def is_directory_fully_indexed(db_conn, volume_id: int, path: str) -> bool:
-    """Checks if a directory has been fully indexed (has an indexed_at timestamp)."""
-    cursor = db_conn.execute(
-        "SELECT indexed_at FROM directories WHERE volume_id = ? AND path = ?",
-        (volume_id, path)
-    )
-    row = cursor.fetchone()
-    return row is not None and row[0] is not None
-
-def ensure_directory_exists(db_conn, volume_id: int, path: str, stat_result: os.stat_result, indexed_at: Optional[float]) -> int:
-    """
-    Inserts or updates a directory record. Returns the directory ID.
-    """
-    cursor = db_conn.cursor()
-    existing_cursor = db_conn.execute("SELECT id FROM directories WHERE volume_id = ? AND path = ?", (volume_id, path))
-    existing_row = existing_cursor.fetchone()
-    existing_id = existing_row[0] if existing_row else None
-    indexed_at_str = to_iso(indexed_at)
-
-    if not existing_id:
-        cursor.execute(
-            "INSERT INTO directories (volume_id, path, created_at, modified_at, indexed_at) VALUES (?, ?, ?, ?, ?)",
-            (volume_id, path, to_iso(stat_result.st_birthtime), to_iso(stat_result.st_mtime), indexed_at_str)
-        )
-        existing_id = cursor.lastrowid
-
-    return existing_id
-
-def mark_directory_as_indexed(db_conn, dir_id: int, timestamp: float):
-    """Marks a directory as fully indexed by setting its indexed_at timestamp."""
-    indexed_at_str = to_iso(timestamp)
-    db_conn.execute(
-        "UPDATE directories SET indexed_at = ? WHERE id = ?",
-        (indexed_at_str, dir_id)
-    )
-
-def insert_file_record(db_conn: sqlite3.Connection, dir_id: int, name: str, stat_result: os.stat_result):
-    """Inserts a file record into the database."""
-    db_conn.execute(
-        "INSERT OR IGNORE INTO files (directory_id, name, size, created_at, modified_at) VALUES (?, ?, ?, ?, ?)",
-        (dir_id, name, stat_result.st_size, to_iso(stat_result.st_birthtime), to_iso(stat_result.st_mtime))
-    )
\ No newline at end of file
+
+import os
+import sqlite3
+from typing import Optional
+from urllib.request import pathname2url
+
+import instrumentation
+from get_volumes import VolumeInfo
+from utils import get_created_time_ns, iso_to_ns, to_ns
+from walker import join_relative_path, split_relative_path
+
+
+# Connection profile applied by connect(). Every value may be overridden per connection.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",      # readers don't block the writer, commits don't rewrite the pages twice
+    "synchronous": "NORMAL",    # with WAL a crash may lose the last commits, never corrupt the file
+    "cache_size": -262144,      # negative means KiB: 256 MiB page cache
+    "mmap_size": 1073741824,    # 1 GiB memory-mapped reads
+    "temp_store": "FILE",       # sorts of the combinator can outgrow RAM, let them spill to disk
+}
+
+
+# A name as a part of a relative path built in SQL, escaped like walker.join_relative_path does
+PATH_NAME_SQL = "REPLACE({name}, '\\', '/')"
+
+# Relative path of a file in queries joining files f with directory_paths d
+FILE_PATH_SQL = (f"CASE WHEN d.path = '' THEN {PATH_NAME_SQL.format(name='f.name')} "
+                 f"ELSE d.path || '\\' || {PATH_NAME_SQL.format(name='f.name')} END")
+
+SEARCH_TRIGGERS = ["files_search_insert", "files_search_insert_pending", "files_search_delete",
+                   "files_search_update", "directories_search_insert", "directories_search_insert_pending",
+                   "directories_search_delete", "directories_search_update"]
+
+# Current time in integer nanoseconds, for the column defaults (millisecond precision)
+NOW_NS_SQL = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER) * 1000000"
+
+# Timestamps closer than this are equal: values migrated from the ISO strings
+# of schema v4 only have microsecond precision.
+TIMESTAMP_TOLERANCE_NS = 1000
+
+
+def connect(db_path: str, pragmas: Optional[dict] = None, **kwargs) -> sqlite3.Connection:
+    """
+    Opens a connection with DEFAULT_PRAGMAS applied; `pragmas` overrides or extends them,
+    a None value leaves the pragma as it is. Other keyword arguments are passed to sqlite3.connect.
+    """
+    conn = sqlite3.connect(db_path, **kwargs)
+    profile = dict(DEFAULT_PRAGMAS)
+    if pragmas:
+        profile.update(pragmas)
+    for name, value in profile.items():
+        if value is not None:
+            conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+def connect_readonly(db_path: str, pragmas: Optional[dict] = None) -> sqlite3.Connection:
+    """Opens a read-only connection; the journal mode can't be changed by it and stays as it is."""
+    uri = "file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+    return connect(uri, {"journal_mode": None, **(pragmas or {})}, uri=True)
+
+def init_db_schema(db_path: str, pragmas: Optional[dict] = None):
+    """
+    Creates the database file (or opens an existing one) and checks/creates/migrates its schema.
+    """
+    import pathlib
+    path = pathlib.Path(db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = connect(db_path, pragmas)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    current_version = get_current_schema_version(cursor)
+
+    if current_version < 1:
+        apply_migration_v1_to_v2(cursor)
+
+    cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (1);")
+
+    if current_version < 2:
+        apply_migration_v2(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (2);")
+
+    if current_version < 3:
+        apply_migration_v3(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (3);")
+
+    if current_version < 4:
+        apply_migration_v4(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (4);")
+
+    if current_version < 5:
+        apply_migration_v5(conn, cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (5);")
+
+    if current_version < 6:
+        apply_migration_v6(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (6);")
+
+    if current_version < 7:
+        apply_migration_v7(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (7);")
+
+    if current_version < 8:
+        apply_migration_v8(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (8);")
+
+    if current_version < 9:
+        apply_migration_v9(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (9);")
+
+    if current_version < 10:
+        apply_migration_v10(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (10);")
+
+    if current_version < 11:
+        apply_migration_v11(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (11);")
+
+    if current_version < 12:
+        apply_migration_v12(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (12);")
+
+    if current_version < 13:
+        apply_migration_v13(cursor)
+        cursor.execute("INSERT OR IGNORE INTO schema_version (version) VALUES (13);")
+
+    conn.commit()
+    conn.close()
+
+def get_current_schema_version(cursor) -> int:
+    try:
+        cursor.execute("SELECT version FROM schema_version ORDER BY version DESC LIMIT 1;")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except sqlite3.OperationalError:
+        return 0
+
+def apply_migration_v1_to_v2(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS volumes (
+            id INTEGER PRIMARY KEY,
+            volume_guid TEXT UNIQUE NOT NULL,
+            letter TEXT NOT NULL,
+            label TEXT,
+            filesystem TEXT,
+            drive_name TEXT
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS directories (
+            id INTEGER PRIMARY KEY,
+            volume_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            modified_at TIMESTAMP NULL,
+            indexed_at TIMESTAMP,
+            FOREIGN KEY (volume_id) REFERENCES volumes(id),
+            UNIQUE(volume_id, path)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            directory_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            modified_at TIMESTAMP NOT NULL,
+            indexed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (directory_id) REFERENCES directories(id),
+            UNIQUE(directory_id, name)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS unique_files (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL,
+            copied_at TIMESTAMP,
+            hash TEXT,
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        );
+    """)
+
+def apply_migration_v2(cursor):
+    """
+    Schema v2: the output_files table of the combinator and the indexes on the
+    case-insensitive grouping keys (LOWER(directories.path), LOWER(files.name)).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS output_files (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL,
+            out_path TEXT NOT NULL,
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_output_files_file_id ON output_files (file_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_directories_norm_path ON directories (LOWER(path));")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_norm_name ON files (directory_id, LOWER(name));")
+    cursor.execute("ANALYZE;")
+
+def apply_migration_v3(cursor):
+    """
+    Schema v3: content hashing. unique_files gets one row per hashed file and
+    the hash of the first and last blocks (partial_hash) next to the full hash.
+    """
+    cursor.execute("ALTER TABLE unique_files ADD COLUMN partial_hash TEXT;")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_unique_files_file_id ON unique_files (file_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_unique_files_partial_hash ON unique_files (partial_hash);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_unique_files_hash ON unique_files (hash);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_size ON files (size);")
+
+def apply_migration_v4(cursor):
+    """
+    Schema v4: hash cache. A hash stays valid while the file at the same volume and
+    relative path keeps its size and modified_at, even if its files row is recreated.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS hash_cache (
+            volume_guid TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            modified_at TIMESTAMP NOT NULL,
+            partial_hash TEXT,
+            hash TEXT,
+            PRIMARY KEY (volume_guid, path)
+        ) WITHOUT ROWID;
+    """)
+
+def apply_migration_v5(conn: sqlite3.Connection, cursor):
+    """
+    Schema v5: compact storage. Timestamps become INTEGER nanoseconds (st_mtime_ns),
+    a directory stores its parent_id and its own name instead of the full relative path
+    (the root of a volume has parent_id NULL and an empty name). Full paths are available
+    through the recursive directory_paths view.
+    directories and files are rebuilt with their ids preserved, so the references
+    of unique_files and output_files stay valid.
+    idx_directories_norm_path of v2 is intentionally not recreated: there is no path column
+    to index any more. The combinator gets the paths from directory_paths and sorts the groups
+    in its window query; the incremental combine finds the directories of a group segment by
+    segment through UNIQUE(parent_id, name).
+    """
+    conn.create_function("ISO_TO_NS", 1, iso_to_ns, deterministic=True)
+    conn.create_function("PATH_PARENT", 1, lambda path: path.rpartition("\\")[0], deterministic=True)
+    conn.create_function("PATH_NAME", 1, lambda path: path.rpartition("\\")[2], deterministic=True)
+
+    # Every directory except a root needs its parent row; add the missing ones as not indexed yet
+    while True:
+        cursor.execute("""
+            INSERT INTO directories (volume_id, path, created_at, modified_at, indexed_at)
+            SELECT d.volume_id, PATH_PARENT(d.path), MIN(d.created_at), NULL, NULL
+            FROM directories d
+            WHERE d.path <> '' AND NOT EXISTS (
+                SELECT 1 FROM directories p WHERE p.volume_id = d.volume_id AND p.path = PATH_PARENT(d.path)
+            )
+            GROUP BY d.volume_id, PATH_PARENT(d.path);
+        """)
+        if cursor.rowcount <= 0:
+            break
+
+    cursor.execute("""
+        CREATE TABLE directories_v5 (
+            id INTEGER PRIMARY KEY,
+            volume_id INTEGER NOT NULL,
+            parent_id INTEGER,
+            name TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            modified_at INTEGER,
+            indexed_at INTEGER,
+            FOREIGN KEY (volume_id) REFERENCES volumes(id),
+            FOREIGN KEY (parent_id) REFERENCES directories(id),
+            UNIQUE(parent_id, name)
+        );
+    """)
+    cursor.execute("""
+        INSERT INTO directories_v5 (id, volume_id, parent_id, name, created_at, modified_at, indexed_at)
+        SELECT d.id, d.volume_id, p.id, PATH_NAME(d.path),
+               ISO_TO_NS(d.created_at), ISO_TO_NS(d.modified_at), ISO_TO_NS(d.indexed_at)
+        FROM directories d
+        LEFT JOIN directories p ON d.path <> '' AND p.volume_id = d.volume_id AND p.path = PATH_PARENT(d.path);
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE files_v5 (
+            id INTEGER PRIMARY KEY,
+            directory_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            modified_at INTEGER NOT NULL,
+            indexed_at INTEGER NOT NULL DEFAULT ({NOW_NS_SQL}),
+            FOREIGN KEY (directory_id) REFERENCES directories(id),
+            UNIQUE(directory_id, name)
+        );
+    """)
+    # files.indexed_at was CURRENT_TIMESTAMP, i.e. UTC
+    cursor.execute("""
+        INSERT INTO files_v5 (id, directory_id, name, size, created_at, modified_at, indexed_at)
+        SELECT id, directory_id, name, size, ISO_TO_NS(created_at), ISO_TO_NS(modified_at),
+               CAST(strftime('%s', indexed_at) AS INTEGER) * 1000000000
+        FROM files;
+    """)
+
+    cursor.execute("DROP TABLE files;")
+    cursor.execute("DROP TABLE directories;")
+    cursor.execute("ALTER TABLE directories_v5 RENAME TO directories;")
+    cursor.execute("ALTER TABLE files_v5 RENAME TO files;")
+
+    cursor.execute("CREATE UNIQUE INDEX idx_directories_root ON directories (volume_id) WHERE parent_id IS NULL;")
+    # idx_directories_norm_path went with directories.path, see above
+    cursor.execute("CREATE INDEX idx_files_norm_name ON files (directory_id, LOWER(name));")
+    cursor.execute("CREATE INDEX idx_files_size ON files (size);")
+
+    cursor.execute("UPDATE hash_cache SET modified_at = ISO_TO_NS(modified_at) WHERE typeof(modified_at) = 'text';")
+    cursor.execute("UPDATE unique_files SET copied_at = ISO_TO_NS(copied_at) WHERE typeof(copied_at) = 'text';")
+
+    cursor.execute("""
+        CREATE VIEW directory_paths AS
+        WITH RECURSIVE paths (id, volume_id, path) AS (
+            SELECT id, volume_id, '' FROM directories WHERE parent_id IS NULL
+            UNION ALL
+            SELECT d.id, d.volume_id, CASE WHEN p.path = '' THEN d.name ELSE p.path || '\\' || d.name END
+            FROM directories d
+            JOIN paths p ON d.parent_id = p.id
+        )
+        SELECT id, volume_id, path FROM paths;
+    """)
+    cursor.execute("ANALYZE;")
+
+def apply_migration_v6(cursor):
+    """
+    Schema v6: incremental combine. output_files rows keep their group key; combine_state
+    remembers the largest file id of the last combine, and after the first combine the triggers
+    log the ids of the updated and deleted files into combine_changes.
+    """
+    cursor.execute("ALTER TABLE output_files ADD COLUMN group_dir TEXT;")
+    cursor.execute("ALTER TABLE output_files ADD COLUMN group_name TEXT;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_output_files_group ON output_files (LOWER(group_dir), group_name);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS combine_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            combined_at INTEGER NOT NULL,
+            max_file_id INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS combine_changes (
+            file_id INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_deleted_since_combine AFTER DELETE ON files
+        WHEN EXISTS (SELECT 1 FROM combine_state)
+        BEGIN
+            INSERT INTO combine_changes (file_id) VALUES (old.id);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_updated_since_combine AFTER UPDATE OF size, created_at, modified_at ON files
+        WHEN EXISTS (SELECT 1 FROM combine_state)
+        BEGIN
+            INSERT INTO combine_changes (file_id) VALUES (new.id);
+        END;
+    """)
+
+def apply_migration_v7(cursor):
+    """
+    Schema v7: name search, see create_search_index. SQLite builds without FTS5 or the
+    trigram tokenizer (older than 3.34) get no index; search.py scans the tables then.
+    """
+    try:
+        create_search_index(cursor)
+    except sqlite3.OperationalError:
+        pass
+
+def create_search_index(cursor):
+    """
+    file_names_fts is a trigram FTS5 index over files.name; it reads the names from files
+    (external content), so they are not stored twice. directory_paths_fts holds the full
+    relative path of every directory under the directory id. Triggers keep both in step
+    with the inserts and deletes of the collector; the path of a new directory is built
+    from the indexed path of its parent.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE file_names_fts USING fts5 (
+            name, content='files', content_rowid='id', tokenize='trigram'
+        );
+    """)
+    cursor.execute("CREATE VIRTUAL TABLE directory_paths_fts USING fts5 (path, tokenize='trigram');")
+    create_search_triggers(cursor)
+    cursor.execute("INSERT INTO file_names_fts (file_names_fts) VALUES ('rebuild');")
+    cursor.execute("INSERT INTO directory_paths_fts (rowid, path) SELECT id, path FROM directory_paths;")
+
+def create_search_triggers(cursor):
+    """
+    While search_index_pending has its row (see defer_search_index), the insert triggers only
+    record the ids of the new rows in search_pending_files and search_pending_directories for
+    catch_up_search_index, and the delete and update triggers skip the rows recorded there,
+    which are not in the index yet. The ids are recorded rather than compared with the largest
+    id at the deferral: SQLite gives a new row the id after the largest one left, so a row
+    inserted after the newest ones were deleted can get an id below it.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS search_index_pending (
+            id INTEGER PRIMARY KEY CHECK (id = 1)
+        );
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS search_pending_files (id INTEGER PRIMARY KEY);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS search_pending_directories (id INTEGER PRIMARY KEY);")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_search_insert AFTER INSERT ON files
+        WHEN NOT EXISTS (SELECT 1 FROM search_index_pending)
+        BEGIN
+            INSERT INTO file_names_fts (rowid, name) VALUES (new.id, new.name);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_search_insert_pending AFTER INSERT ON files
+        WHEN EXISTS (SELECT 1 FROM search_index_pending)
+        BEGIN
+            INSERT OR IGNORE INTO search_pending_files (id) VALUES (new.id);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_search_delete AFTER DELETE ON files
+        WHEN NOT EXISTS (SELECT 1 FROM search_pending_files WHERE id = old.id)
+        BEGIN
+            INSERT INTO file_names_fts (file_names_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_search_update AFTER UPDATE OF name ON files
+        WHEN NOT EXISTS (SELECT 1 FROM search_pending_files WHERE id = old.id)
+        BEGIN
+            INSERT INTO file_names_fts (file_names_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO file_names_fts (rowid, name) VALUES (new.id, new.name);
+        END;
+    """)
+    new_directory_path = """
+        CASE WHEN new.parent_id IS NULL THEN '' ELSE COALESCE(
+            (SELECT CASE WHEN path = '' THEN {name} ELSE path || '\\' || {name} END
+             FROM directory_paths_fts WHERE rowid = new.parent_id),
+            {name}) END
+    """.format(name=PATH_NAME_SQL.format(name="new.name"))
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS directories_search_insert AFTER INSERT ON directories
+        WHEN NOT EXISTS (SELECT 1 FROM search_index_pending)
+        BEGIN
+            INSERT INTO directory_paths_fts (rowid, path) VALUES (new.id, {new_directory_path});
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS directories_search_insert_pending AFTER INSERT ON directories
+        WHEN EXISTS (SELECT 1 FROM search_index_pending)
+        BEGIN
+            INSERT OR IGNORE INTO search_pending_directories (id) VALUES (new.id);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS directories_search_delete AFTER DELETE ON directories
+        BEGIN
+            DELETE FROM directory_paths_fts WHERE rowid = old.id;
+        END;
+    """)
+    # only the directory's own row: paths below a renamed directory are fixed by rebuild_search_index
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS directories_search_update AFTER UPDATE OF parent_id, name ON directories
+        WHEN NOT EXISTS (SELECT 1 FROM search_pending_directories WHERE id = old.id)
+        BEGIN
+            DELETE FROM directory_paths_fts WHERE rowid = old.id;
+            INSERT INTO directory_paths_fts (rowid, path) VALUES (new.id, {new_directory_path});
+        END;
+    """)
+
+def apply_migration_v8(cursor):
+    """
+    Schema v8: directory_rollups holds the totals of the subtree of every indexed directory:
+    bytes and files of the directory and all its descendants, and the number of descendant
+    directories. own_bytes and own_files are the directory's direct files only.
+    The rollups of the already indexed directories are computed here in one pass.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS directory_rollups (
+            directory_id INTEGER PRIMARY KEY,
+            own_bytes INTEGER NOT NULL,
+            own_files INTEGER NOT NULL,
+            total_bytes INTEGER NOT NULL,
+            file_count INTEGER NOT NULL,
+            subdir_count INTEGER NOT NULL,
+            FOREIGN KEY (directory_id) REFERENCES directories(id)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_directory_rollups_total_bytes ON directory_rollups (total_bytes);")
+    cursor.execute("""
+        CREATE TEMP TABLE own_totals AS
+        SELECT directory_id, SUM(size) AS bytes, COUNT(*) AS files FROM files GROUP BY directory_id;
+    """)
+    cursor.execute("CREATE UNIQUE INDEX temp.idx_own_totals ON own_totals (directory_id);")
+    cursor.execute("""
+        INSERT OR REPLACE INTO directory_rollups
+            (directory_id, own_bytes, own_files, total_bytes, file_count, subdir_count)
+        WITH RECURSIVE subtree (root_id, id) AS (
+            SELECT id, id FROM directories WHERE indexed_at IS NOT NULL
+            UNION ALL
+            SELECT s.root_id, d.id FROM directories d JOIN subtree s ON d.parent_id = s.id
+        )
+        SELECT s.root_id,
+               COALESCE(MAX(CASE WHEN s.id = s.root_id THEN o.bytes END), 0),
+               COALESCE(MAX(CASE WHEN s.id = s.root_id THEN o.files END), 0),
+               COALESCE(SUM(o.bytes), 0), COALESCE(SUM(o.files), 0), COUNT(*) - 1
+        FROM subtree s
+        LEFT JOIN temp.own_totals o ON o.directory_id = s.id
+        GROUP BY s.root_id;
+    """)
+    cursor.execute("DROP TABLE temp.own_totals;")
+
+def apply_migration_v9(cursor):
+    """
+    Schema v9: scan_checkpoints keeps the traversal frontier of an interrupted scan per volume
+    as JSON (see checkpoint.py).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scan_checkpoints (
+            volume_id INTEGER PRIMARY KEY,
+            saved_at INTEGER NOT NULL,
+            frontier TEXT NOT NULL,
+            FOREIGN KEY (volume_id) REFERENCES volumes(id)
+        );
+    """)
+
+def apply_migration_v10(cursor):
+    """
+    Schema v10: the search index can be deferred during full scans (see defer_search_index),
+    the triggers of v7 are recreated with the conditions.
+    """
+    if _search_index_exists(cursor):
+        for trigger in SEARCH_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        create_search_triggers(cursor)
+
+def apply_migration_v11(cursor):
+    """
+    Schema v11: a backslash inside a name is written as a slash in the relative paths
+    (see walker.join_relative_path). directory_paths and the search triggers are recreated,
+    and the indexed paths that change are replaced.
+    """
+    cursor.execute("DROP VIEW IF EXISTS directory_paths;")
+    cursor.execute(f"""
+        CREATE VIEW directory_paths AS
+        WITH RECURSIVE paths (id, volume_id, path) AS (
+            SELECT id, volume_id, '' FROM directories WHERE parent_id IS NULL
+            UNION ALL
+            SELECT d.id, d.volume_id,
+                   CASE WHEN p.path = '' THEN {PATH_NAME_SQL.format(name="d.name")}
+                   ELSE p.path || '\\' || {PATH_NAME_SQL.format(name="d.name")} END
+            FROM directories d
+            JOIN paths p ON d.parent_id = p.id
+        )
+        SELECT id, volume_id, path FROM paths;
+    """)
+    if _search_index_exists(cursor):
+        for trigger in SEARCH_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        create_search_triggers(cursor)
+        cursor.execute("CREATE TEMP TABLE escaped_paths AS SELECT id, path FROM directory_paths WHERE path LIKE '%/%';")
+        cursor.execute("DELETE FROM directory_paths_fts WHERE rowid IN (SELECT id FROM temp.escaped_paths);")
+        cursor.execute("INSERT INTO directory_paths_fts (rowid, path) SELECT id, path FROM temp.escaped_paths;")
+        cursor.execute("DROP TABLE temp.escaped_paths;")
+
+def apply_migration_v12(cursor):
+    """
+    Schema v12: the files inserted since the last combine are logged into combine_changes too.
+    Their ids don't tell them apart: SQLite gives a new row the id after the largest one left,
+    so once the newest files are deleted a new file can get an id below combine_state.max_file_id.
+    """
+    cursor.execute("""
+        INSERT INTO combine_changes (file_id)
+        SELECT f.id FROM files f JOIN combine_state s ON f.id > s.max_file_id;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS files_inserted_since_combine AFTER INSERT ON files
+        WHEN EXISTS (SELECT 1 FROM combine_state)
+        BEGIN
+            INSERT INTO combine_changes (file_id) VALUES (new.id);
+        END;
+    """)
+
+def apply_migration_v13(cursor):
+    """
+    Schema v13: a deferred search index records the ids of the rows it leaves to
+    catch_up_search_index instead of the largest ids at the deferral (see create_search_triggers).
+    The rows above the ids of a pending deferral are recorded.
+    """
+    if not _search_index_exists(cursor):
+        return
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(search_index_pending);")]
+    if "file_id" not in columns:
+        return
+    pending = cursor.execute("SELECT file_id, directory_id FROM search_index_pending;").fetchone()
+    for trigger in SEARCH_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cursor.execute("DROP TABLE search_index_pending;")
+    create_search_triggers(cursor)
+    if pending is not None:
+        cursor.execute("INSERT INTO search_index_pending (id) VALUES (1);")
+        cursor.execute("INSERT INTO search_pending_files (id) SELECT id FROM files WHERE id > ?;", (pending[0],))
+        cursor.execute("INSERT INTO search_pending_directories (id) SELECT id FROM directories WHERE id > ?;",
+                       (pending[1],))
+
+def drop_search_index(cursor):
+    for trigger in SEARCH_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cursor.execute("DROP TABLE IF EXISTS search_index_pending;")
+    cursor.execute("DROP TABLE IF EXISTS search_pending_files;")
+    cursor.execute("DROP TABLE IF EXISTS search_pending_directories;")
+    cursor.execute("DROP TABLE IF EXISTS file_names_fts;")
+    cursor.execute("DROP TABLE IF EXISTS directory_paths_fts;")
+
+def _search_index_exists(db_conn) -> bool:
+    return db_conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('file_names_fts', 'directory_paths_fts')"
+    ).fetchone()[0] == 2
+
+def has_search_index(db_conn) -> bool:
+    """The search index exists and is complete: not deferred by a running or interrupted scan."""
+    return (_search_index_exists(db_conn)
+            and db_conn.execute("SELECT 1 FROM search_index_pending").fetchone() is None)
+
+def defer_search_index(db_conn):
+    """
+    Stops indexing the names of the files and directories inserted from now on, so a full
+    scan doesn't pay for the FTS5 inserts row by row; catch_up_search_index adds them
+    afterwards in one statement per table. Search falls back to the tables meanwhile.
+    A deferral left by an interrupted scan is kept with the rows it recorded. Commits.
+    """
+    if _search_index_exists(db_conn):
+        db_conn.execute("INSERT OR IGNORE INTO search_index_pending (id) VALUES (1)")
+        db_conn.commit()
+
+def catch_up_search_index(db_conn):
+    """Indexes the rows inserted since defer_search_index and resumes the triggers. Commits."""
+    if not _search_index_exists(db_conn):
+        return
+    if db_conn.execute("SELECT 1 FROM search_index_pending").fetchone() is None:
+        return
+    with instrumentation.phase("search_index"):
+        # ids of rows deleted again since stay recorded; the joins leave them out
+        db_conn.execute("""
+            INSERT INTO file_names_fts (rowid, name)
+            SELECT f.id, f.name FROM search_pending_files p JOIN files f ON f.id = p.id
+        """)
+        db_conn.execute("""
+            INSERT INTO directory_paths_fts (rowid, path)
+            SELECT id, path FROM directory_paths WHERE id IN (SELECT id FROM search_pending_directories)
+        """)
+        db_conn.execute("DELETE FROM search_pending_files")
+        db_conn.execute("DELETE FROM search_pending_directories")
+        db_conn.execute("DELETE FROM search_index_pending")
+        db_conn.commit()
+
+def get_volume_id_by_guid(db_conn, volume_guid: str) -> Optional[int]:
+    """Fetches the volume ID by its GUID."""
+    cursor = db_conn.execute("SELECT id FROM volumes WHERE volume_guid = ?", (volume_guid,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_volume_drive_name(db_path: str, volume_guid: str) -> str|None:
+    """Returns the volume drive name if assigned."""
+    db_conn = sqlite3.connect(db_path)
+    cursor = db_conn.execute(
+        "SELECT drive_name FROM volumes WHERE volume_guid = ?",
+        (volume_guid,)
+    )
+    row = cursor.fetchone()
+    
+    return row[0] if row is not None else None 
+
+def ensure_volume_exists(db_conn, volume_info: VolumeInfo, drive_name: str|None) -> int:
+    """Returns a new or existing volume record ID."""
+    cursor = db_conn.cursor()
+    volume_id = get_volume_id_by_guid(db_conn, volume_info.volume_guid)
+    if not volume_id:
+        cursor.execute(
+            "INSERT INTO volumes (volume_guid, letter, label, filesystem, drive_name) VALUES (?, ?, ?, ?, ?)",
+            (volume_info.volume_guid, volume_info.letter, volume_info.label, volume_info.filesystem, drive_name)
+        )
+        volume_id = cursor.lastrowid
+
+    return volume_id
+
+def insert_directory(db_conn, volume_id: int, parent_id: Optional[int], name: str,
+                     stat_result: os.stat_result, indexed_at: Optional[float]) -> int:
+    """
+    Inserts a directory record known to be missing. Returns the directory ID.
+    The root of a volume has no parent_id and an empty name.
+    """
+    with instrumentation.phase("insert_directory"):
+        cursor = db_conn.execute(
+            "INSERT INTO directories (volume_id, parent_id, name, created_at, modified_at, indexed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (volume_id, parent_id, name, get_created_time_ns(stat_result), stat_result.st_mtime_ns, to_ns(indexed_at))
+        )
+    return cursor.lastrowid
+
+def get_directory_state(db_conn, volume_id: int, path: str) -> Optional[tuple[int, Optional[int], Optional[int]]]:
+    """
+    Returns (id, modified_at, indexed_at) of a directory record or None if it is unknown.
+    The path is resolved segment by segment from the root of the volume.
+    """
+    with instrumentation.phase("directory_query"):
+        row = db_conn.execute(
+            "SELECT id, modified_at, indexed_at FROM directories WHERE volume_id = ? AND parent_id IS NULL",
+            (volume_id,)
+        ).fetchone()
+        for name in split_relative_path(path):
+            if row is None:
+                break
+            row = db_conn.execute(
+                "SELECT id, modified_at, indexed_at FROM directories WHERE parent_id = ? AND name = ?",
+                (row[0], name)
+            ).fetchone()
+        return row
+
+def get_volume_directories(db_conn, volume_id: int):
+    """Yields (path, id, modified_at, indexed_at) of every directory of a volume, parents first."""
+    return db_conn.execute("""
+        WITH RECURSIVE paths (id, path, modified_at, indexed_at) AS (
+            SELECT id, '', modified_at, indexed_at FROM directories WHERE volume_id = ? AND parent_id IS NULL
+            UNION ALL
+            SELECT d.id, CASE WHEN p.path = '' THEN {name} ELSE p.path || '\\' || {name} END,
+                   d.modified_at, d.indexed_at
+            FROM directories d
+            JOIN paths p ON d.parent_id = p.id
+        )
+        SELECT path, id, modified_at, indexed_at FROM paths
+    """.format(name=PATH_NAME_SQL.format(name="d.name")), (volume_id,))
+
+def get_directory_path(db_conn, dir_id: int) -> Optional[str]:
+    """Reconstructs the relative path of a directory from its ancestors; None if it is unknown."""
+    names = [row[0] for row in db_conn.execute("""
+        WITH RECURSIVE ancestors (id, parent_id, name, depth) AS (
+            SELECT id, parent_id, name, 0 FROM directories WHERE id = ?
+            UNION ALL
+            SELECT d.id, d.parent_id, d.name, a.depth + 1
+            FROM directories d
+            JOIN ancestors a ON d.id = a.parent_id
+        )
+        SELECT name FROM ancestors ORDER BY depth DESC
+    """, (dir_id,))]
+    if not names:
+        return None
+    path = ""
+    for name in names[1:]:
+        path = join_relative_path(path, name)
+    return path
+
+def update_directory_state(db_conn, dir_id: int, stat_result: os.stat_result):
+    """Stores the current created/modified timestamps of a directory."""
+    db_conn.execute(
+        "UPDATE directories SET created_at = ?, modified_at = ? WHERE id = ?",
+        (get_created_time_ns(stat_result), stat_result.st_mtime_ns, dir_id)
+    )
+
+def get_child_directories(db_conn, dir_id: int) -> dict[str, int]:
+    """Returns the direct subdirectories of a directory as name -> id."""
+    cursor = db_conn.execute("SELECT name, id FROM directories WHERE parent_id = ?", (dir_id,))
+    return {row[0]: row[1] for row in cursor}
+
+def delete_directory_tree(db_conn, dir_id: int) -> int:
+    """Deletes a directory with all its subdirectories and files. Returns the number of deleted files."""
+    dir_ids = [row[0] for row in db_conn.execute("""
+        WITH RECURSIVE subtree (id) AS (
+            SELECT ?
+            UNION ALL
+            SELECT d.id FROM directories d JOIN subtree s ON d.parent_id = s.id
+        )
+        SELECT id FROM subtree
+    """, (dir_id,))]
+    deleted_files = 0
+    for subdir_id in dir_ids:
+        file_ids = [row[0] for row in db_conn.execute("SELECT id FROM files WHERE directory_id = ?", (subdir_id,))]
+        delete_file_records(db_conn, file_ids)
+        deleted_files += len(file_ids)
+    # children first, so no row ever points to a deleted parent
+    db_conn.executemany("DELETE FROM directory_rollups WHERE directory_id = ?", [(subdir_id,) for subdir_id in dir_ids])
+    db_conn.executemany("DELETE FROM directories WHERE id = ?", [(subdir_id,) for subdir_id in reversed(dir_ids)])
+    return deleted_files
+
+def delete_volume_records(db_conn, volume_id: int):
+    """
+    Deletes every directory and file of a volume together with their hashes. The volume row stays.
+    Like for any deleted file, the output_files rows are left to the next combine.
+    """
+    volume_files = "SELECT f.id FROM files f JOIN directories d ON d.id = f.directory_id WHERE d.volume_id = ?"
+    db_conn.execute(f"DELETE FROM unique_files WHERE file_id IN ({volume_files})", (volume_id,))
+    db_conn.execute("DELETE FROM files WHERE directory_id IN (SELECT id FROM directories WHERE volume_id = ?)",
+                    (volume_id,))
+    db_conn.execute("DELETE FROM directory_rollups WHERE directory_id IN (SELECT id FROM directories WHERE volume_id = ?)",
+                    (volume_id,))
+    db_conn.execute("DELETE FROM directories WHERE volume_id = ?", (volume_id,))
+    delete_scan_checkpoint(db_conn, volume_id)
+
+def save_scan_checkpoint(db_conn, volume_id: int, frontier: str):
+    db_conn.execute(
+        f"INSERT OR REPLACE INTO scan_checkpoints (volume_id, saved_at, frontier) VALUES (?, {NOW_NS_SQL}, ?)",
+        (volume_id, frontier)
+    )
+
+def load_scan_checkpoint(db_conn, volume_id: int) -> Optional[str]:
+    row = db_conn.execute("SELECT frontier FROM scan_checkpoints WHERE volume_id = ?", (volume_id,)).fetchone()
+    return row[0] if row else None
+
+def delete_scan_checkpoint(db_conn, volume_id: int):
+    db_conn.execute("DELETE FROM scan_checkpoints WHERE volume_id = ?", (volume_id,))
+
+def mark_directory_as_indexed(db_conn, dir_id: int, timestamp: float):
+    """Marks a directory as fully indexed by setting its indexed_at timestamp and updates its rollup."""
+    with instrumentation.phase("mark_indexed"):
+        db_conn.execute(
+            "UPDATE directories SET indexed_at = ? WHERE id = ?",
+            (to_ns(timestamp), dir_id)
+        )
+        update_directory_rollup(db_conn, dir_id)
+
+def update_directory_rollup(db_conn, dir_id: int):
+    """
+    Recomputes the rollup of a directory from its own files and the rollups of its
+    subdirectories; subdirectories without a rollup (not indexed yet) count as empty.
+    A full scan marks the children before their parent, so the rollups accumulate bottom-up.
+    The difference to the previous rollup is added to every ancestor that has one: a rescan
+    syncs a parent before its children, and each child then patches the totals above it.
+    """
+    own_bytes, own_files = db_conn.execute(
+        "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM files WHERE directory_id = ?", (dir_id,)
+    ).fetchone()
+    child_bytes, child_files, child_dirs = db_conn.execute("""
+        SELECT COALESCE(SUM(r.total_bytes), 0), COALESCE(SUM(r.file_count), 0), COALESCE(SUM(r.subdir_count + 1), 0)
+        FROM directories c
+        JOIN directory_rollups r ON r.directory_id = c.id
+        WHERE c.parent_id = ?
+    """, (dir_id,)).fetchone()
+    total = (own_bytes + child_bytes, own_files + child_files, child_dirs)
+
+    previous = db_conn.execute(
+        "SELECT total_bytes, file_count, subdir_count FROM directory_rollups WHERE directory_id = ?", (dir_id,)
+    ).fetchone()
+    db_conn.execute(
+        "INSERT OR REPLACE INTO directory_rollups "
+        "(directory_id, own_bytes, own_files, total_bytes, file_count, subdir_count) VALUES (?, ?, ?, ?, ?, ?)",
+        (dir_id, own_bytes, own_files, *total)
+    )
+
+    # a directory without a previous rollup was not counted by its parent yet
+    delta = (total[0] - previous[0], total[1] - previous[1], total[2] - previous[2]) if previous else (*total[:2], total[2] + 1)
+    if delta == (0, 0, 0):
+        return
+    db_conn.execute("""
+        WITH RECURSIVE ancestors (id) AS (
+            SELECT parent_id FROM directories WHERE id = :dir_id AND parent_id IS NOT NULL
+            UNION ALL
+            SELECT d.parent_id FROM directories d JOIN ancestors a ON d.id = a.id WHERE d.parent_id IS NOT NULL
+        )
+        UPDATE directory_rollups
+        SET total_bytes = total_bytes + :bytes, file_count = file_count + :files, subdir_count = subdir_count + :dirs
+        WHERE directory_id IN (SELECT id FROM ancestors)
+    """, {"dir_id": dir_id, "bytes": delta[0], "files": delta[1], "dirs": delta[2]})
+
+def same_timestamp(stored: Optional[int], current: Optional[int]) -> bool:
+    """Compares nanosecond timestamps with TIMESTAMP_TOLERANCE_NS."""
+    if stored is None or current is None:
+        return stored is current
+    return abs(stored - current) < TIMESTAMP_TOLERANCE_NS
+
+def make_file_record(dir_id: int, name: str, stat_result: os.stat_result) -> tuple:
+    """Builds the parameters tuple of a files row."""
+    return (dir_id, name, stat_result.st_size, get_created_time_ns(stat_result), stat_result.st_mtime_ns)
+
+def insert_file_records(db_conn: sqlite3.Connection, records: list[tuple]):
+    """Inserts a batch of file records built by make_file_record with a single executemany."""
+    with instrumentation.phase("insert_files"):
+        db_conn.executemany(
+            "INSERT OR IGNORE INTO files (directory_id, name, size, created_at, modified_at) VALUES (?, ?, ?, ?, ?)",
+            records
+        )
+
+def get_directory_files(db_conn, dir_id: int) -> dict[str, tuple[int, int, int]]:
+    """Returns the file records of a directory as name -> (id, size, modified_at)."""
+    cursor = db_conn.execute("SELECT id, name, size, modified_at FROM files WHERE directory_id = ?", (dir_id,))
+    return {row[1]: (row[0], row[2], row[3]) for row in cursor}
+
+def update_file_records(db_conn: sqlite3.Connection, records: list[tuple]):
+    """Overwrites existing file records with fresh records built by make_file_record and drops their stale hashes."""
+    db_conn.executemany(
+        "DELETE FROM unique_files WHERE file_id = (SELECT id FROM files WHERE directory_id = ? AND name = ?)",
+        [(dir_id, name) for dir_id, name, _, _, _ in records]
+    )
+    db_conn.executemany(
+        f"UPDATE files SET size = ?, created_at = ?, modified_at = ?, indexed_at = {NOW_NS_SQL} "
+        "WHERE directory_id = ? AND name = ?",
+        [(size, created_at, modified_at, dir_id, name) for dir_id, name, size, created_at, modified_at in records]
+    )
+
+def delete_file_records(db_conn: sqlite3.Connection, file_ids: list[int]):
+    """Deletes file records together with their hashes."""
+    params = [(file_id,) for file_id in file_ids]
+    db_conn.executemany("DELETE FROM unique_files WHERE file_id = ?", params)
+    db_conn.executemany("DELETE FROM files WHERE id = ?", params)
+
+def save_file_hashes(db_conn: sqlite3.Connection, records: list[tuple[int, Optional[str], Optional[str]]]):
+    """Stores (file_id, partial_hash, hash) records; a NULL value keeps the already stored one."""
+    db_conn.executemany(
+        "INSERT INTO unique_files (file_id, partial_hash, hash) VALUES (?, ?, ?) "
+        "ON CONFLICT(file_id) DO UPDATE SET partial_hash = COALESCE(excluded.partial_hash, unique_files.partial_hash), "
+        "hash = COALESCE(excluded.hash, unique_files.hash)",
+        records
+    )
+
+def mark_files_copied(db_conn: sqlite3.Connection, records: list[tuple[int, int]]):
+    """Stores (file_id, copied_at) records of exported files; files without a hash get a unique_files row too."""
+    db_conn.executemany(
+        "INSERT INTO unique_files (file_id, copied_at) VALUES (?, ?) "
+        "ON CONFLICT(file_id) DO UPDATE SET copied_at = excluded.copied_at",
+        records
+    )
+
+def store_cached_hashes(db_conn: sqlite3.Connection, entries: list[tuple[int, str, str]]):
+    """
+    Copies the hashes of the given files from unique_files into hash_cache.
+    entries are (file_id, volume_guid, relative file path); the caller knows the paths already.
+    """
+    db_conn.executemany(
+        """
+        INSERT INTO hash_cache (volume_guid, path, size, modified_at, partial_hash, hash)
+        SELECT ?, ?, f.size, f.modified_at, u.partial_hash, u.hash
+        FROM unique_files u
+        JOIN files f ON f.id = u.file_id
+        WHERE u.file_id = ?
+        ON CONFLICT (volume_guid, path) DO UPDATE SET
+            size = excluded.size, modified_at = excluded.modified_at,
+            partial_hash = excluded.partial_hash, hash = excluded.hash
+        """,
+        [(volume_guid, path, file_id) for file_id, volume_guid, path in entries]
+    )
+
+def apply_hash_cache(db_conn: sqlite3.Connection) -> int:
+    """
+    Gives the files not hashed yet the cached hashes of the same volume, relative path,
+    size and modified_at. A unique_files row holding only the copied_at of the exporter
+    is completed. Returns the number of files that got a hash.
+    """
+    cursor = db_conn.execute(f"""
+        INSERT INTO unique_files (file_id, partial_hash, hash)
+        SELECT f.id, c.partial_hash, c.hash
+        FROM files f
+        JOIN directory_paths d ON d.id = f.directory_id
+        JOIN volumes v ON v.id = d.volume_id
+        JOIN hash_cache c ON c.volume_guid = v.volume_guid AND c.path = {FILE_PATH_SQL}
+        WHERE c.size = f.size AND ABS(c.modified_at - f.modified_at) < {TIMESTAMP_TOLERANCE_NS}
+          AND NOT EXISTS (SELECT 1 FROM unique_files u WHERE u.file_id = f.id AND u.partial_hash IS NOT NULL)
+        ON CONFLICT(file_id) DO UPDATE SET partial_hash = excluded.partial_hash, hash = excluded.hash
+    """)
+    return cursor.rowcount
+
+def vacuum_hash_cache(db_conn: sqlite3.Connection) -> int:
+    """Evicts cache entries whose file is no longer in the index. Returns the number of evicted entries."""
+    cursor = db_conn.execute(f"""
+        DELETE FROM hash_cache
+        WHERE (volume_guid, path) NOT IN (
+            SELECT v.volume_guid, {FILE_PATH_SQL}
+            FROM files f
+            JOIN directory_paths d ON d.id = f.directory_id
+            JOIN volumes v ON v.id = d.volume_id
+        )
+    """)
+    return cursor.rowcount
\ No newline at end of file
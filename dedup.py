@@ -0,0 +1,379 @@
+"""
+Отчёт о дубликатах между томами и дисками: наборы одинаковых файлов (размер + хэш)
+и одинаковые поддеревья каталогов, отсортированные по объёму, который можно освободить.
+Заполняет только временные таблицы соединения, сам индекс не меняется.
+"""
+
+import argparse
+import hashlib
+import sqlite3
+from typing import Optional
+
+from database import connect
+from directory_cache import DirectoryPaths
+from utils import format_bytes
+from walker import join_relative_path
+
+
+DB_PATH = "index.db"
+TOP_N = 20
+MIN_FILE_SIZE = 1
+DIGEST_MASK = (1 << 64) - 1
+
+# Which duplicate sets are reported: any, spanning several volumes, spanning several drives.
+# A volume without drive_name counts as a drive of its own.
+SCOPE_ANY = "any"
+SCOPE_VOLUME = "volume"
+SCOPE_DRIVE = "drive"
+SCOPES = [SCOPE_ANY, SCOPE_VOLUME, SCOPE_DRIVE]
+
+SCOPE_CONDITIONS = {
+    SCOPE_ANY: "1",
+    SCOPE_VOLUME: "volumes >= 2",
+    SCOPE_DRIVE: "drives >= 2",
+}
+
+DRIVE_KEY_SQL = "COALESCE(v.drive_name, v.volume_guid)"
+
+# One row per (hash, size) with two or more files. The hash index keeps the grouping
+# a sequential walk, and the sorter spills to disk, so memory doesn't grow with the index.
+FILE_SETS_QUERY = f"""
+    INSERT INTO temp.dedup_file_sets (hash, size, copies, volumes, drives, reclaimable)
+    SELECT u.hash, f.size, COUNT(*), COUNT(DISTINCT d.volume_id), COUNT(DISTINCT {DRIVE_KEY_SQL}),
+           f.size * (COUNT(*) - 1)
+    FROM unique_files u
+    JOIN files f ON f.id = u.file_id
+    JOIN directories d ON d.id = f.directory_id
+    JOIN volumes v ON v.id = d.volume_id
+    WHERE u.hash IS NOT NULL AND f.size >= ?
+    GROUP BY u.hash, f.size
+    HAVING COUNT(*) >= 2
+"""
+
+# Depth of every directory, so that the subtrees can be folded bottom-up level by level
+LEVELS_QUERY = """
+    INSERT INTO temp.dedup_levels (id, parent_id, volume_id, depth)
+    WITH RECURSIVE levels (id, parent_id, volume_id, depth) AS (
+        SELECT id, NULL, volume_id, 0 FROM directories WHERE parent_id IS NULL
+        UNION ALL
+        SELECT d.id, d.parent_id, d.volume_id, l.depth + 1
+        FROM directories d
+        JOIN levels l ON d.parent_id = l.id
+    )
+    SELECT id, parent_id, volume_id, depth FROM levels
+"""
+
+# Signature of the files directly in a directory. A file without a full hash has no
+# duplicate (the hasher only skips unique sizes and unique partial hashes), so its id
+# stands for its content; empty files are all equal.
+DIRECTORY_FILES_QUERY = """
+    INSERT INTO temp.dedup_directory_files (dir_id, signature, bytes, files)
+    SELECT f.directory_id,
+           DIGEST_SET(ENTRY_DIGEST('f', f.name, f.size,
+               COALESCE(u.hash, CASE WHEN f.size = 0 THEN '' ELSE 'id:' || f.id END))),
+           SUM(f.size), COUNT(*)
+    FROM files f
+    LEFT JOIN unique_files u ON u.file_id = f.id
+    GROUP BY f.directory_id
+"""
+
+# A level of subtrees from its files and the already folded subtrees one level deeper.
+# The signature covers the names and contents below the directory, not its own name.
+SUBTREE_LEVEL_QUERY = """
+    INSERT INTO temp.dedup_subtrees (id, parent_id, volume_id, depth, signature, bytes, files)
+    SELECT l.id, l.parent_id, l.volume_id, l.depth,
+           DIGEST_ADD(df.signature, c.signature),
+           COALESCE(df.bytes, 0) + COALESCE(c.bytes, 0),
+           COALESCE(df.files, 0) + COALESCE(c.files, 0)
+    FROM temp.dedup_levels l
+    LEFT JOIN temp.dedup_directory_files df ON df.dir_id = l.id
+    LEFT JOIN (
+        SELECT s.parent_id,
+               DIGEST_SET(ENTRY_DIGEST('d', d.name, s.bytes, s.signature)) AS signature,
+               SUM(s.bytes) AS bytes, SUM(s.files) AS files
+        FROM temp.dedup_subtrees s
+        JOIN directories d ON d.id = s.id
+        WHERE s.depth = :depth + 1
+        GROUP BY s.parent_id
+    ) c ON c.parent_id = l.id
+    WHERE l.depth = :depth
+"""
+
+FOLDER_SETS_QUERY = f"""
+    INSERT INTO temp.dedup_folder_sets (signature, bytes, files, copies, volumes, drives, reclaimable)
+    SELECT s.signature, MAX(s.bytes), MAX(s.files), COUNT(*), COUNT(DISTINCT s.volume_id),
+           COUNT(DISTINCT {DRIVE_KEY_SQL}), MAX(s.bytes) * (COUNT(*) - 1)
+    FROM temp.dedup_subtrees s
+    JOIN volumes v ON v.id = s.volume_id
+    WHERE s.files > 0
+    GROUP BY s.signature
+    HAVING COUNT(*) >= 2
+"""
+
+# A set is covered when every copy sits in a parent that is a duplicate itself:
+# the parents' set reports the same folders already.
+COVERED_FOLDER_SETS_QUERY = """
+    UPDATE temp.dedup_folder_sets SET covered = 1
+    WHERE signature IN (
+        SELECT s.signature
+        FROM temp.dedup_subtrees s
+        LEFT JOIN temp.dedup_subtrees p ON p.id = s.parent_id
+        WHERE s.signature IN (SELECT signature FROM temp.dedup_folder_sets)
+        GROUP BY s.signature
+        HAVING MIN(p.signature IS NOT NULL
+                   AND p.signature IN (SELECT signature FROM temp.dedup_folder_sets)) = 1
+    )
+"""
+
+
+class DuplicateSet:
+    """Files or folders with the same content."""
+    size: int
+    files: int
+    copies: int
+    volumes: int
+    drives: int
+    reclaimable: int
+    locations: list[tuple[str, Optional[str], str]]   # (volume letter, drive name, relative path)
+
+    def __init__(self, size: int, files: int, copies: int, volumes: int, drives: int, reclaimable: int) -> None:
+        self.size = size
+        self.files = files
+        self.copies = copies
+        self.volumes = volumes
+        self.drives = drives
+        self.reclaimable = reclaimable
+        self.locations = []
+
+    pass
+
+
+class DedupTotals:
+    """Number of duplicate sets, the files in them and the bytes removing the extra copies would free."""
+    sets: int
+    files: int
+    reclaimable: int
+
+    def __init__(self, sets: int, files: int, reclaimable: int) -> None:
+        self.sets = sets
+        self.files = files
+        self.reclaimable = reclaimable
+
+    pass
+
+
+def _entry_digest(kind: str, name: str, size: int, content) -> int:
+    """64-bit digest of a directory entry; names keep their case, as the filesystem reports them."""
+    data = f"{kind}\0{name}\0{size}\0{content}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+def _to_int64(value: int) -> int:
+    """Wraps a sum of digests into the signed 64-bit range SQLite stores."""
+    value &= DIGEST_MASK
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _digest_add(left: Optional[int], right: Optional[int]) -> int:
+    return _to_int64((left or 0) + (right or 0))
+
+
+class _DigestSet:
+    """
+    Sum of the entry digests modulo 2^64: the signature doesn't depend on the order of
+    the entries, and unlike XOR equal digests don't cancel each other out.
+    """
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def step(self, digest: Optional[int]):
+        if digest is not None:
+            self.value += digest
+
+    def finalize(self) -> int:
+        return _to_int64(self.value)
+
+    pass
+
+
+def register_functions(conn: sqlite3.Connection):
+    conn.create_function("ENTRY_DIGEST", 4, _entry_digest, deterministic=True)
+    conn.create_function("DIGEST_ADD", 2, _digest_add, deterministic=True)
+    conn.create_aggregate("DIGEST_SET", 1, _DigestSet)
+
+def find_duplicate_files(conn: sqlite3.Connection, scope: str = SCOPE_ANY,
+                         min_size: int = MIN_FILE_SIZE) -> DedupTotals:
+    """
+    Fills temp.dedup_file_sets with the sets of hashed files sharing size and hash.
+    Files the hasher hasn't processed are not taken into account.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.dedup_file_sets")
+    conn.execute("""
+        CREATE TEMP TABLE dedup_file_sets (
+            hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            copies INTEGER NOT NULL,
+            volumes INTEGER NOT NULL,
+            drives INTEGER NOT NULL,
+            reclaimable INTEGER NOT NULL
+        )
+    """)
+    conn.execute(FILE_SETS_QUERY, (max(min_size, MIN_FILE_SIZE),))
+    conn.execute("CREATE INDEX temp.idx_dedup_file_sets_reclaimable ON dedup_file_sets (reclaimable)")
+    row = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(copies), 0), COALESCE(SUM(reclaimable), 0)
+        FROM temp.dedup_file_sets WHERE {SCOPE_CONDITIONS[scope]}
+    """).fetchone()
+    return DedupTotals(row[0], row[1], row[2])
+
+def find_duplicate_folders(conn: sqlite3.Connection, scope: str = SCOPE_ANY) -> DedupTotals:
+    """
+    Fills temp.dedup_folder_sets with the sets of directory subtrees holding the same names,
+    sizes and contents. Subtrees are folded bottom-up, one SQL statement per depth level,
+    into 64-bit signatures. Sets whose every copy lies in a duplicated parent are marked as covered
+    and left out of the totals, so a duplicated folder isn't counted again for each of its subfolders.
+    A set only partly inside a larger one still counts all its copies, so the total is an upper estimate.
+    """
+    register_functions(conn)
+    for table in ("dedup_levels", "dedup_directory_files", "dedup_subtrees", "dedup_folder_sets"):
+        conn.execute(f"DROP TABLE IF EXISTS temp.{table}")
+    conn.execute("""
+        CREATE TEMP TABLE dedup_levels (
+            id INTEGER PRIMARY KEY,
+            parent_id INTEGER,
+            volume_id INTEGER NOT NULL,
+            depth INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TEMP TABLE dedup_directory_files (
+            dir_id INTEGER PRIMARY KEY,
+            signature INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            files INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TEMP TABLE dedup_subtrees (
+            id INTEGER PRIMARY KEY,
+            parent_id INTEGER,
+            volume_id INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            signature INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            files INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TEMP TABLE dedup_folder_sets (
+            signature INTEGER PRIMARY KEY,
+            bytes INTEGER NOT NULL,
+            files INTEGER NOT NULL,
+            copies INTEGER NOT NULL,
+            volumes INTEGER NOT NULL,
+            drives INTEGER NOT NULL,
+            reclaimable INTEGER NOT NULL,
+            covered INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    conn.execute(LEVELS_QUERY)
+    conn.execute("CREATE INDEX temp.idx_dedup_levels_depth ON dedup_levels (depth)")
+    conn.execute(DIRECTORY_FILES_QUERY)
+    conn.execute("CREATE INDEX temp.idx_dedup_subtrees_depth ON dedup_subtrees (depth)")
+    max_depth = conn.execute("SELECT MAX(depth) FROM temp.dedup_levels").fetchone()[0]
+    for depth in range(max_depth if max_depth is not None else -1, -1, -1):
+        conn.execute(SUBTREE_LEVEL_QUERY, {"depth": depth})
+
+    conn.execute("CREATE INDEX temp.idx_dedup_subtrees_signature ON dedup_subtrees (signature)")
+    conn.execute(FOLDER_SETS_QUERY)
+    conn.execute(COVERED_FOLDER_SETS_QUERY)
+    conn.execute("CREATE INDEX temp.idx_dedup_folder_sets_reclaimable ON dedup_folder_sets (reclaimable)")
+    row = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(files * copies), 0), COALESCE(SUM(reclaimable), 0)
+        FROM temp.dedup_folder_sets WHERE covered = 0 AND {SCOPE_CONDITIONS[scope]}
+    """).fetchone()
+    return DedupTotals(row[0], row[1], row[2])
+
+def top_file_sets(conn: sqlite3.Connection, scope: str = SCOPE_ANY, limit: int = TOP_N) -> list[DuplicateSet]:
+    """The file sets found by find_duplicate_files with the most reclaimable bytes, with their locations."""
+    directory_paths = DirectoryPaths(conn)
+    result = []
+    for row in conn.execute(f"""
+        SELECT hash, size, copies, volumes, drives, reclaimable
+        FROM temp.dedup_file_sets WHERE {SCOPE_CONDITIONS[scope]}
+        ORDER BY reclaimable DESC, hash
+        LIMIT ?
+    """, (limit,)).fetchall():
+        duplicate_set = DuplicateSet(row[1], 1, row[2], row[3], row[4], row[5])
+        for location in conn.execute("""
+            SELECT v.letter, v.drive_name, f.directory_id, f.name
+            FROM unique_files u
+            JOIN files f ON f.id = u.file_id
+            JOIN directories d ON d.id = f.directory_id
+            JOIN volumes v ON v.id = d.volume_id
+            WHERE u.hash = ? AND f.size = ?
+            ORDER BY v.letter, f.id
+        """, (row[0], row[1])).fetchall():
+            path = join_relative_path(directory_paths.get(location[2]) or "", location[3])
+            duplicate_set.locations.append((location[0], location[1], path))
+        result.append(duplicate_set)
+    return result
+
+def top_folder_sets(conn: sqlite3.Connection, scope: str = SCOPE_ANY, limit: int = TOP_N) -> list[DuplicateSet]:
+    """The folder sets found by find_duplicate_folders with the most reclaimable bytes, with their locations."""
+    directory_paths = DirectoryPaths(conn)
+    result = []
+    for row in conn.execute(f"""
+        SELECT signature, bytes, files, copies, volumes, drives, reclaimable
+        FROM temp.dedup_folder_sets WHERE covered = 0 AND {SCOPE_CONDITIONS[scope]}
+        ORDER BY reclaimable DESC, signature
+        LIMIT ?
+    """, (limit,)).fetchall():
+        duplicate_set = DuplicateSet(row[1], row[2], row[3], row[4], row[5], row[6])
+        for location in conn.execute("""
+            SELECT v.letter, v.drive_name, s.id
+            FROM temp.dedup_subtrees s
+            JOIN volumes v ON v.id = s.volume_id
+            WHERE s.signature = ?
+            ORDER BY v.letter, s.id
+        """, (row[0],)).fetchall():
+            duplicate_set.locations.append((location[0], location[1], directory_paths.get(location[2]) or ""))
+        result.append(duplicate_set)
+    return result
+
+def _print_sets(title: str, totals: DedupTotals, sets: list[DuplicateSet], what: str):
+    print(f"{title}: {totals.sets} sets, {totals.files} files, {format_bytes(totals.reclaimable)} reclaimable")
+    for duplicate_set in sets:
+        print(f"  {format_bytes(duplicate_set.reclaimable)}: {duplicate_set.copies} copies of {format_bytes(duplicate_set.size)}"
+              f"{what.format(files=duplicate_set.files)} on {duplicate_set.volumes} volumes, {duplicate_set.drives} drives")
+        for letter, drive_name, path in duplicate_set.locations:
+            print(f"    [{drive_name or '-'}] {letter}: {path or '.'}")
+
+def main(db_path: str = DB_PATH, scope: str = SCOPE_ANY, top: int = TOP_N,
+         min_size: int = MIN_FILE_SIZE, folders: bool = True):
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown scope: {scope}")
+
+    conn = connect(db_path)
+    totals = find_duplicate_files(conn, scope, min_size)
+    _print_sets("Duplicate files", totals, top_file_sets(conn, scope, top), "")
+
+    if folders:
+        print()
+        totals = find_duplicate_folders(conn, scope)
+        _print_sets("Duplicate folders", totals, top_folder_sets(conn, scope, top), " ({files} files)")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports content duplicates across volumes and drives")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--scope", choices=SCOPES, default=SCOPE_ANY,
+                        help="any: every duplicate set; volume: sets spanning several volumes; "
+                             "drive: sets spanning several drives")
+    parser.add_argument("--top", type=int, default=TOP_N, help="sets to list per report")
+    parser.add_argument("--min-size", type=int, default=MIN_FILE_SIZE, help="ignore files smaller than this, bytes")
+    parser.add_argument("--no-folders", action="store_true", help="skip the duplicate folders report")
+    args = parser.parse_args()
+    main(args.db, args.scope, args.top, args.min_size, not args.no_folders)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Кэш каталогов тома в памяти: один запрос вместо двух SELECT на каждый каталог,
+и восстановление путей каталогов по parent_id.
+"""
+
+import sqlite3
+from typing import Optional
+
+from database import get_directory_state, get_volume_directories
+from walker import join_relative_path
+
+
+DEFAULT_MAX_ENTRIES = 4_000_000  # roughly 1 GiB of Python objects with long paths
+
+# (id, modified_at, is indexed)
+DirectoryEntry = tuple[int, Optional[int], bool]
+
+
+class DirectoryCache:
+    """
+    Known directories of one volume as path -> (id, modified_at, is indexed), loaded
+    with a single bulk query. If the volume has more than max_entries directories
+    the map is not built and every lookup goes to the database, as before.
+    The map reflects the database at load time: a scan looks every directory up
+    once, before inserting it. Lookups are safe from several threads.
+    """
+    volume_id: int
+    max_entries: int
+
+    def __init__(self, db_conn: sqlite3.Connection, volume_id: int, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.volume_id = volume_id
+        self.max_entries = max_entries
+        self._entries: Optional[dict[str, DirectoryEntry]] = None
+
+        # counted while loading: no index of directories leads with volume_id
+        entries = {}
+        for path, dir_id, modified_at, indexed_at in get_volume_directories(db_conn, volume_id):
+            if len(entries) >= max_entries:
+                return
+            entries[path] = (dir_id, modified_at, indexed_at is not None)
+        self._entries = entries
+
+    def get(self, db_conn: sqlite3.Connection, path: str) -> Optional[DirectoryEntry]:
+        """Returns the directory entry or None if the directory is unknown."""
+        if self._entries is not None:
+            return self._entries.get(path)
+        row = get_directory_state(db_conn, self.volume_id, path)
+        return (row[0], row[1], row[2] is not None) if row else None
+
+    pass
+
+
+class DirectoryPaths:
+    """
+    Relative paths of directories by id, reconstructed from parent_id and name.
+    Every directory is queried once; its ancestors are shared with the siblings.
+    """
+
+    def __init__(self, db_conn: sqlite3.Connection) -> None:
+        self.db_conn = db_conn
+        self._paths: dict[int, str] = {}
+
+    def get(self, dir_id: int) -> Optional[str]:
+        """Returns the path or None if the directory (or one of its ancestors) is unknown."""
+        missing = []
+        current_id = dir_id
+        path = self._paths.get(current_id)
+        while path is None:
+            row = self.db_conn.execute(
+                "SELECT parent_id, name FROM directories WHERE id = ?", (current_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] is None:
+                path = ""
+                self._paths[current_id] = path
+                break
+            missing.append((current_id, row[1]))
+            current_id = row[0]
+            path = self._paths.get(current_id)
+
+        for missing_id, name in reversed(missing):
+            path = join_relative_path(path, name)
+            self._paths[missing_id] = path
+        return path
+
+    pass
\ No newline at end of file
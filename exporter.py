@@ -0,0 +1,370 @@
+"""
+Экспорт: копирует файлы в целевой каталог по путям output_files, рассчитанным комбинатором.
+Каждый физический диск читается одним потоком, скопированные файлы отмечаются
+в unique_files.copied_at, поэтому прерванный экспорт продолжается с того же места.
+"""
+
+import argparse
+import errno
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+from console import write_line
+from database import connect, connect_readonly, mark_files_copied
+from directory_cache import DirectoryPaths
+from get_volumes import DirectoryVolumeProvider, get_volumes, VolumeProvider
+from progress import ScanProgress
+from utils import format_bytes
+from walker import join_relative_path, to_native_path
+
+
+DB_PATH = "index.db"
+DEFAULT_WORKERS = 4           # drives read at the same time
+CHUNK_SIZE = 1000             # output_files rows fetched per query
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+ZERO_COPY_CHUNK = 64 * 1024 * 1024
+COMMIT_ROWS = 1000
+COMMIT_INTERVAL = 5.0         # seconds
+PART_SUFFIX = ".part"
+DUPLICATES_SUFFIX = ".dups"   # directory next to a combined file that holds its other copies
+
+# errno values of a zero-copy call that mean "not for this pair of files", not a broken file
+UNSUPPORTED_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+# copy_file_range and sendfile work between regular files on Linux only
+zero_copy_available = {
+    "copy_file_range": hasattr(os, "copy_file_range"),
+    "sendfile": hasattr(os, "sendfile") and sys.platform.startswith("linux"),
+}
+
+VOLUMES_QUERY = "SELECT id, volume_guid, COALESCE(drive_name, volume_guid) FROM volumes ORDER BY id"
+
+# Files of the given volumes that are not exported yet, in output_files order;
+# rows of files deleted since the last combine drop out of the join
+PENDING_QUERY = """
+    SELECT o.id, o.file_id, o.out_path, o.group_dir, o.group_name, d.volume_id, f.directory_id, f.name, f.size
+    FROM output_files o
+    JOIN files f ON f.id = o.file_id
+    JOIN directories d ON d.id = f.directory_id
+    LEFT JOIN unique_files u ON u.file_id = o.file_id
+    WHERE o.id > ? AND d.volume_id IN ({volumes}) AND u.copied_at IS NULL
+    ORDER BY o.id
+    LIMIT ?
+"""
+
+PENDING_SIZE_QUERY = """
+    SELECT COUNT(*), COALESCE(SUM(f.size), 0)
+    FROM output_files o
+    JOIN files f ON f.id = o.file_id
+    JOIN directories d ON d.id = f.directory_id
+    LEFT JOIN unique_files u ON u.file_id = o.file_id
+    WHERE d.volume_id IN ({volumes}) AND u.copied_at IS NULL
+"""
+
+RESULT_COPIED = "copied"
+RESULT_FAILED = "failed"
+RESULT_ERROR = "error"
+RESULT_DONE = "done"
+
+
+class ExportResult:
+    """Totals of one export run."""
+    copied_files: int
+    copied_bytes: int
+    failed_files: int
+    skipped_volumes: list[str]
+
+    def __init__(self) -> None:
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.failed_files = 0
+        self.skipped_volumes = []
+
+    pass
+
+
+def get_target_path(target_root: str, out_path: str, group_dir: Optional[str] = None,
+                    group_name: Optional[str] = None) -> str:
+    """
+    out_path of output_files is relative and slash separated. The combinator puts the first
+    file of a group at <dir>/<name> and the other copies at <dir>/<name>/<idx><ext>, so the
+    same path would have to be a file and a directory; the copies go to <dir>/<name>.dups instead.
+    """
+    if group_name is not None:
+        base_path = f"{group_dir or ''}/{group_name}".lstrip("/")
+        if out_path.startswith(base_path + "/"):
+            out_path = base_path + DUPLICATES_SUFFIX + out_path[len(base_path):]
+    return os.path.join(target_root, *out_path.split("/"))
+
+def _copy_file_range(source: BinaryIO, target: BinaryIO, offset: int, size: int) -> int:
+    while offset < size:
+        try:
+            copied = os.copy_file_range(source.fileno(), target.fileno(),
+                                        min(size - offset, ZERO_COPY_CHUNK), offset, offset)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            if e.errno == errno.ENOSYS:
+                zero_copy_available["copy_file_range"] = False
+            break
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+def _sendfile(source: BinaryIO, target: BinaryIO, offset: int, size: int) -> int:
+    # sendfile takes the source offset explicitly but writes at the current target position
+    target.seek(offset)
+    while offset < size:
+        try:
+            copied = os.sendfile(target.fileno(), source.fileno(), offset, min(size - offset, ZERO_COPY_CHUNK))
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            if e.errno == errno.ENOSYS:
+                zero_copy_available["sendfile"] = False
+            break
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+def _copy_buffered(source: BinaryIO, target: BinaryIO, offset: int, size: int) -> int:
+    source.seek(offset)
+    target.seek(offset)
+    buffer = memoryview(bytearray(min(COPY_BUFFER_SIZE, max(size - offset, 1))))
+    while offset < size:
+        read = source.readinto(buffer[:min(size - offset, len(buffer))])
+        if not read:
+            break
+        written = 0
+        while written < read:
+            written += target.write(buffer[written:read])
+        offset += read
+    return offset
+
+def transfer(source: BinaryIO, target: BinaryIO, size: int) -> int:
+    """
+    Copies size bytes between unbuffered files: copy_file_range (in-kernel, reflinks
+    on CoW file systems), then sendfile, then reads with a large buffer.
+    Every method continues from where the previous one gave up.
+    Returns the number of bytes copied, less than size if the source ended early.
+    """
+    offset = 0
+    if zero_copy_available["copy_file_range"]:
+        offset = _copy_file_range(source, target, offset, size)
+    if offset < size and zero_copy_available["sendfile"]:
+        offset = _sendfile(source, target, offset, size)
+    if offset < size:
+        offset = _copy_buffered(source, target, offset, size)
+    return offset
+
+def copy_file(source_path: str, target_path: str, size: int):
+    """
+    Copies a file with its modification time. The data goes to a .part file that is
+    renamed over target_path once complete, so target_path never holds a partial copy.
+    Raises OSError if the file can't be copied or its size differs from the indexed one.
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    part_path = target_path + PART_SUFFIX
+    with open(source_path, "rb", buffering=0) as source:
+        stat_result = os.fstat(source.fileno())
+        if stat_result.st_size != size:
+            raise OSError(f"size changed since the scan: {size} -> {stat_result.st_size}")
+        try:
+            with open(part_path, "wb", buffering=0) as target:
+                copied = transfer(source, target, size)
+            if copied != size:
+                raise OSError(f"file ended after {copied} of {size} bytes")
+            os.utime(part_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+            os.replace(part_path, target_path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+
+
+class Exporter:
+    """
+    Copies the files of output_files into target_root.
+    Volumes are grouped by drive_name and every drive is read by one pool task,
+    so a spinning disk never serves two readers; the pool size bounds how many
+    drives are read at once. Readers stream output_files in CHUNK_SIZE chunks over
+    their own read-only connections and hand the results to the calling thread,
+    which records copied_at in batched commits.
+    """
+
+    def __init__(self, db_conn: sqlite3.Connection, db_path: str, target_root: str,
+                 volume_roots: dict[str, str], workers: int = DEFAULT_WORKERS) -> None:
+        self.db_conn = db_conn
+        self.db_path = db_path
+        self.target_root = target_root
+        self.volume_roots = volume_roots
+        self.workers = workers
+        self.result = ExportResult()
+        self._results: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._running_readers = 0
+
+    def run(self) -> ExportResult:
+        drives = self._get_drives()
+        volume_ids = [volume_id for volumes in drives.values() for volume_id in volumes]
+        if not volume_ids:
+            return self.result
+        pending_files, pending_bytes = self.db_conn.execute(
+            PENDING_SIZE_QUERY.format(volumes=", ".join("?" * len(volume_ids))), volume_ids).fetchone()
+        write_line(f"Files to copy: {pending_files}, {format_bytes(pending_bytes)}")
+
+        progress = ScanProgress("Copied", total_bytes=pending_bytes)
+        self._running_readers = len(drives)
+        with progress, ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(drives)))) as pool:
+            for volumes in drives.values():
+                pool.submit(self._read_drive, volumes)
+            try:
+                self._collect(progress)
+            except BaseException:
+                # let the readers finish their current files and record what is already copied
+                self._stopped.set()
+                self._collect(progress)
+                raise
+        return self.result
+
+    def _get_drives(self) -> dict[str, dict[int, str]]:
+        """drive key -> {volume_id: root path} of the attached volumes."""
+        drives = {}
+        for volume_id, volume_guid, drive_key in self.db_conn.execute(VOLUMES_QUERY):
+            root_path = self.volume_roots.get(volume_guid)
+            if root_path is None:
+                self.result.skipped_volumes.append(volume_guid)
+                continue
+            drives.setdefault(drive_key, {})[volume_id] = root_path
+        return drives
+
+    def _read_drive(self, volume_roots: dict[int, str]):
+        conn = None
+        try:
+            conn = connect_readonly(self.db_path)
+            directory_paths = DirectoryPaths(conn)
+            query = PENDING_QUERY.format(volumes=", ".join("?" * len(volume_roots)))
+            last_id = 0
+            while not self._stopped.is_set():
+                rows = conn.execute(query, (last_id, *volume_roots, CHUNK_SIZE)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                for _, file_id, out_path, group_dir, group_name, volume_id, dir_id, name, size in rows:
+                    if self._stopped.is_set():
+                        break
+                    dir_path = directory_paths.get(dir_id)
+                    if dir_path is None:
+                        continue
+                    source_path = to_native_path(volume_roots[volume_id], join_relative_path(dir_path, name))
+                    try:
+                        copy_file(source_path, get_target_path(self.target_root, out_path, group_dir, group_name), size)
+                    except OSError as e:
+                        self._results.put((RESULT_FAILED, file_id, f"Error copying file {source_path}: {e}"))
+                        continue
+                    self._results.put((RESULT_COPIED, file_id, size, time.time_ns()))
+        except BaseException as e:
+            self._stopped.set()
+            self._results.put((RESULT_ERROR, e))
+        finally:
+            if conn is not None:
+                conn.close()
+            self._results.put((RESULT_DONE,))
+
+    def _collect(self, progress: ScanProgress):
+        records = []
+        error = None
+        committed_at = time.monotonic()
+        try:
+            while self._running_readers:
+                try:
+                    result = self._results.get(timeout=COMMIT_INTERVAL)
+                except queue.Empty:
+                    result = None
+                if result is None:
+                    pass
+                elif result[0] == RESULT_COPIED:
+                    records.append((result[1], result[3]))
+                    self.result.copied_files += 1
+                    self.result.copied_bytes += result[2]
+                    progress.add_file(result[2])
+                elif result[0] == RESULT_FAILED:
+                    self.result.failed_files += 1
+                    write_line(result[2])
+                elif result[0] == RESULT_ERROR:
+                    error = error or result[1]
+                else:
+                    self._running_readers -= 1
+                if records and (len(records) >= COMMIT_ROWS or time.monotonic() - committed_at >= COMMIT_INTERVAL):
+                    self._commit(records)
+                    records = []
+                    committed_at = time.monotonic()
+        finally:
+            self._commit(records)
+        if error is not None:
+            raise error
+
+    def _commit(self, records: list[tuple[int, int]]):
+        if records:
+            mark_files_copied(self.db_conn, records)
+        self.db_conn.commit()
+
+    pass
+
+
+def export_index(db_path: str, target_root: str, workers: int = DEFAULT_WORKERS,
+                 provider: Optional[VolumeProvider] = None) -> ExportResult:
+    """Copies the not yet exported files of all volumes that are currently attached."""
+    volume_roots = {volume.volume_guid: volume.root_path for volume in get_volumes(provider)}
+    db_conn = connect(db_path)
+    try:
+        return Exporter(db_conn, db_path, target_root, volume_roots, workers).run()
+    finally:
+        db_conn.close()
+
+def reset_export(db_path: str) -> int:
+    """Forgets copied_at of all files, so the next export copies everything again."""
+    db_conn = connect(db_path)
+    try:
+        reset = db_conn.execute("UPDATE unique_files SET copied_at = NULL WHERE copied_at IS NOT NULL").rowcount
+        db_conn.commit()
+    finally:
+        db_conn.close()
+    return reset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copies the combined files into a target directory")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--target", help="directory the files are copied into")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="drives read at the same time")
+    parser.add_argument("--root", action="append",
+                        help="directory indexed as a volume with collector.py --root (repeatable)")
+    parser.add_argument("--reset", action="store_true", help="forget which files were copied and exit")
+    args = parser.parse_args()
+
+    if args.reset:
+        write_line(f"Reset {reset_export(args.db)} copied files")
+    elif not args.target:
+        parser.error("--target is required")
+    else:
+        try:
+            result = export_index(args.db, args.target, args.workers,
+                                  DirectoryVolumeProvider(args.root) if args.root else None)
+        except KeyboardInterrupt:
+            write_line("Export interrupted, run it again to continue")
+        else:
+            for volume_guid in result.skipped_volumes:
+                write_line(f"Volume {volume_guid} is not attached, its files are skipped")
+            write_line(f"Copied {result.copied_files} files, {format_bytes(result.copied_bytes)}; "
+                       f"failed: {result.failed_files}")
\ No newline at end of file
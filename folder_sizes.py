@@ -0,0 +1,123 @@
+"""
+Размеры папок по таблице directory_rollups: самые большие папки тома
+и содержимое папки по размеру (уровень для treemap-отчётов).
+"""
+
+import argparse
+import sqlite3
+from typing import Optional
+
+from console import write_line
+from database import connect_readonly, get_directory_state
+from directory_cache import DirectoryPaths
+from utils import format_bytes
+from walker import join_relative_path
+
+
+DB_PATH = "index.db"
+DEFAULT_TOP = 20
+
+VOLUME_FILTER_SQL = "(v.volume_guid = :volume OR v.letter = :volume OR v.label = :volume)"
+
+# walks idx_directory_rollups_total_bytes from the largest rollup down; volume roots are left out
+LARGEST_QUERY = """
+    SELECT r.directory_id, v.letter, r.total_bytes, r.file_count, r.subdir_count
+    FROM directory_rollups r
+    JOIN directories d ON d.id = r.directory_id
+    JOIN volumes v ON v.id = d.volume_id
+    WHERE d.parent_id IS NOT NULL AND {volume_filter}
+    ORDER BY r.total_bytes DESC
+    LIMIT :top
+"""
+
+CHILDREN_QUERY = """
+    SELECT c.name, r.total_bytes, r.file_count, r.subdir_count
+    FROM directories c
+    LEFT JOIN directory_rollups r ON r.directory_id = c.id
+    WHERE c.parent_id = ?
+    ORDER BY r.total_bytes DESC
+"""
+
+
+class FolderSize:
+    """Rollup of one folder; None totals mean the folder is not fully indexed."""
+    letter: str
+    path: str
+    total_bytes: Optional[int]
+    file_count: Optional[int]
+    subdir_count: Optional[int]
+
+    def __init__(self, letter: str, path: str, total_bytes: Optional[int],
+                 file_count: Optional[int], subdir_count: Optional[int]) -> None:
+        self.letter = letter
+        self.path = path
+        self.total_bytes = total_bytes
+        self.file_count = file_count
+        self.subdir_count = subdir_count
+
+    pass
+
+
+def find_volume(db_conn: sqlite3.Connection, volume: str) -> Optional[tuple[int, str]]:
+    """(id, letter) of the volume with the given guid, letter or label."""
+    return db_conn.execute(
+        f"SELECT v.id, v.letter FROM volumes v WHERE {VOLUME_FILTER_SQL} ORDER BY v.id", {"volume": volume}
+    ).fetchone()
+
+def largest_folders(db_conn: sqlite3.Connection, volume: Optional[str] = None, top: int = DEFAULT_TOP) -> list[FolderSize]:
+    """The largest folders of all volumes or of one volume (guid, letter or label)."""
+    query = LARGEST_QUERY.format(volume_filter=VOLUME_FILTER_SQL if volume else "true")
+    directory_paths = DirectoryPaths(db_conn)
+    return [FolderSize(letter, directory_paths.get(dir_id), total_bytes, file_count, subdir_count)
+            for dir_id, letter, total_bytes, file_count, subdir_count
+            in db_conn.execute(query, {"volume": volume, "top": top})]
+
+def folder_contents(db_conn: sqlite3.Connection, volume_id: int, path: str) -> Optional[tuple[FolderSize, list[FolderSize]]]:
+    """
+    The rollup of a folder and of each of its subfolders, largest first.
+    Returns None if the folder is not in the index.
+    """
+    state = get_directory_state(db_conn, volume_id, path)
+    if state is None:
+        return None
+    letter = db_conn.execute("SELECT letter FROM volumes WHERE id = ?", (volume_id,)).fetchone()[0]
+    row = db_conn.execute(
+        "SELECT total_bytes, file_count, subdir_count FROM directory_rollups WHERE directory_id = ?", (state[0],)
+    ).fetchone()
+    folder = FolderSize(letter, path, *(row or (None, None, None)))
+    children = [FolderSize(letter, join_relative_path(path, name), total_bytes, file_count, subdir_count)
+                for name, total_bytes, file_count, subdir_count in db_conn.execute(CHILDREN_QUERY, (state[0],))]
+    return folder, children
+
+def format_folder(folder: FolderSize) -> str:
+    if folder.total_bytes is None:
+        return f"{folder.letter}:\\{folder.path}  (not indexed)"
+    return (f"{folder.letter}:\\{folder.path}  {format_bytes(folder.total_bytes)}, "
+            f"{folder.file_count} files, {folder.subdir_count} folders")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows folder sizes of the index")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--volume", help="volume letter, label or guid")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="number of largest folders to show")
+    parser.add_argument("--path", help="list the subfolders of this folder (requires --volume)")
+    args = parser.parse_args()
+
+    db_conn = connect_readonly(args.db)
+    if args.path is not None:
+        if not args.volume:
+            parser.error("--path requires --volume")
+        volume_row = find_volume(db_conn, args.volume)
+        contents = folder_contents(db_conn, volume_row[0], args.path.strip("\\/").replace("/", "\\")) if volume_row else None
+        if contents is None:
+            write_line(f"Folder {args.path} is not in the index")
+        else:
+            folder, children = contents
+            write_line(format_folder(folder))
+            for child in children:
+                write_line("  " + format_folder(child))
+    else:
+        for folder in largest_folders(db_conn, args.volume, args.top):
+            write_line(format_folder(folder))
+    db_conn.close()
\ No newline at end of file
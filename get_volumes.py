@@ -1,52 +1,185 @@
-from win32com.client import GetObject
-from console import clear
-
-
-class VolumeInfo:
-    """Information about a volume."""
-    letter: str
-    volume_guid: str
-    label: str
-    filesystem: str
-
-    def __init__(self, letter: str, volume_guid: str, label: str, filesystem: str) -> None:
-        self.letter = letter
-        self.volume_guid = volume_guid
-        self.label = label
-        self.filesystem = filesystem
-    
-    pass
-
-
-def get_volumes() -> list[VolumeInfo]:
-    """Obtains the attahced volumes with their IDs, letters, labels, fs."""
-    result = []
-    wmi = GetObject("winmgmts:")
-    query = "SELECT DriveLetter, DeviceID, Label, FileSystem FROM Win32_Volume WHERE DriveLetter IS NOT NULL"
-    volumes = wmi.ExecQuery(query)
-
-    for vol in volumes:
-        device_id = vol.DeviceID or ""
-        if device_id.startswith("\\\\?\\Volume{") and device_id.endswith("}\\"):
-            device_id = device_id[10:-1] # {00000000-0000-0000-0000-600632000000}
-
-        item = VolumeInfo(
-            vol.DriveLetter.rstrip(":"), 
-            device_id, 
-            (vol.Label or "").strip(), 
-            (vol.FileSystem or "").strip()
-        )
-        result.append(item)
-
-    return result
-
-
-if __name__ == "__main__":
-    clear()
-    items = get_volumes()
-    for volumeInfo in items:
-        print(f"Буква: {volumeInfo.letter}")
-        print(f"Volume GUID: {volumeInfo.volume_guid}")
-        print(f"Метка: {volumeInfo.label}")
-        print(f"Файловая система: {volumeInfo.filesystem}")
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from console import clear
+
+
+class VolumeInfo:
+    """Information about a volume."""
+    letter: str
+    volume_guid: str
+    label: str
+    filesystem: str
+    root_path: str
+
+    def __init__(self, letter: str, volume_guid: str, label: str, filesystem: str,
+                 root_path: str|None = None) -> None:
+        self.letter = letter
+        self.volume_guid = volume_guid
+        self.label = label
+        self.filesystem = filesystem
+        self.root_path = root_path if root_path is not None else letter + ":\\"
+
+    pass
+
+
+class VolumeProvider(ABC):
+    """
+    Source of the volumes to index. `letter` is what the user types to select a volume,
+    `volume_guid` must stay the same between runs, since the index is keyed by it.
+    """
+
+    @abstractmethod
+    def get_volumes(self) -> list[VolumeInfo]:
+        pass
+
+    pass
+
+
+class WmiVolumeProvider(VolumeProvider):
+    """Windows volumes with drive letters, obtained through WMI."""
+
+    def get_volumes(self) -> list[VolumeInfo]:
+        """Obtains the attahced volumes with their IDs, letters, labels, fs."""
+        from win32com.client import GetObject
+
+        result = []
+        wmi = GetObject("winmgmts:")
+        query = "SELECT DriveLetter, DeviceID, Label, FileSystem FROM Win32_Volume WHERE DriveLetter IS NOT NULL"
+        volumes = wmi.ExecQuery(query)
+
+        for vol in volumes:
+            device_id = vol.DeviceID or ""
+            if device_id.startswith("\\\\?\\Volume{") and device_id.endswith("}\\"):
+                device_id = device_id[10:-1] # {00000000-0000-0000-0000-600632000000}
+
+            item = VolumeInfo(
+                vol.DriveLetter.rstrip(":"),
+                device_id,
+                (vol.Label or "").strip(),
+                (vol.FileSystem or "").strip()
+            )
+            result.append(item)
+
+        return result
+
+    pass
+
+
+# Filesystems without files worth indexing
+PSEUDO_FILESYSTEMS = frozenset([
+    "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs", "debugfs", "devpts",
+    "devtmpfs", "efivarfs", "fusectl", "hugetlbfs", "mqueue", "nsfs", "proc", "pstore",
+    "ramfs", "rpc_pipefs", "securityfs", "squashfs", "sysfs", "tmpfs", "tracefs",
+])
+
+
+class PosixVolumeProvider(VolumeProvider):
+    """
+    Mount points from /proc/self/mountinfo. The mount point is used as the letter.
+    The volume id is the filesystem UUID from /dev/disk/by-uuid, or the device number
+    (st_dev) when the filesystem has no UUID. Bind mounts of the same filesystem
+    directory are reported once.
+    """
+    mountinfo_path: str
+
+    def __init__(self, mountinfo_path: str = "/proc/self/mountinfo") -> None:
+        self.mountinfo_path = mountinfo_path
+
+    def get_volumes(self) -> list[VolumeInfo]:
+        uuids = _read_device_links("/dev/disk/by-uuid")
+        labels = _read_device_links("/dev/disk/by-label")
+        result = []
+        seen = set()
+        with open(self.mountinfo_path, encoding="utf-8") as mountinfo:
+            for line in mountinfo:
+                # 28 1 254:0 / / rw,relatime - ext4 /dev/vda rw
+                fields, _, fs_fields = line.rstrip("\n").partition(" - ")
+                fields = fields.split(" ")
+                fs_fields = fs_fields.split(" ")
+                if len(fields) < 5 or len(fs_fields) < 2:
+                    continue
+                filesystem = fs_fields[0]
+                if filesystem in PSEUDO_FILESYSTEMS:
+                    continue
+                device, fs_root, mount_point = fields[2], _unescape(fields[3]), _unescape(fields[4])
+                if (device, fs_root) in seen:
+                    continue
+                seen.add((device, fs_root))
+
+                volume_guid = uuids.get(device) or f"dev-{device}"
+                if fs_root != "/":
+                    volume_guid += fs_root
+                label = labels.get(device) or os.path.basename(mount_point) or mount_point
+                result.append(VolumeInfo(mount_point, volume_guid, label, filesystem, root_path=mount_point))
+
+        return result
+
+    pass
+
+
+class DirectoryVolumeProvider(VolumeProvider):
+    """
+    Arbitrary directories indexed as separate volumes, e.g. synthetic trees for benchmarks.
+    The volume id is derived from the absolute path, so the same directory keeps its index.
+    """
+    roots: list[str]
+
+    def __init__(self, roots: list[str]) -> None:
+        self.roots = roots
+
+    def get_volumes(self) -> list[VolumeInfo]:
+        result = []
+        for root in self.roots:
+            root_path = os.path.abspath(root)
+            if not os.path.isdir(root_path):
+                continue
+            volume_guid = "{" + str(uuid.uuid5(uuid.NAMESPACE_URL, "file:" + root_path)) + "}"
+            result.append(VolumeInfo(root_path, volume_guid, os.path.basename(root_path) or root_path,
+                                     "directory", root_path=root_path))
+        return result
+
+    pass
+
+
+def _unescape(value: str) -> str:
+    """Decodes the octal escapes (\\040 for a space) used in mountinfo."""
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), value)
+
+def _read_device_links(links_dir: str) -> dict[str, str]:
+    """Maps "major:minor" of a block device to the name of its link in /dev/disk/by-*."""
+    result = {}
+    try:
+        entries = os.scandir(links_dir)
+    except OSError:
+        return result
+    with entries:
+        for entry in entries:
+            try:
+                rdev = os.stat(entry.path).st_rdev
+            except OSError:
+                continue
+            # udev escapes spaces and other unsafe characters as \x20
+            name = re.sub(r"\\x([0-9a-fA-F]{2})", lambda match: chr(int(match.group(1), 16)), entry.name)
+            result[f"{os.major(rdev)}:{os.minor(rdev)}"] = name
+    return result
+
+def get_volume_provider() -> VolumeProvider:
+    """The provider of the current platform."""
+    return WmiVolumeProvider() if os.name == "nt" else PosixVolumeProvider()
+
+def get_volumes(provider: VolumeProvider|None = None) -> list[VolumeInfo]:
+    """Obtains the attahced volumes with their IDs, letters, labels, fs."""
+    return (provider or get_volume_provider()).get_volumes()
+
+
+if __name__ == "__main__":
+    clear()
+    items = get_volumes()
+    for volumeInfo in items:
+        print(f"Буква: {volumeInfo.letter}")
+        print(f"Volume GUID: {volumeInfo.volume_guid}")
+        print(f"Метка: {volumeInfo.label}")
+        print(f"Файловая система: {volumeInfo.filesystem}")
         print("-" * 50)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Поиск дубликатов по содержимому: заполняет unique_files.hash.
+Файлы сначала группируются по размеру, затем хэшируются первые и последние
+блоки, и только оставшиеся совпадения читаются целиком.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from console import write, write_line
+from database import (apply_hash_cache, connect, save_file_hashes,
+    store_cached_hashes, vacuum_hash_cache)
+from directory_cache import DirectoryPaths
+from get_volumes import DirectoryVolumeProvider, get_volumes, VolumeProvider
+from utils import format_bytes
+from walker import join_relative_path, to_native_path
+
+
+DB_PATH = "index.db"
+HASH_ALGORITHM = "sha256"
+PARTIAL_BLOCK_SIZE = 64 * 1024     # bytes read from the start and from the end of a file
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+MIN_FILE_SIZE = 1                  # empty files are equal anyway
+DEFAULT_WORKERS = 8
+CHUNK_SIZE = 1000
+
+# (file_id, volume_guid, directory path, file name, size);
+# the queries return the directory id in place of the path
+FileRow = tuple[int, str, str, str, int]
+
+PARTIAL_CANDIDATES_QUERY = """
+    SELECT f.id, v.volume_guid, f.directory_id, f.name, f.size
+    FROM files f
+    JOIN directories d ON d.id = f.directory_id
+    JOIN volumes v ON v.id = d.volume_id
+    LEFT JOIN unique_files u ON u.file_id = f.id
+    WHERE f.id > ?
+      AND f.size IN (SELECT size FROM temp.candidate_sizes)
+      AND u.partial_hash IS NULL
+    ORDER BY f.id
+    LIMIT ?
+"""
+
+FULL_CANDIDATES_QUERY = """
+    SELECT f.id, v.volume_guid, f.directory_id, f.name, f.size
+    FROM unique_files u
+    JOIN files f ON f.id = u.file_id
+    JOIN directories d ON d.id = f.directory_id
+    JOIN volumes v ON v.id = d.volume_id
+    WHERE f.id > ?
+      AND u.hash IS NULL
+      AND u.partial_hash IS NOT NULL
+      AND EXISTS (
+          SELECT 1 FROM unique_files u2
+          JOIN files f2 ON f2.id = u2.file_id
+          WHERE u2.partial_hash = u.partial_hash AND f2.size = f.size AND u2.file_id <> u.file_id
+      )
+    ORDER BY f.id
+    LIMIT ?
+"""
+
+
+def hash_partial(path: str, size: int) -> tuple[str, Optional[str]]:
+    """
+    Hashes the first and the last PARTIAL_BLOCK_SIZE bytes.
+    A file that fits into these blocks is read completely, so its partial hash is the full hash too.
+    Returns (partial_hash, hash or None).
+    """
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(path, "rb", buffering=0) as f:
+        if os.fstat(f.fileno()).st_size != size:
+            raise OSError(f"size changed since the scan: {path}")
+        if size <= 2 * PARTIAL_BLOCK_SIZE:
+            digest.update(f.read())
+            value = digest.hexdigest()
+            return value, value
+        digest.update(f.read(PARTIAL_BLOCK_SIZE))
+        f.seek(-PARTIAL_BLOCK_SIZE, os.SEEK_END)
+        digest.update(f.read(PARTIAL_BLOCK_SIZE))
+    return digest.hexdigest(), None
+
+def hash_full(path: str, size: int) -> str:
+    """Hashes the whole file with large unbuffered reads into a reused buffer."""
+    digest = hashlib.new(HASH_ALGORITHM)
+    buffer = bytearray(READ_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if os.fstat(f.fileno()).st_size != size:
+            raise OSError(f"size changed since the scan: {path}")
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+class ContentHasher:
+    """
+    Runs the hashing stages over index.db. Every chunk of results is committed,
+    so an interrupted run continues with the files that have no hash yet.
+    """
+
+    def __init__(self, db_conn: sqlite3.Connection, volume_roots: dict[str, str],
+                 workers: int = DEFAULT_WORKERS) -> None:
+        self.db_conn = db_conn
+        self.volume_roots = volume_roots
+        self.workers = workers
+        self.directory_paths = DirectoryPaths(db_conn)
+        self.hashed_files = 0
+        self.hashed_size = 0
+
+    def run(self):
+        inherited = apply_hash_cache(self.db_conn)
+        self.db_conn.commit()
+        write_line(f"Hashes taken from the cache: {inherited}")
+
+        # Sizes shared by several files are computed once, not per chunk
+        self.db_conn.execute("DROP TABLE IF EXISTS temp.candidate_sizes")
+        self.db_conn.execute(
+            "CREATE TEMP TABLE candidate_sizes (size INTEGER PRIMARY KEY)")
+        self.db_conn.execute(
+            "INSERT INTO temp.candidate_sizes "
+            "SELECT size FROM files WHERE size >= ? GROUP BY size HAVING COUNT(*) > 1",
+            (MIN_FILE_SIZE,))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            write_line("Hashing first and last blocks of files with equal sizes...")
+            self._run_stage(pool, PARTIAL_CANDIDATES_QUERY, self._partial_task)
+            write_line("Hashing whole files with equal partial hashes...")
+            self._run_stage(pool, FULL_CANDIDATES_QUERY, self._full_task)
+
+    def _run_stage(self, pool: ThreadPoolExecutor, query: str, task):
+        last_id = 0
+        while True:
+            rows = self.db_conn.execute(query, (last_id, CHUNK_SIZE)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            rows = [(file_id, volume_guid, self.directory_paths.get(dir_id), name, size)
+                    for file_id, volume_guid, dir_id, name, size in rows]
+            file_paths = {row[0]: (row[1], join_relative_path(row[2], row[3])) for row in rows if row[2] is not None}
+            records = []
+            for result in pool.map(task, rows):
+                if result is None:
+                    continue
+                record, bytes_read = result
+                records.append(record)
+                self.hashed_files += 1
+                self.hashed_size += bytes_read
+            save_file_hashes(self.db_conn, records)
+            store_cached_hashes(self.db_conn, [(record[0], *file_paths[record[0]]) for record in records])
+            self.db_conn.commit()
+            write(f"\rHashed {self.hashed_files} files, {format_bytes(self.hashed_size)}")
+
+    def _resolve_path(self, row: FileRow) -> Optional[str]:
+        root_path = self.volume_roots.get(row[1])
+        if root_path is None or row[2] is None:
+            return None
+        return to_native_path(root_path, join_relative_path(row[2], row[3]))
+
+    def _partial_task(self, row: FileRow) -> Optional[tuple]:
+        path = self._resolve_path(row)
+        if path is None:
+            return None
+        try:
+            partial_hash, full_hash = hash_partial(path, row[4])
+        except OSError as e:
+            write_line(f"Error reading file {path}: {e}")
+            return None
+        return (row[0], partial_hash, full_hash), min(row[4], 2 * PARTIAL_BLOCK_SIZE)
+
+    def _full_task(self, row: FileRow) -> Optional[tuple]:
+        path = self._resolve_path(row)
+        if path is None:
+            return None
+        try:
+            full_hash = hash_full(path, row[4])
+        except OSError as e:
+            write_line(f"Error reading file {path}: {e}")
+            return None
+        return (row[0], None, full_hash), row[4]
+
+    pass
+
+
+def hash_index(db_path: str, workers: int = DEFAULT_WORKERS, provider: Optional[VolumeProvider] = None):
+    """Hashes the duplicate candidates of all volumes that are currently attached."""
+    volume_roots = {volume.volume_guid: volume.root_path for volume in get_volumes(provider)}
+    db_conn = connect(db_path)
+    try:
+        ContentHasher(db_conn, volume_roots, workers).run()
+    finally:
+        db_conn.close()
+    write_line("Hashing completed")
+
+def vacuum_cache(db_path: str):
+    """Evicts the hash cache entries of files that are gone from the index."""
+    db_conn = connect(db_path)
+    evicted = vacuum_hash_cache(db_conn)
+    db_conn.commit()
+    db_conn.close()
+    write_line(f"Evicted {evicted} hash cache entries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finds content duplicates among the indexed files")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="reader threads")
+    parser.add_argument("--vacuum-cache", action="store_true",
+                        help="only evict hash cache entries of files that are gone from the index")
+    parser.add_argument("--root", action="append",
+                        help="directory indexed as a volume with collector.py --root (repeatable)")
+    args = parser.parse_args()
+    try:
+        if args.vacuum_cache:
+            vacuum_cache(args.db)
+        else:
+            hash_index(args.db, args.workers, DirectoryVolumeProvider(args.root) if args.root else None)
+    except KeyboardInterrupt:
+        write_line("Canceled by user, hashed files are saved")
\ No newline at end of file
@@ -1,23 +1,135 @@
-ignored_folders = [
-    "Program Files",
-    "Program Files (x86)",
-    "ProgramData",
-    "Documents and Settings",
-    "System Volume Information",
-    "MSOCache",
-    "PerfLogs",
-    "Windows",
-    "$Recycle.Bin",
-    "$WinREAgent",
-    "Users\\All Users",
-    "Users\\Default",
-    "Users\\Default User",
-    "Users\\Public",
-    "Users\\Все пользователи"
-]
-
-ignored_files = [
-    "hiberfil.sys",
-    "pagefile.sys",
-    "swapfile.sys"
-]
\ No newline at end of file
+import fnmatch
+import re
+from typing import Iterable, Optional
+
+
+ignored_folders = [
+    "Program Files",
+    "Program Files (x86)",
+    "ProgramData",
+    "Documents and Settings",
+    "System Volume Information",
+    "MSOCache",
+    "PerfLogs",
+    "Windows",
+    "$Recycle.Bin",
+    "$WinREAgent",
+    "Users\\All Users",
+    "Users\\Default",
+    "Users\\Default User",
+    "Users\\Public",
+    "Users\\Все пользователи"
+]
+
+ignored_files = [
+    "hiberfil.sys",
+    "pagefile.sys",
+    "swapfile.sys"
+]
+
+
+class IgnoreRules:
+    """
+    Ignore rules compiled once per scan. A rule containing a path separator (or starting
+    with one) is anchored at the volume root and matched against the relative path;
+    any other rule is matched against the entry name at every depth.
+    Rules without wildcards go into case-folded frozensets, glob rules (*, ?, [...])
+    are joined into one case-insensitive regular expression per kind.
+    """
+
+    def __init__(self, folders: Iterable[str] = (), files: Iterable[str] = ()) -> None:
+        self._folders = _CompiledRules(folders)
+        self._files = _CompiledRules(files)
+
+    def is_ignored_folder(self, path: str, name: str) -> bool:
+        """path is the stored relative path of the folder, name its last segment."""
+        return self._folders.matches(path, name)
+
+    def is_ignored_file(self, path: str, name: str) -> bool:
+        """path is the stored relative path of the file, name the file name."""
+        return self._files.matches(path, name)
+
+    pass
+
+
+class _CompiledRules:
+
+    def __init__(self, rules: Iterable[str]) -> None:
+        paths, names, path_patterns, name_patterns = set(), set(), [], []
+        for rule in rules:
+            rule = rule.strip().replace("/", "\\")
+            anchored = "\\" in rule
+            rule = rule.strip("\\").casefold()
+            if not rule:
+                continue
+            is_pattern = any(char in rule for char in "*?[")
+            if anchored and is_pattern:
+                path_patterns.append(rule)
+            elif anchored:
+                paths.add(rule)
+            elif is_pattern:
+                name_patterns.append(rule)
+            else:
+                names.add(rule)
+        self.paths = frozenset(paths)
+        self.names = frozenset(names)
+        self.path_regex = _compile_patterns(path_patterns)
+        self.name_regex = _compile_patterns(name_patterns)
+
+    def matches(self, path: str, name: str) -> bool:
+        path_key = path.casefold()
+        if path_key in self.paths:
+            return True
+        name_key = name.casefold()
+        if name_key in self.names:
+            return True
+        if self.path_regex is not None and self.path_regex.match(path_key):
+            return True
+        return self.name_regex is not None and self.name_regex.match(name_key) is not None
+
+    pass
+
+
+def _compile_patterns(patterns: list[str]) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns), re.IGNORECASE)
+
+def default_ignore_rules() -> IgnoreRules:
+    """The built-in lists above; their entries are paths from the volume root."""
+    return IgnoreRules(_anchored(ignored_folders), _anchored(ignored_files))
+
+def _anchored(rules: list[str]) -> list[str]:
+    return ["\\" + rule for rule in rules]
+
+def load_ignore_rules(config_path: Optional[str]) -> IgnoreRules:
+    """
+    Built-in rules extended with the rules of a config file:
+
+        # comment
+        [folders]
+        node_modules
+        \\Users\\*\\AppData\\Local\\Temp
+        [files]
+        *.tmp
+    """
+    if not config_path:
+        return default_ignore_rules()
+
+    folders = _anchored(ignored_folders)
+    files = _anchored(ignored_files)
+    section = None
+    with open(config_path, encoding="utf-8") as config:
+        for line_number, line in enumerate(config, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.lower() == "[folders]":
+                section = folders
+            elif line.lower() == "[files]":
+                section = files
+            elif section is None:
+                raise ValueError(f"{config_path}:{line_number}: rule outside of a [folders] or [files] section")
+            else:
+                section.append(line)
+    return IgnoreRules(folders, files)
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Пакетная запись результатов сканирования в index.db.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Callable, Optional
+
+import instrumentation
+from database import (delete_directory_tree, delete_file_records,
+    get_child_directories, get_directory_files, insert_directory,
+    insert_file_records, make_file_record, mark_directory_as_indexed,
+    same_timestamp, update_directory_rollup, update_directory_state, update_file_records)
+from walker import split_parent_path
+
+
+DEFAULT_BATCH_ROWS = 20000
+DEFAULT_BATCH_SECONDS = 5.0
+
+
+class IndexWriter:
+    """
+    Buffers file rows of the directories being scanned and writes them with executemany.
+    The transaction is committed when batch_rows rows were written or batch_seconds elapsed
+    since the last commit, and always right after a directory is marked as indexed,
+    so a resumed scan skips exactly the directories that reached the disk.
+    on_commit, if set, is called right before every commit, so whatever it writes
+    (a scan checkpoint) lands in the same transaction as the rows it describes.
+    """
+    db_conn: sqlite3.Connection
+    batch_rows: int
+    batch_seconds: float
+    on_commit: Optional[Callable[[], None]]
+
+    def __init__(self, db_conn: sqlite3.Connection, batch_rows: int = DEFAULT_BATCH_ROWS,
+                 batch_seconds: float = DEFAULT_BATCH_SECONDS) -> None:
+        self.db_conn = db_conn
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self._pending_files: list[tuple] = []
+        self._uncommitted_rows = 0
+        self._last_commit = time.monotonic()
+        self.on_commit = None
+
+    def ensure_directory(self, volume_id: int, parent_id: Optional[int], path: str, stat_result: os.stat_result,
+                         dir_id: Optional[int] = None) -> int:
+        """
+        Returns a new or existing directory record ID.
+        A dir_id already known to the caller (e.g. from the DirectoryCache) is returned as is,
+        None means the caller knows the directory is missing and it is inserted without a lookup
+        under parent_id (None for the root of the volume).
+        """
+        if dir_id is not None:
+            return dir_id
+        dir_id = insert_directory(self.db_conn, volume_id, parent_id, split_parent_path(path)[1],
+                                  stat_result, indexed_at=None)
+        self._uncommitted_rows += 1
+        return dir_id
+
+    def add_file(self, dir_id: int, name: str, stat_result: os.stat_result):
+        """Queues a file record; it is written at the latest when its directory is marked as indexed."""
+        self._pending_files.append(make_file_record(dir_id, name, stat_result))
+        if len(self._pending_files) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes the queued file records and commits if the batch limits are reached."""
+        if self._pending_files:
+            insert_file_records(self.db_conn, self._pending_files)
+            self._uncommitted_rows += len(self._pending_files)
+            self._pending_files = []
+        if (self._uncommitted_rows >= self.batch_rows
+                or time.monotonic() - self._last_commit >= self.batch_seconds):
+            self.commit()
+
+    def mark_directory_as_indexed(self, dir_id: int, timestamp: Optional[float] = None):
+        """Writes the queued records, marks the directory as indexed and commits."""
+        if self._pending_files:
+            insert_file_records(self.db_conn, self._pending_files)
+            self._pending_files = []
+        mark_directory_as_indexed(self.db_conn, dir_id, timestamp if timestamp is not None else time.time())
+        self.commit()
+
+    def sync_directory(self, volume_id: int, parent_id: Optional[int], path: str, dir_id: Optional[int],
+                       stat_result: os.stat_result, files: list[tuple[str, os.stat_result]],
+                       subdir_names: list[str]) -> tuple[int, int, int, int]:
+        """
+        Brings the records of a rescanned directory in line with its fresh listing:
+        new files are inserted, changed ones (size or mtime) updated, vanished files
+        and subdirectory trees deleted. The directory gets its current timestamps
+        and is committed as indexed.
+        Returns (dir_id, added, updated, removed) where the counts are file records.
+        """
+        if dir_id is None:
+            dir_id = self.ensure_directory(volume_id, parent_id, path, stat_result)
+            existing = {}
+        else:
+            existing = get_directory_files(self.db_conn, dir_id)
+
+        new_records = []
+        changed_records = []
+        for name, file_stat in files:
+            record = make_file_record(dir_id, name, file_stat)
+            known = existing.pop(name, None)
+            if known is None:
+                new_records.append(record)
+            elif known[1] != record[2] or not same_timestamp(known[2], record[4]):
+                changed_records.append(record)
+
+        insert_file_records(self.db_conn, new_records)
+        update_file_records(self.db_conn, changed_records)
+        delete_file_records(self.db_conn, [file_id for file_id, _, _ in existing.values()])
+        removed = len(existing)
+
+        present_subdirs = set(subdir_names)
+        for subdir_name, subdir_id in get_child_directories(self.db_conn, dir_id).items():
+            if subdir_name not in present_subdirs:
+                removed += delete_directory_tree(self.db_conn, subdir_id)
+
+        update_directory_state(self.db_conn, dir_id, stat_result)
+        self.mark_directory_as_indexed(dir_id)
+        return dir_id, len(new_records), len(changed_records), removed
+
+    def remove_subdirectories(self, dir_id: int, subdir_ids: list[int]) -> int:
+        """
+        Deletes subdirectory trees of a directory that is not synced otherwise, e.g. folders
+        that became ignored under an unchanged parent, updates its rollup and commits.
+        Returns the number of deleted file records.
+        """
+        removed = 0
+        for subdir_id in subdir_ids:
+            removed += delete_directory_tree(self.db_conn, subdir_id)
+        update_directory_rollup(self.db_conn, dir_id)
+        self.commit()
+        return removed
+
+    def commit(self):
+        if self.on_commit is not None:
+            self.on_commit()
+        with instrumentation.phase("commit"):
+            self.db_conn.commit()
+        self._uncommitted_rows = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        """Writes everything queued and commits. The connection stays open."""
+        if self._pending_files:
+            insert_file_records(self.db_conn, self._pending_files)
+            self._pending_files = []
+        self.commit()
+
+    pass
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Замеры горячих участков сканирования: суммарное время по фазам, число вызовов
+и гистограммы задержек с разбивкой по томам. По умолчанию выключено.
+"""
+
+import cProfile
+import contextlib
+import threading
+import time
+from typing import Callable, Optional
+
+
+HISTOGRAM_BUCKETS = 48      # bucket n counts calls shorter than 2**n ns, the last one takes the rest
+
+
+class PhaseStats:
+    """Calls of one phase: count, total and max duration and a log2 histogram of durations in ns."""
+    calls: int
+    total_ns: int
+    max_ns: int
+    histogram: list[int]
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, duration_ns: int):
+        self.calls += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.histogram[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    pass
+
+
+class _NullPhase:
+    """The context returned by phase() while instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+    pass
+
+
+class _TimedPhase:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter_ns() - self.started)
+        return None
+
+    pass
+
+
+NULL_PHASE = _NullPhase()
+
+enabled = False
+_volume = "-"
+# (volume, phase) -> stats
+_stats: dict[tuple[str, str], PhaseStats] = {}
+_lock = threading.Lock()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def set_volume(label: str):
+    """Attributes the following measurements to a volume."""
+    global _volume
+    _volume = label
+
+def phase(name: str):
+    """
+    Context manager timing a block as one call of the phase.
+    Phases may nest, e.g. list_directory includes the stat calls made by it.
+    """
+    return _TimedPhase(name) if enabled else NULL_PHASE
+
+def timer(name: str) -> Optional[Callable]:
+    """
+    For loops too hot even for the null context: returns None while instrumentation is off,
+    otherwise a function calling func(*args, **kwargs) and timing it as a call of the phase.
+    """
+    if not enabled:
+        return None
+
+    def timed(func: Callable, *args, **kwargs):
+        started = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter_ns() - started)
+
+    return timed
+
+def record(name: str, duration_ns: int):
+    key = (_volume, name)
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = PhaseStats()
+        stats.add(duration_ns)
+
+def snapshot() -> dict[str, dict[str, dict]]:
+    """volume -> phase -> {calls, total_seconds, max_seconds, histogram} for machine-readable output."""
+    result: dict[str, dict[str, dict]] = {}
+    with _lock:
+        for (volume, name), stats in _stats.items():
+            result.setdefault(volume, {})[name] = {
+                "calls": stats.calls,
+                "total_seconds": stats.total_ns / 1e9,
+                "max_seconds": stats.max_ns / 1e9,
+                "histogram": {_format_ns(1 << bucket): count
+                              for bucket, count in enumerate(stats.histogram) if count},
+            }
+    return result
+
+def report() -> list[str]:
+    """Per-volume table of the phases, slowest first, with the latency histograms."""
+    lines = []
+    for volume, phases in snapshot().items():
+        lines.append(f"Volume {volume}:")
+        lines.append(f"  {'phase':<20}{'calls':>10}{'total s':>12}{'mean us':>12}{'max us':>12}")
+        for name, stats in sorted(phases.items(), key=lambda item: -item[1]["total_seconds"]):
+            mean_us = stats["total_seconds"] / stats["calls"] * 1e6
+            lines.append(f"  {name:<20}{stats['calls']:>10}{stats['total_seconds']:>12.3f}"
+                         f"{mean_us:>12.1f}{stats['max_seconds'] * 1e6:>12.1f}")
+            lines.append("    < " + "  < ".join(f"{bound}: {count}" for bound, count in stats["histogram"].items()))
+    return lines
+
+@contextlib.contextmanager
+def profile(output_path: Optional[str]):
+    """Runs the block under cProfile and dumps pstats to output_path; does nothing for None."""
+    if not output_path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
+
+def _format_ns(value: int) -> str:
+    for unit, scale in (("s", 10**9), ("ms", 10**6), ("us", 10**3)):
+        if value >= scale:
+            return f"{value / scale:.3g}{unit}"
+    return f"{value}ns"
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Конвейерное сканирование: несколько потоков читают каталоги,
+один поток пишет результаты в index.db.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from console import write_line
+from database import connect
+from directory_cache import DirectoryCache
+from ignored import IgnoreRules, default_ignore_rules
+import instrumentation
+from index_writer import IndexWriter
+from progress import ScanProgress
+from walker import get_volume_device, join_relative_path, list_directory
+
+
+DEFAULT_WORKERS = 4
+RESULT_QUEUE_SIZE = 256
+
+# Directory key: (volume_id, relative path)
+DirKey = tuple[int, str]
+
+
+class DirectoryTask:
+    """A directory waiting to be listed by a walker."""
+    volume_id: int
+    abs_path: str
+    path: str
+    stat_result: Optional[os.stat_result]
+    parent_key: Optional[DirKey]
+    dir_id: Optional[int]
+
+    def __init__(self, volume_id: int, abs_path: str, path: str,
+                 stat_result: Optional[os.stat_result], parent_key: Optional[DirKey],
+                 dir_id: Optional[int]) -> None:
+        self.volume_id = volume_id
+        self.abs_path = abs_path
+        self.path = path
+        self.stat_result = stat_result
+        self.parent_key = parent_key
+        self.dir_id = dir_id
+
+    pass
+
+
+class ScanPipeline:
+    """
+    Walker threads list directories from a shared work queue and put the listings
+    into a bounded result queue. A single writer thread owns the sqlite3 connection,
+    writes the listings and marks a directory as indexed once its whole subtree is written,
+    which keeps the indexed_at resume semantics of the serial scan.
+    """
+
+    def __init__(self, db_path: str, progress: ScanProgress, should_stop: Callable[[], bool],
+                 workers: int = DEFAULT_WORKERS, ignore_rules: Optional[IgnoreRules] = None) -> None:
+        self.db_path = db_path
+        self.progress = progress
+        self.should_stop = should_stop
+        self.workers = workers
+        self._work_queue: queue.Queue = queue.Queue()
+        self._result_queue: queue.Queue = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+        self.ignore_rules = ignore_rules if ignore_rules is not None else default_ignore_rules()
+        self._writer_error: Optional[BaseException] = None
+        self._directories: dict[int, DirectoryCache] = {}
+        self._devices: dict[int, Optional[int]] = {}
+
+    def run(self, roots: list[tuple[int, str]]):
+        """Scans the given (volume_id, root_path) trees and waits until everything is written."""
+        writer_thread = threading.Thread(target=self._writer_loop, name="scan-writer")
+        writer_thread.start()
+        walker_threads = [threading.Thread(target=self._walker_loop, name=f"scan-walker-{i}", daemon=True)
+                          for i in range(self.workers)]
+        for thread in walker_threads:
+            thread.start()
+
+        db_conn = connect(self.db_path)
+        for volume_id, root_path in roots:
+            self._directories[volume_id] = DirectoryCache(db_conn, volume_id)
+            self._devices[volume_id] = get_volume_device(root_path)
+        for volume_id, root_path in roots:
+            known = self._directories[volume_id].get(db_conn, "")
+            if known is None or not known[2]:
+                self._work_queue.put(DirectoryTask(volume_id, root_path, "", None, None,
+                                                   known[0] if known else None))
+        db_conn.close()
+
+        self._work_queue.join()
+        for _ in walker_threads:
+            self._work_queue.put(None)
+        for thread in walker_threads:
+            thread.join()
+        self._result_queue.put(None)
+        writer_thread.join()
+
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def _walker_loop(self):
+        db_conn = connect(self.db_path)
+        try:
+            while True:
+                task = self._work_queue.get()
+                try:
+                    if task is None:
+                        break
+                    if not self.should_stop() and self._writer_error is None:
+                        self._list_task(db_conn, task)
+                finally:
+                    self._work_queue.task_done()
+        finally:
+            db_conn.close()
+
+    def _list_task(self, db_conn: sqlite3.Connection, task: DirectoryTask):
+        try:
+            with instrumentation.phase("list_directory"):
+                listing = list_directory(task.abs_path, device=self._devices[task.volume_id])
+            dir_stat = task.stat_result if task.stat_result is not None else os.stat(task.abs_path)
+        except PermissionError:
+            write_line(f"Permission denied: {task.abs_path}")
+            self._result_queue.put(("failed", task.parent_key))
+            return
+        except OSError as e:
+            write_line(f"Error accessing directory {task.abs_path}: {e}")
+            self._result_queue.put(("failed", task.parent_key))
+            return
+
+        for entry_path, e in listing.errors:
+            write_line(f"Error accessing file {entry_path}: {e}")
+
+        files = []
+        for file_name, file_stat in listing.files:
+            file_path = join_relative_path(task.path, file_name)
+            if self.ignore_rules.is_ignored_file(file_path, file_name):
+                write_line(f"Found ignored file: {file_path}")
+                continue
+            files.append((file_name, file_stat))
+
+        directories = self._directories[task.volume_id]
+        children = []
+        for subdir_name, subdir_stat in listing.subdirs:
+            subdir_path = join_relative_path(task.path, subdir_name)
+            if self.ignore_rules.is_ignored_folder(subdir_path, subdir_name):
+                write_line(f"Found ignored folder: {subdir_path}")
+                continue
+            with instrumentation.phase("directory_lookup"):
+                known = directories.get(db_conn, subdir_path)
+            if known is not None and known[2]:
+                continue
+            children.append((subdir_name, subdir_path, subdir_stat, known[0] if known else None))
+
+        key = (task.volume_id, task.path)
+        # The listing must reach the writer before any of its children are queued.
+        self._result_queue.put(("listing", key, task.parent_key, task.dir_id, dir_stat, files, len(children)))
+        for subdir_name, subdir_path, subdir_stat, subdir_id in children:
+            self._work_queue.put(DirectoryTask(task.volume_id, os.path.join(task.abs_path, subdir_name),
+                                               subdir_path, subdir_stat, key, subdir_id))
+
+    def _writer_loop(self):
+        db_conn = connect(self.db_path)
+        writer = IndexWriter(db_conn)
+        # key -> [dir_id, children left, parent key]
+        pending: dict[DirKey, list] = {}
+
+        def child_done(parent_key: Optional[DirKey]):
+            while parent_key is not None:
+                entry = pending[parent_key]
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del pending[parent_key]
+                writer.mark_directory_as_indexed(entry[0], time.time())
+                parent_key = entry[2]
+
+        try:
+            while True:
+                message = self._result_queue.get()
+                if message is None:
+                    break
+                if self._writer_error is not None:
+                    continue  # keep draining so the walkers never block
+
+                try:
+                    if message[0] == "failed":
+                        child_done(message[1])
+                        continue
+
+                    _, key, parent_key, known_id, dir_stat, files, children_count = message
+                    # the parent stays pending until all its children are done
+                    parent_id = pending[parent_key][0] if parent_key is not None else None
+                    dir_id = writer.ensure_directory(key[0], parent_id, key[1], dir_stat, known_id)
+                    self.progress.add_dir()
+                    for file_name, file_stat in files:
+                        writer.add_file(dir_id, file_name, file_stat)
+                        self.progress.add_file(file_stat.st_size)
+                    writer.flush()
+
+                    pending[key] = [dir_id, children_count + 1, parent_key]
+                    child_done(key)
+                except BaseException as e:
+                    self._writer_error = e
+            writer.close()
+        finally:
+            db_conn.close()
+
+    pass
\ No newline at end of file
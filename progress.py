@@ -0,0 +1,149 @@
+"""
+Прогресс сканирования: счётчики обновляются в горячем цикле,
+а выводятся отдельным потоком с фиксированной частотой.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+from console import write
+from utils import format_bytes
+
+
+RENDER_INTERVAL = 0.1   # seconds between console redraws (10 Hz)
+JSON_INTERVAL = 1.0     # seconds between JSON lines in quiet mode
+TOTAL_SOURCE_FILESYSTEM = "filesystem"   # total_bytes is the used space from get_used_bytes
+
+
+class ScanProgress:
+    """
+    Counters of a scan. The scanning thread only increments plain attributes,
+    so the hot loop does no formatting and no console I/O. A background thread renders
+    the counters every `interval` seconds: a redrawn console line, or in quiet mode
+    a JSON line per interval for log collectors.
+    The ETA is based on total_bytes if known; total_source names where an estimated
+    total comes from, so the ETA is shown as an estimate of that kind.
+    Sharded scans increment the counters from several threads without a lock:
+    an increment lost in a race only affects the display.
+    """
+    files: int
+    bytes: int
+    dirs: int
+    label: str
+    total_bytes: Optional[int]
+    total_source: Optional[str]
+    quiet: bool
+    interval: float
+
+    def __init__(self, label: str = "Indexed", total_bytes: Optional[int] = None,
+                 quiet: bool = False, interval: Optional[float] = None, total_source: Optional[str] = None) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.dirs = 0
+        self.label = label
+        self.total_bytes = total_bytes
+        self.total_source = total_source
+        self.quiet = quiet
+        self.interval = interval if interval is not None else (JSON_INTERVAL if quiet else RENDER_INTERVAL)
+        self._started = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._line_length = 0
+
+    def add_file(self, size: int):
+        self.files += 1
+        self.bytes += size
+
+    def add_dir(self):
+        self.dirs += 1
+
+    def start(self) -> "ScanProgress":
+        self._started = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._render_loop, name="scan-progress", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the renderer and renders the final state once."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.render(final=True)
+
+    def __enter__(self) -> "ScanProgress":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        bytes_per_second = self.bytes / elapsed
+        eta = None
+        if self.total_bytes is not None and bytes_per_second > 0:
+            eta = max(self.total_bytes - self.bytes, 0) / bytes_per_second
+        return {
+            "label": self.label,
+            "files": self.files,
+            "bytes": self.bytes,
+            "dirs": self.dirs,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(self.files / elapsed, 1),
+            "bytes_per_second": round(bytes_per_second, 1),
+            "dirs_per_second": round(self.dirs / elapsed, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "eta_source": self.total_source if eta is not None else None,
+        }
+
+    def render(self, final: bool = False):
+        state = self.snapshot()
+        if self.quiet:
+            print(json.dumps({"event": "progress", "final": final, **state}), flush=True)
+            return
+
+        line = (f"\r{state['label']} {state['files']} files, {format_bytes(state['bytes'])}, {state['dirs']} dirs"
+                f" | {state['files_per_second']:.0f} files/s, {format_bytes(state['bytes_per_second'])}/s,"
+                f" {state['dirs_per_second']:.0f} dirs/s")
+        if state["eta_seconds"] is not None and not final:
+            line += f" | ETA {format_duration(state['eta_seconds'])}"
+            if self.total_source:
+                line += f" ({self.total_source} estimate)"
+        padding = max(self._line_length - len(line), 0)
+        self._line_length = len(line)
+        write(line + " " * padding)
+
+    def _render_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.render()
+
+    pass
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+def get_used_bytes(root_paths: list[str]) -> Optional[int]:
+    """
+    Used space of the filesystems mounted at root_paths, or None if any of them can't be
+    queried or is a directory inside a filesystem: the used space of the whole filesystem
+    says nothing about the size of one directory.
+    """
+    total = 0
+    for root_path in root_paths:
+        if not os.path.ismount(root_path):
+            return None
+        try:
+            usage = shutil.disk_usage(root_path)
+        except OSError:
+            return None
+        total += usage.used
+    return total
\ No newline at end of file
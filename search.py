@@ -0,0 +1,237 @@
+"""
+Поиск файлов в index.db по имени, пути, расширению, размеру и дате изменения.
+Имена и пути каталогов ищутся по триграммному индексу FTS5, результаты
+выдаются постранично и лениво.
+"""
+
+import argparse
+import itertools
+import re
+import sqlite3
+from datetime import datetime
+from typing import Iterator, Optional
+
+from console import write_line
+from database import connect, connect_readonly, create_search_index, drop_search_index, has_search_index
+from directory_cache import DirectoryPaths
+from utils import format_bytes, to_iso, to_ns
+from walker import join_relative_path
+
+
+DB_PATH = "index.db"
+PAGE_SIZE = 500
+DEFAULT_LIMIT = 50
+MIN_TRIGRAM_LENGTH = 3        # shorter strings can't be looked up in a trigram index
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+              "G": 1024 ** 3, "GB": 1024 ** 3, "T": 1024 ** 4, "TB": 1024 ** 4}
+
+RESULT_COLUMNS = "f.id, v.volume_guid, v.letter, f.directory_id, f.name, f.size, f.modified_at"
+
+
+class SearchQuery:
+    """
+    Filters of a search; None means "any". Strings match case-insensitively anywhere
+    in the file name or in the relative directory path. Times are nanoseconds.
+    """
+    name: Optional[str]
+    path: Optional[str]
+    extension: Optional[str]
+    min_size: Optional[int]
+    max_size: Optional[int]
+    modified_after: Optional[int]
+    modified_before: Optional[int]
+    volume: Optional[str]
+
+    def __init__(self, name: Optional[str] = None, path: Optional[str] = None, extension: Optional[str] = None,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 modified_after: Optional[int] = None, modified_before: Optional[int] = None,
+                 volume: Optional[str] = None) -> None:
+        self.name = name or None
+        self.path = path or None
+        self.extension = extension.lstrip(".") if extension else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        self.volume = volume
+
+    pass
+
+
+class SearchResult:
+    file_id: int
+    volume_guid: str
+    letter: str
+    path: str
+    size: int
+    modified_at: int
+
+    def __init__(self, file_id: int, volume_guid: str, letter: str, path: str, size: int, modified_at: int) -> None:
+        self.file_id = file_id
+        self.volume_guid = volume_guid
+        self.letter = letter
+        self.path = path
+        self.size = size
+        self.modified_at = modified_at
+
+    pass
+
+
+def _fts_phrase(text: str) -> str:
+    """A MATCH argument that finds text as a substring, with FTS5 syntax characters quoted."""
+    return '"' + text.replace('"', '""') + '"'
+
+def _like_pattern(text: str, prefix: str = "%", suffix: str = "%") -> str:
+    return prefix + re.sub(r"([\\%_])", r"\\\1", text) + suffix
+
+def build_query(query: SearchQuery, use_fts: bool) -> tuple[str, dict]:
+    """
+    Builds one page of the search, keyed by file id: the :after and :page_size parameters
+    are left to the caller. With use_fts the longest usable name string drives the query
+    from file_names_fts, so only the matching files are read; the other filters are
+    checked on those rows.
+    """
+    params = {}
+    conditions = []
+
+    fts_term = None
+    if use_fts and query.name and len(query.name) >= MIN_TRIGRAM_LENGTH:
+        fts_term = query.name
+    elif use_fts and query.extension and len(query.extension) + 1 >= MIN_TRIGRAM_LENGTH:
+        fts_term = "." + query.extension
+
+    if fts_term is not None:
+        source = "file_names_fts n JOIN files f ON f.id = n.rowid"
+        conditions.append("n.name MATCH :fts_term")
+        conditions.append("n.rowid > :after")
+        order = "n.rowid"
+        params["fts_term"] = _fts_phrase(fts_term)
+    else:
+        source = "files f"
+        conditions.append("f.id > :after")
+        order = "f.id"
+
+    if query.name and fts_term != query.name:
+        conditions.append("f.name LIKE :name ESCAPE '\\'")
+        params["name"] = _like_pattern(query.name)
+    if query.extension:
+        conditions.append("f.name LIKE :extension ESCAPE '\\'")
+        params["extension"] = _like_pattern("." + query.extension, suffix="")
+    if query.path:
+        if use_fts and len(query.path) >= MIN_TRIGRAM_LENGTH:
+            conditions.append("f.directory_id IN (SELECT rowid FROM directory_paths_fts WHERE path MATCH :path)")
+            params["path"] = _fts_phrase(query.path)
+        else:
+            conditions.append("f.directory_id IN (SELECT id FROM directory_paths WHERE path LIKE :path ESCAPE '\\')")
+            params["path"] = _like_pattern(query.path)
+    if query.min_size is not None:
+        conditions.append("f.size >= :min_size")
+        params["min_size"] = query.min_size
+    if query.max_size is not None:
+        conditions.append("f.size <= :max_size")
+        params["max_size"] = query.max_size
+    if query.modified_after is not None:
+        conditions.append("f.modified_at >= :modified_after")
+        params["modified_after"] = query.modified_after
+    if query.modified_before is not None:
+        conditions.append("f.modified_at < :modified_before")
+        params["modified_before"] = query.modified_before
+    if query.volume:
+        conditions.append("(v.volume_guid = :volume OR v.letter = :volume OR v.label = :volume)")
+        params["volume"] = query.volume
+
+    sql = f"""
+        SELECT {RESULT_COLUMNS}
+        FROM {source}
+        JOIN directories d ON d.id = f.directory_id
+        JOIN volumes v ON v.id = d.volume_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order}
+        LIMIT :page_size
+    """
+    return sql, params
+
+def search(db_conn: sqlite3.Connection, query: SearchQuery, after: int = 0,
+           page_size: int = PAGE_SIZE) -> Iterator[SearchResult]:
+    """
+    Yields the matching files in file id order, fetching page_size rows per query when
+    the previous page is consumed. after is the file id the search continues from,
+    so a caller can resume a listing with the file_id of the last result it has shown.
+    """
+    sql, params = build_query(query, has_search_index(db_conn))
+    directory_paths = DirectoryPaths(db_conn)
+    while True:
+        rows = db_conn.execute(sql, {**params, "after": after, "page_size": page_size}).fetchall()
+        for file_id, volume_guid, letter, dir_id, name, size, modified_at in rows:
+            dir_path = directory_paths.get(dir_id)
+            if dir_path is not None:
+                yield SearchResult(file_id, volume_guid, letter, join_relative_path(dir_path, name),
+                                   size, modified_at)
+        if len(rows) < page_size:
+            return
+        after = rows[-1][0]
+
+def rebuild_search_index(db_path: str):
+    """Recreates the name index, e.g. after directories were renamed or on an upgraded SQLite."""
+    db_conn = connect(db_path)
+    try:
+        cursor = db_conn.cursor()
+        drop_search_index(cursor)
+        create_search_index(cursor)
+        db_conn.commit()
+    finally:
+        db_conn.close()
+
+def parse_size(value: str) -> int:
+    """'1500', '10K', '1.5GB' -> bytes (binary units, like format_bytes)."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([A-Za-z]*)\s*", value)
+    if match is None or match.group(2).upper() not in SIZE_UNITS:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+def parse_date(value: str) -> int:
+    """A local ISO 8601 date or date and time -> nanoseconds."""
+    try:
+        return to_ns(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Searches the indexed files")
+    parser.add_argument("name", nargs="?", help="part of the file name")
+    parser.add_argument("--db", default=DB_PATH, help="path to index.db")
+    parser.add_argument("--path", help="part of the directory path")
+    parser.add_argument("--ext", help="file extension")
+    parser.add_argument("--min-size", type=parse_size, help="e.g. 100K, 1.5G")
+    parser.add_argument("--max-size", type=parse_size)
+    parser.add_argument("--after-date", type=parse_date, help="modified at or after, e.g. 2024-01-31")
+    parser.add_argument("--before-date", type=parse_date, help="modified before")
+    parser.add_argument("--volume", help="volume letter, label or guid")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="results to show, 0 for all")
+    parser.add_argument("--after", type=int, default=0, help="continue after this file id")
+    parser.add_argument("--rebuild-index", action="store_true", help="recreate the name index and exit")
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        rebuild_search_index(args.db)
+        write_line("Search index rebuilt")
+    else:
+        query = SearchQuery(args.name, args.path, args.ext, args.min_size, args.max_size,
+                            args.after_date, args.before_date, args.volume)
+        db_conn = connect_readonly(args.db)
+        results = search(db_conn, query, args.after)
+        if args.limit > 0:
+            results = itertools.islice(results, args.limit)
+        shown = 0
+        last_id = None
+        for result in results:
+            write_line(f"{result.letter}:\\{result.path}  {format_bytes(result.size)}  "
+                       f"{to_iso(result.modified_at / 1_000_000_000)}")
+            shown += 1
+            last_id = result.file_id
+        if args.limit > 0 and shown == args.limit:
+            write_line(f"Showing {shown} files; continue with --after {last_id}")
+        else:
+            write_line(f"Found {shown} files")
+        db_conn.close()
\ No newline at end of file
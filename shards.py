@@ -0,0 +1,169 @@
+"""
+Шарды индекса: отдельная БД на каждый том, чтобы тома и машины индексировались
+параллельно, и слияние шардов в один index.db, с которым работает комбинатор.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+
+from console import write_line
+from database import (catch_up_search_index, connect, defer_search_index, delete_volume_records,
+    get_volume_id_by_guid, init_db_schema)
+from get_volumes import VolumeInfo
+
+
+DB_PATH = "index.db"
+SHARD_EXTENSION = ".db"
+
+
+class MergeResult:
+    """Rows copied from one shard."""
+    shard_path: str
+    volumes: int
+    directories: int
+    files: int
+    hashes: int
+
+    def __init__(self, shard_path: str) -> None:
+        self.shard_path = shard_path
+        self.volumes = 0
+        self.directories = 0
+        self.files = 0
+        self.hashes = 0
+
+    pass
+
+
+def get_shard_path(shard_dir: str, volume_info: VolumeInfo) -> str:
+    """The shard of a volume is named after its volume_guid, so every scan of the volume finds it again."""
+    name = re.sub(r"[^0-9A-Za-z._-]+", "_", volume_info.volume_guid).strip("_") or "volume"
+    return os.path.join(shard_dir, name + SHARD_EXTENSION)
+
+def find_shards(shard_dir: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(glob.escape(shard_dir), "*" + SHARD_EXTENSION)))
+
+def merge_shard(conn: sqlite3.Connection, shard_path: str) -> MergeResult:
+    """
+    Copies a shard into the database of conn with one INSERT ... SELECT per table.
+    The ids of the shard are shifted past the largest ids of the target, so directories,
+    files and hashes keep pointing at each other; volumes are matched by volume_guid.
+    A volume already present in the target is replaced by the shard's copy, the
+    hash cache entries of the shard are added to the target's ones.
+    output_files is not copied: the combinator rebuilds it over the merged index.
+    """
+    result = MergeResult(shard_path)
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+    try:
+        dir_offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.directories").fetchone()[0]
+        file_offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.files").fetchone()[0]
+        hash_offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.unique_files").fetchone()[0]
+
+        conn.execute("DROP TABLE IF EXISTS temp.shard_volumes")
+        conn.execute("CREATE TEMP TABLE shard_volumes (shard_id INTEGER PRIMARY KEY, main_id INTEGER NOT NULL)")
+        shard_volumes = conn.execute(
+            "SELECT id, volume_guid, letter, label, filesystem, drive_name FROM shard.volumes"
+        ).fetchall()
+        for shard_id, volume_guid, letter, label, filesystem, drive_name in shard_volumes:
+            main_id = get_volume_id_by_guid(conn, volume_guid)
+            if main_id is None:
+                main_id = conn.execute(
+                    "INSERT INTO main.volumes (volume_guid, letter, label, filesystem, drive_name) VALUES (?, ?, ?, ?, ?)",
+                    (volume_guid, letter, label, filesystem, drive_name)
+                ).lastrowid
+            else:
+                conn.execute(
+                    "UPDATE main.volumes SET letter = ?, label = ?, filesystem = ?, "
+                    "drive_name = COALESCE(?, drive_name) WHERE id = ?",
+                    (letter, label, filesystem, drive_name, main_id)
+                )
+                delete_volume_records(conn, main_id)
+            conn.execute("INSERT INTO temp.shard_volumes (shard_id, main_id) VALUES (?, ?)", (shard_id, main_id))
+        result.volumes = len(shard_volumes)
+
+        result.directories = conn.execute("""
+            INSERT INTO main.directories (id, volume_id, parent_id, name, created_at, modified_at, indexed_at)
+            SELECT d.id + :dir_offset, v.main_id, d.parent_id + :dir_offset, d.name,
+                   d.created_at, d.modified_at, d.indexed_at
+            FROM shard.directories d
+            JOIN temp.shard_volumes v ON v.shard_id = d.volume_id
+            ORDER BY d.id
+        """, {"dir_offset": dir_offset}).rowcount
+        result.files = conn.execute("""
+            INSERT INTO main.files (id, directory_id, name, size, created_at, modified_at, indexed_at)
+            SELECT id + :file_offset, directory_id + :dir_offset, name, size, created_at, modified_at, indexed_at
+            FROM shard.files
+            ORDER BY id
+        """, {"file_offset": file_offset, "dir_offset": dir_offset}).rowcount
+        conn.execute("""
+            INSERT INTO main.directory_rollups
+                (directory_id, own_bytes, own_files, total_bytes, file_count, subdir_count)
+            SELECT directory_id + :dir_offset, own_bytes, own_files, total_bytes, file_count, subdir_count
+            FROM shard.directory_rollups
+        """, {"dir_offset": dir_offset})
+        result.hashes = conn.execute("""
+            INSERT INTO main.unique_files (id, file_id, copied_at, hash, partial_hash)
+            SELECT id + :hash_offset, file_id + :file_offset, copied_at, hash, partial_hash
+            FROM shard.unique_files
+            ORDER BY id
+        """, {"hash_offset": hash_offset, "file_offset": file_offset}).rowcount
+        conn.execute("""
+            INSERT INTO main.hash_cache (volume_guid, path, size, modified_at, partial_hash, hash)
+            SELECT volume_guid, path, size, modified_at, partial_hash, hash FROM shard.hash_cache WHERE true
+            ON CONFLICT (volume_guid, path) DO UPDATE SET
+                size = excluded.size, modified_at = excluded.modified_at,
+                partial_hash = excluded.partial_hash, hash = excluded.hash
+        """)
+        conn.execute("DROP TABLE temp.shard_volumes")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE shard")
+    return result
+
+def merge_shards(db_path: str, shard_paths: list[str]) -> list[MergeResult]:
+    """
+    Merges the shards into db_path one by one, each in its own transaction.
+    Shards and the target are migrated to the current schema first.
+    """
+    init_db_schema(db_path)
+    conn = connect(db_path)
+    results = []
+    try:
+        defer_search_index(conn)
+        for shard_path in shard_paths:
+            if os.path.abspath(shard_path) == os.path.abspath(db_path):
+                continue
+            init_db_schema(shard_path)
+            results.append(merge_shard(conn, shard_path))
+        catch_up_search_index(conn)
+        # the merged tables are much larger now, the combinator's plans depend on fresh statistics
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merges per-volume shard databases into one index")
+    parser.add_argument("--db", default=DB_PATH, help="path to the merged index.db")
+    parser.add_argument("--shard-dir", help="merge every *.db in this directory")
+    parser.add_argument("shards", nargs="*", help="shard databases to merge")
+    args = parser.parse_args()
+
+    shard_paths = list(args.shards)
+    if args.shard_dir:
+        shard_paths.extend(find_shards(args.shard_dir))
+    if not shard_paths:
+        parser.error("no shards given")
+
+    for result in merge_shards(args.db, shard_paths):
+        write_line(f"{result.shard_path}: {result.volumes} volumes, {result.directories} directories, "
+                   f"{result.files} files, {result.hashes} hashes")
+    write_line(f"Merged into {args.db}")
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import collector
+from database import init_db_schema
+from get_volumes import DirectoryVolumeProvider
+
+
+def write_file(path: str, data: bytes = b""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+def make_tree(root: str, dirs: int = 3, files: int = 5):
+    """Nested directories with files of different sizes, and an empty directory."""
+    for index in range(dirs):
+        for sub in ["", "inner", os.path.join("inner", "deeper")]:
+            for number in range(files):
+                write_file(os.path.join(root, f"dir{index}", sub, f"file{number}.txt"), b"x" * (index * 10 + number))
+    os.makedirs(os.path.join(root, "empty"), exist_ok=True)
+
+def index_snapshot(db_path: str) -> tuple[set, set]:
+    """Directories (volume, path, is indexed) and files (volume, path, name, size, modified_at) of an index."""
+    conn = sqlite3.connect(db_path)
+    directories = set(conn.execute("""
+        SELECT v.volume_guid, p.path, d.indexed_at IS NOT NULL
+        FROM directories d JOIN directory_paths p ON p.id = d.id JOIN volumes v ON v.id = d.volume_id
+    """))
+    files = set(conn.execute("""
+        SELECT v.volume_guid, p.path, f.name, f.size, f.modified_at
+        FROM files f JOIN directory_paths p ON p.id = f.directory_id JOIN volumes v ON v.id = p.volume_id
+    """))
+    conn.close()
+    return directories, files
+
+def scan(db_path: str, roots: list[str], drive_name: str|None = None, **kwargs):
+    """Indexes the directories as volumes, as collector.py --root does."""
+    roots = [os.path.abspath(root) for root in roots]
+    collector.scan_and_index_volumes(db_path, roots, drive_name, provider=DirectoryVolumeProvider(roots),
+                                     quiet=True, **kwargs)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "index.db")
+    init_db_schema(path)
+    return path
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+
+import collector
+from database import init_db_schema
+from index_writer import IndexWriter
+
+from conftest import scan, write_file
+
+
+def make_tree(root: str):
+    for folder in ["alpha", "beta", os.path.join("beta", "inner"), "gamma"]:
+        for index in range(40):
+            write_file(os.path.join(root, folder, f"file{index:03d}.txt"), b"x" * index)
+
+def indexed_files(db_path: str) -> set[tuple]:
+    conn = sqlite3.connect(db_path)
+    result = set(conn.execute("""
+        SELECT p.path, f.name, f.size FROM files f JOIN directory_paths p ON p.id = f.directory_id
+    """))
+    conn.close()
+    return result
+
+def saved_frontier(db_path: str):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT frontier FROM scan_checkpoints").fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def test_completed_scan_leaves_no_checkpoint(tmp_path, db_path):
+    make_tree(str(tmp_path / "vol"))
+    scan(db_path, [str(tmp_path / "vol")], checkpoint_interval=0)
+
+    assert saved_frontier(db_path) is None
+    assert len(indexed_files(db_path)) == 160
+
+def test_stopped_scan_resumes_from_checkpoint(tmp_path, db_path, monkeypatch):
+    root = str(tmp_path / "vol")
+    make_tree(root)
+    reference_path = str(tmp_path / "reference.db")
+    init_db_schema(reference_path)
+    scan(reference_path, [root])
+
+    add_file = IndexWriter.add_file
+    added = []
+    def add_and_stop(self, *args):
+        add_file(self, *args)
+        added.append(args)
+        if len(added) == 60:
+            collector.stop_requested()
+    monkeypatch.setattr(IndexWriter, "add_file", add_and_stop)
+    scan(db_path, [root], checkpoint_interval=1000)
+    monkeypatch.setattr(IndexWriter, "add_file", add_file)
+
+    frontier = saved_frontier(db_path)
+    assert frontier is not None
+    # stopped inside the second directory, right after the file that was added last
+    assert frontier["stack"][-1][3] == "file019.txt"
+    assert len(indexed_files(db_path)) == 60
+
+    listed = []
+    list_directory = collector.list_directory
+    def recording_list_directory(path, include_files=True, start_after=None, device=None):
+        listed.append(start_after)
+        return list_directory(path, include_files, start_after, device)
+    monkeypatch.setattr(collector, "list_directory", recording_list_directory)
+    scan(db_path, [root], checkpoint_interval=1000)
+
+    assert listed[0] == "file019.txt"
+    assert indexed_files(db_path) == indexed_files(reference_path)
+    assert saved_frontier(db_path) is None
\ No newline at end of file
@@ -0,0 +1,112 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import collector
+import pipeline
+from database import init_db_schema
+from get_volumes import VolumeInfo
+from ignored import IgnoreRules
+from walker import list_directory
+
+from conftest import index_snapshot, make_tree, scan, write_file
+
+
+def test_pipeline_scan_equals_serial_scan(tmp_path, db_path):
+    roots = [str(tmp_path / "a"), str(tmp_path / "b")]
+    for root in roots:
+        make_tree(root)
+    serial_path = str(tmp_path / "serial.db")
+    init_db_schema(serial_path)
+    scan(serial_path, roots)
+    scan(db_path, roots, mode=collector.SCAN_MODE_PIPELINE, workers=3)
+
+    directories, files = index_snapshot(db_path)
+    assert (directories, files) == index_snapshot(serial_path)
+    assert len(files) == 2 * 3 * 3 * 5
+    assert all(indexed for _, _, indexed in directories)
+
+def test_incremental_rescan_syncs_changed_directories(tmp_path, db_path, capsys):
+    root = tmp_path / "vol"
+    make_tree(str(root))
+    scan(db_path, [str(root)])
+
+    (root / "dir0" / "file0.txt").unlink()
+    write_file(str(root / "dir0" / "new.txt"), b"new")
+    write_file(str(root / "dir1" / "file1.txt"), b"longer than before")
+    shutil.rmtree(root / "dir2" / "inner")
+    write_file(str(root / "added" / "sub" / "q.txt"), b"q")
+    # a rewritten file doesn't touch its directory, and the others may change within the timestamp resolution
+    for index, path in enumerate([root, root / "dir0", root / "dir1", root / "dir2"]):
+        os.utime(path, ns=(0, 1_000_000_000 + index))
+    capsys.readouterr()
+    scan(db_path, [str(root)], mode=collector.SCAN_MODE_INCREMENTAL)
+
+    assert "Files added: 2, updated: 1, removed: 11" in capsys.readouterr().out
+    full_path = str(tmp_path / "full.db")
+    init_db_schema(full_path)
+    scan(full_path, [str(root)])
+    assert index_snapshot(db_path) == index_snapshot(full_path)
+
+    scan(db_path, [str(root)], mode=collector.SCAN_MODE_INCREMENTAL)
+    assert "Files added: 0, updated: 0, removed: 0" in capsys.readouterr().out
+
+def test_incremental_rescan_removes_folders_that_became_ignored(tmp_path, db_path, capsys):
+    root = str(tmp_path / "vol")
+    make_tree(root)
+    scan(db_path, [root])
+
+    # no directory changed, only the rules did
+    ignore_rules = IgnoreRules(folders=["inner"])
+    capsys.readouterr()
+    scan(db_path, [root], mode=collector.SCAN_MODE_INCREMENTAL, ignore_rules=ignore_rules)
+    assert "Files added: 0, updated: 0, removed: 30" in capsys.readouterr().out
+    full_path = str(tmp_path / "full.db")
+    init_db_schema(full_path)
+    scan(full_path, [root], ignore_rules=ignore_rules)
+    assert index_snapshot(db_path) == index_snapshot(full_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT total_bytes, file_count, subdir_count FROM directory_rollups r "
+                        "JOIN directories d ON d.id = r.directory_id WHERE d.parent_id IS NULL").fetchone() == \
+        (sum(index * 10 * 5 + 10 for index in range(3)), 15, 4)
+    conn.close()
+
+@pytest.mark.skipif(os.name == "nt", reason="the walk doesn't compare devices on Windows")
+@pytest.mark.parametrize("mode", collector.SCAN_MODES)
+def test_scan_stays_on_the_device_of_the_root(tmp_path, db_path, monkeypatch, mode):
+    root = str(tmp_path / "vol")
+    make_tree(root, dirs=1, files=2)
+    write_file(os.path.join(root, "top.txt"), b"top")
+    device = os.stat(root).st_dev
+    assert [name for name, _ in list_directory(root, device=device).subdirs] != []
+    assert list_directory(root, device=device + 1).subdirs == []
+
+    # every subdirectory looks like a mount point of another file system
+    monkeypatch.setattr(collector, "get_volume_device", lambda root_path: device + 1)
+    monkeypatch.setattr(pipeline, "get_volume_device", lambda root_path: device + 1)
+    if mode == collector.SCAN_MODE_INCREMENTAL:
+        scan(db_path, [root])
+        write_file(os.path.join(root, "dir0", "new.txt"), b"new")
+        os.utime(os.path.join(root, "dir0"), ns=(0, 1_000_000_000))
+        os.utime(root, ns=(0, 1_000_000_000))
+    scan(db_path, [root], mode=mode)
+
+    directories, files = index_snapshot(db_path)
+    assert {path for _, path, _ in directories} == {""}
+    assert {name for _, _, name, _, _ in files} == {"top.txt"}
+
+def test_volume_selection():
+    assert collector.split_volume_selection('C D,E') == ["C", "D", "E"]
+    assert collector.split_volume_selection('/ , "/media/My Disk" /mnt/a\\b') == ["/", "/media/My Disk", "/mnt/a\\b"]
+    with pytest.raises(ValueError):
+        collector.split_volume_selection('"/media/My Disk')
+
+    volumes = [VolumeInfo(letter, letter, letter, "ext4", root_path=letter)
+               for letter in ["/", "/media/My Disk", "/media/data", "/media/Data"]]
+    assert collector.find_volume_by_letter("/media/My Disk", volumes) is volumes[1]
+    if os.name != "nt":
+        assert collector.find_volume_by_letter("/media/Data", volumes) is volumes[3]
+        assert collector.find_volume_by_letter("/MEDIA/DATA", volumes) is None
\ No newline at end of file
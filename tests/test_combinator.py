@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+import pytest
+
+import collector
+import combinator
+
+from conftest import scan, write_file
+
+
+# the same relative paths on several volumes form the duplicate groups
+NAMES = [
+    "README", "Makefile", ".bashrc", "archive.tar.gz", "trailing.", "Élan.txt", "Straße.TXT",
+    os.path.join("Фото", "Отпуск.JPG"), os.path.join("Фото", "отпуск.jpg"), os.path.join("日本", "写真.png"),
+    os.path.join("Docs", "Report.PDF"), os.path.join("docs", "report.pdf"), os.path.join("Docs", "notes"),
+]
+
+@pytest.fixture
+def combined_db(tmp_path, db_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    roots = [str(tmp_path / name) for name in ["a", "b", "c"]]
+    for index, root in enumerate(roots):
+        for name in NAMES[index:]:
+            write_file(os.path.join(root, name), name.encode("utf-8") * (index + 1))
+    write_file(os.path.join(roots[1], "élan.TXT"), b"lower case twin")
+    scan(db_path, roots)
+    return db_path
+
+def output_files(db_path: str) -> list[tuple]:
+    conn = sqlite3.connect(db_path)
+    result = conn.execute("SELECT file_id, out_path, group_dir, group_name FROM output_files ORDER BY file_id").fetchall()
+    conn.close()
+    return result
+
+def test_engines_produce_the_same_output_files(combined_db):
+    combinator.main(combined_db, combinator.ENGINE_MEMORY)
+    reference = output_files(combined_db)
+    assert len(reference) == 3 * len(NAMES) - 3 + 1
+
+    for engine in combinator.ENGINES:
+        combinator.main(combined_db, engine, workers=2)
+        assert output_files(combined_db) == reference, engine
+
+def test_verify_engines(combined_db):
+    assert combinator.verify_engines(combined_db)
+
+def test_incremental_combine_equals_full_combine(tmp_path, combined_db, capsys):
+    roots = [str(tmp_path / name) for name in ["a", "b", "c"]]
+    root = tmp_path / "a"
+
+    def combine_changes(changed_dirs: list, mtime_ns: int):
+        for path in changed_dirs:
+            os.utime(path, ns=(0, mtime_ns))
+        scan(combined_db, roots, mode=collector.SCAN_MODE_INCREMENTAL)
+        capsys.readouterr()
+        combinator.main(combined_db, incremental=True)
+        out = capsys.readouterr().out
+        assert "Groups recomputed:" in out and "Groups recomputed: 0," not in out
+        incremental = output_files(combined_db)
+        combinator.main(combined_db, incremental=True)
+        assert "Groups recomputed: 0," in capsys.readouterr().out
+        assert output_files(combined_db) == incremental
+        combinator.main(combined_db, combinator.ENGINE_MEMORY)
+        assert output_files(combined_db) == incremental
+
+    combinator.main(combined_db, combinator.ENGINE_SQL)
+    (root / "README").unlink()
+    write_file(str(root / "Docs" / "notes"), b"rewritten, so the size changes")
+    write_file(str(root / "DOCS" / "REPORT.pdf"), b"joins the docs/report.pdf groups")
+    write_file(str(root / "brand" / "new.txt"), b"a group of its own")
+    combine_changes([root, root / "Docs"], 1_000_000_000)
+
+    # SQLite gives a new row the id after the largest one left, which can be an id freed before the last
+    # combine: delete the second newest file and combine, then delete the newest file and add two
+    conn = sqlite3.connect(combined_db)
+    newest = conn.execute("""
+        SELECT f.id, p.path, f.name FROM files f JOIN directory_paths p ON p.id = f.directory_id
+        ORDER BY f.id DESC LIMIT 2
+    """).fetchall()
+    conn.close()
+    paths = [root.joinpath(*dir_path.split("\\"), name) for _, dir_path, name in newest]
+    assert all(path.is_file() for path in paths)
+    paths[1].unlink()
+    combine_changes([paths[1].parent], 2_000_000_000)
+    paths[0].unlink()
+    os.utime(paths[0].parent, ns=(0, 3_000_000_000))
+    scan(combined_db, roots, mode=collector.SCAN_MODE_INCREMENTAL)
+    write_file(str(root / "Docs" / "n1"), b"first new file")
+    write_file(str(root / "Docs" / "n2"), b"second new file")
+    combine_changes([root / "Docs"], 4_000_000_000)
+    conn = sqlite3.connect(combined_db)
+    assert conn.execute("SELECT MAX(id) FROM files").fetchone()[0] == newest[0][0]
+    conn.close()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import sqlite3
+
+import search
+from database import (apply_migration_v1_to_v2, get_current_schema_version, get_directory_path,
+    has_search_index, init_db_schema)
+from utils import iso_to_ns
+
+
+MODIFIED = "2021-03-04T05:06:07.123456"
+
+def make_v1_database(db_path: str):
+    """A schema v1 index as the first releases wrote it: relative paths and ISO timestamps."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, "
+                   "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);")
+    apply_migration_v1_to_v2(cursor)
+    cursor.execute("INSERT INTO schema_version (version) VALUES (1);")
+    cursor.execute("INSERT INTO volumes (id, volume_guid, letter, label) VALUES (1, 'vol-1', 'D', 'Data');")
+    # 'Photos' itself was never stored, its subdirectory was
+    for dir_id, path in [(1, ""), (2, "Docs"), (3, "Docs\\Old"), (4, "Photos\\2020")]:
+        cursor.execute("INSERT INTO directories VALUES (?, 1, ?, ?, ?, ?);",
+                       (dir_id, path, MODIFIED, MODIFIED, MODIFIED))
+    for file_id, dir_id, name, size in [(1, 1, "README", 10), (2, 2, "report.pdf", 200),
+                                        (3, 3, "report.pdf", 300), (4, 4, "IMG_0001.JPG", 4000)]:
+        cursor.execute("INSERT INTO files (id, directory_id, name, size, created_at, modified_at) "
+                       "VALUES (?, ?, ?, ?, ?, ?);", (file_id, dir_id, name, size, MODIFIED, MODIFIED))
+    cursor.execute("INSERT INTO unique_files (file_id, copied_at, hash) VALUES (2, ?, 'abc');", (MODIFIED,))
+    conn.commit()
+    conn.close()
+
+def test_v1_database_is_migrated_to_the_current_schema(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    make_v1_database(db_path)
+    init_db_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert get_current_schema_version(conn.cursor()) == 13
+    assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+    assert [get_directory_path(conn, dir_id) for dir_id in [1, 2, 3, 4]] == \
+        ["", "Docs", "Docs\\Old", "Photos\\2020"]
+    assert conn.execute("SELECT indexed_at FROM directories d JOIN directory_paths p ON p.id = d.id "
+                        "WHERE p.path = 'Photos'").fetchone() == (None,)
+    assert set(conn.execute("SELECT modified_at FROM files")) == {(iso_to_ns(MODIFIED),)}
+    assert conn.execute("SELECT copied_at, hash FROM unique_files").fetchone() == (iso_to_ns(MODIFIED), "abc")
+    assert conn.execute("SELECT total_bytes, file_count, subdir_count FROM directory_rollups "
+                        "WHERE directory_id = 1").fetchone() == (4510, 4, 4)
+
+    if has_search_index(conn):
+        assert conn.execute("SELECT COUNT(*) FROM file_names_fts").fetchone() == (4,)
+    assert [result.path for result in search.search(conn, search.SearchQuery(name="report"))] == \
+        ["Docs\\report.pdf", "Docs\\Old\\report.pdf"]
+    schema = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+    conn.close()
+
+    init_db_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+    assert conn.execute("SELECT COUNT(*) FROM files").fetchone() == (4,)
+    conn.close()
\ No newline at end of file
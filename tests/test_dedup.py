@@ -0,0 +1,37 @@
+import os
+import sqlite3
+
+import dedup
+import hasher
+from get_volumes import DirectoryVolumeProvider
+
+from conftest import scan, write_file
+
+
+def find_folder_paths(db_path: str) -> list[list[str]]:
+    conn = sqlite3.connect(db_path)
+    dedup.find_duplicate_folders(conn)
+    result = [sorted(path for _, _, path in duplicate_set.locations) for duplicate_set in dedup.top_folder_sets(conn)]
+    conn.close()
+    return result
+
+def test_equal_folders_are_reported(tmp_path, db_path):
+    content = os.urandom(5000)
+    for folder in ["A", "B"]:
+        write_file(str(tmp_path / "vol" / folder / "photo.jpg"), content)
+        write_file(str(tmp_path / "vol" / folder / "sub" / "notes.txt"), b"notes")
+    write_file(str(tmp_path / "vol" / "C" / "photo.jpg"), os.urandom(5000))
+    scan(db_path, [str(tmp_path / "vol")])
+    hasher.hash_index(db_path, provider=DirectoryVolumeProvider([str(tmp_path / "vol")]))
+
+    assert find_folder_paths(db_path) == [["A", "B"]]
+
+def test_case_twins_do_not_cancel_out(tmp_path, db_path):
+    # x.txt and X.TXT with equal content used to cancel each other, leaving both folders "empty"
+    for folder, name in [("A", "x.txt"), ("B", "y.dat")]:
+        write_file(str(tmp_path / "vol" / folder / name), b"same content")
+        write_file(str(tmp_path / "vol" / folder / name.upper()), b"same content")
+    scan(db_path, [str(tmp_path / "vol")])
+    hasher.hash_index(db_path, provider=DirectoryVolumeProvider([str(tmp_path / "vol")]))
+
+    assert find_folder_paths(db_path) == []
\ No newline at end of file
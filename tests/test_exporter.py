@@ -0,0 +1,37 @@
+import os
+
+import combinator
+import exporter
+from get_volumes import DirectoryVolumeProvider
+
+from conftest import scan, write_file
+
+
+def test_copies_of_a_group_are_exported_next_to_it(tmp_path, db_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    roots = [str(tmp_path / "a"), str(tmp_path / "b"), str(tmp_path / "c")]
+    for index, root in enumerate(roots):
+        write_file(os.path.join(root, "docs", "note.txt"), b"copy %d" % index)
+    write_file(os.path.join(roots[0], "docs", "sub", "only.bin"), b"only")
+    scan(db_path, roots)
+    combinator.main(db_path, combinator.ENGINE_SQL)
+
+    target = tmp_path / "out"
+    result = exporter.export_index(db_path, str(target), provider=DirectoryVolumeProvider(roots))
+
+    assert (result.copied_files, result.failed_files) == (4, 0)
+    assert (target / "docs" / "note.txt").is_file()
+    assert sorted(os.listdir(target / "docs" / "note.txt.dups")) == ["1.txt", "2.txt"]
+    contents = {(target / "docs" / "note.txt").read_bytes()}
+    contents.update(path.read_bytes() for path in (target / "docs" / "note.txt.dups").iterdir())
+    assert contents == {b"copy 0", b"copy 1", b"copy 2"}
+    assert (target / "docs" / "sub" / "only.bin").read_bytes() == b"only"
+
+    rerun = exporter.export_index(db_path, str(target), provider=DirectoryVolumeProvider(roots))
+    assert (rerun.copied_files, rerun.failed_files) == (0, 0)
+
+def test_target_path_of_a_copy():
+    assert exporter.get_target_path("/t", "docs/a.txt", "docs", "a.txt") == os.path.join("/t", "docs", "a.txt")
+    assert exporter.get_target_path("/t", "docs/a.txt/2.txt", "docs", "a.txt") == \
+        os.path.join("/t", "docs", "a.txt.dups", "2.txt")
+    assert exporter.get_target_path("/t", "a.txt/1.txt", "", "a.txt") == os.path.join("/t", "a.txt.dups", "1.txt")
\ No newline at end of file
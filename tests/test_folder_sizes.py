@@ -0,0 +1,69 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import collector
+import folder_sizes
+from database import init_db_schema
+
+from conftest import make_tree, scan, write_file
+
+
+def expected_rollups(conn: sqlite3.Connection) -> dict[int, tuple[int, int, int]]:
+    """Totals of every indexed directory, added up file by file along the parent chain."""
+    parents = dict(conn.execute("SELECT id, parent_id FROM directories"))
+    totals = {dir_id: [0, 0, 0] for dir_id in parents}
+    for dir_id, size in conn.execute("SELECT directory_id, size FROM files"):
+        while dir_id is not None:
+            totals[dir_id][0] += size
+            totals[dir_id][1] += 1
+            dir_id = parents[dir_id]
+    for dir_id in parents:
+        parent_id = parents[dir_id]
+        while parent_id is not None:
+            totals[parent_id][2] += 1
+            parent_id = parents[parent_id]
+    indexed = {dir_id for dir_id, in conn.execute("SELECT id FROM directories WHERE indexed_at IS NOT NULL")}
+    return {dir_id: tuple(total) for dir_id, total in totals.items() if dir_id in indexed}
+
+def stored_rollups(conn: sqlite3.Connection) -> dict[int, tuple[int, int, int]]:
+    return {row[0]: row[1:] for row in
+            conn.execute("SELECT directory_id, total_bytes, file_count, subdir_count FROM directory_rollups")}
+
+@pytest.mark.parametrize("mode", [collector.SCAN_MODE_SERIAL, collector.SCAN_MODE_PIPELINE])
+def test_rollups_match_the_files(tmp_path, db_path, mode):
+    root = str(tmp_path / "vol")
+    make_tree(root)
+    scan(db_path, [root], mode=mode)
+    conn = sqlite3.connect(db_path)
+    assert stored_rollups(conn) == expected_rollups(conn)
+
+    os.remove(os.path.join(root, "dir1", "inner", "file3.txt"))
+    write_file(os.path.join(root, "dir1", "inner", "new.txt"), b"n" * 500)
+    write_file(os.path.join(root, "dir2", "file4.txt"), b"changed" * 50)
+    shutil.rmtree(os.path.join(root, "dir0"))
+    write_file(os.path.join(root, "big", "x", "q.bin"), b"q" * 7000)
+    write_file(os.path.join(root, "big", "x", "y", "z.bin"), b"z" * 3000)
+    for path in ["", "dir1/inner", "dir2"]:
+        os.utime(os.path.join(root, path), ns=(0, 1_000_000_000))
+    scan(db_path, [root], mode=collector.SCAN_MODE_INCREMENTAL)
+    assert stored_rollups(conn) == expected_rollups(conn)
+
+    largest = folder_sizes.largest_folders(conn, top=2)
+    assert {(folder.path, folder.total_bytes, folder.file_count, folder.subdir_count) for folder in largest} == \
+        {("big", 10000, 2, 2), ("big\\x", 10000, 2, 1)}
+    volume_id, _ = folder_sizes.find_volume(conn, "vol")
+    folder, children = folder_sizes.folder_contents(conn, volume_id, "big")
+    assert (folder.total_bytes, folder.file_count) == (10000, 2)
+    assert [(child.path, child.total_bytes) for child in children] == [("big\\x", 10000)]
+    assert folder_sizes.folder_contents(conn, volume_id, "missing") is None
+
+    # an index from before the rollups gets them computed by the migration
+    conn.execute("DROP TABLE directory_rollups")
+    conn.execute("DELETE FROM schema_version WHERE version >= 8")
+    conn.commit()
+    init_db_schema(db_path)
+    assert stored_rollups(conn) == expected_rollups(conn)
+    conn.close()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import get_volumes
+from get_volumes import DirectoryVolumeProvider, PosixVolumeProvider, VolumeProvider
+
+
+MOUNTINFO = """\
+22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+23 22 0:21 / /proc rw,nosuid - proc proc rw
+24 22 0:5 / /dev rw,nosuid - devtmpfs udev rw
+25 22 0:22 / /run rw,nosuid - tmpfs tmpfs rw
+26 22 8:17 / /media/My\\040Disk rw,relatime shared:2 - vfat /dev/sdb1 rw
+27 22 8:17 / /mnt/same\\040disk rw,relatime - vfat /dev/sdb1 rw
+28 22 8:1 /srv/data /data rw,relatime - ext4 /dev/sda1 rw
+29 22 0:30 / /snap/core/1 ro - squashfs /dev/loop0 ro
+30 22 0:31 / /net rw shared:3 - nfs4 server:/export rw
+"""
+
+@pytest.fixture
+def mountinfo_path(tmp_path):
+    path = tmp_path / "mountinfo"
+    path.write_text(MOUNTINFO, encoding="utf-8")
+    return str(path)
+
+def test_mountinfo_volumes(mountinfo_path, monkeypatch):
+    monkeypatch.setattr(get_volumes, "_read_device_links", lambda links_dir: {"8:1": "root-uuid"})
+    volumes = PosixVolumeProvider(mountinfo_path).get_volumes()
+
+    assert [(v.letter, v.filesystem) for v in volumes] == [
+        ("/", "ext4"), ("/media/My Disk", "vfat"), ("/data", "ext4"), ("/net", "nfs4"),
+    ]
+    # \\040 is a space; the second mount of the same filesystem directory is left out
+    assert (volumes[1].root_path, volumes[1].label) == ("/media/My Disk", "My Disk")
+    # the device number stands in for a missing filesystem UUID
+    assert [v.volume_guid for v in volumes] == ["root-uuid", "dev-8:17", "root-uuid/srv/data", "dev-0:31"]
+
+def test_directory_volumes_keep_their_guid(tmp_path):
+    first = DirectoryVolumeProvider([str(tmp_path), str(tmp_path / "missing")]).get_volumes()
+    second = DirectoryVolumeProvider([str(tmp_path)]).get_volumes()
+
+    assert len(first) == 1
+    assert first[0].volume_guid == second[0].volume_guid
+    assert first[0].root_path == os.path.abspath(tmp_path)
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        VolumeProvider()
\ No newline at end of file
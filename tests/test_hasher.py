@@ -0,0 +1,43 @@
+import os
+import sqlite3
+
+import hasher
+from database import apply_hash_cache, mark_files_copied
+from get_volumes import DirectoryVolumeProvider
+
+from conftest import scan, write_file
+
+
+def hashed_tree(tmp_path, db_path) -> str:
+    root = str(tmp_path / "vol")
+    content = os.urandom(3000)
+    for name in ["a.bin", "b.bin", os.path.join("sub", "c.bin")]:
+        write_file(os.path.join(root, name), content)
+    write_file(os.path.join(root, "other.bin"), os.urandom(3000))
+    scan(db_path, [root])
+    hasher.hash_index(db_path, provider=DirectoryVolumeProvider([root]))
+    return root
+
+def test_duplicates_get_the_same_hash(tmp_path, db_path):
+    hashed_tree(tmp_path, db_path)
+    conn = sqlite3.connect(db_path)
+    hashes = dict(conn.execute("SELECT f.name, u.hash FROM files f JOIN unique_files u ON u.file_id = f.id"))
+    conn.close()
+    assert hashes["a.bin"] is not None
+    assert hashes["a.bin"] == hashes["b.bin"] == hashes["c.bin"]
+    assert hashes.get("other.bin") != hashes["a.bin"]
+
+def test_cache_completes_rows_of_exported_files(tmp_path, db_path):
+    hashed_tree(tmp_path, db_path)
+    conn = sqlite3.connect(db_path)
+    expected = set(conn.execute("SELECT file_id, partial_hash, hash FROM unique_files"))
+    # as if the files were exported before they were hashed
+    conn.execute("DELETE FROM unique_files")
+    mark_files_copied(conn, [(file_id, 123) for file_id, _, _ in expected])
+
+    assert apply_hash_cache(conn) == len(expected)
+    assert set(conn.execute("SELECT file_id, partial_hash, hash FROM unique_files")) == expected
+    assert conn.execute("SELECT COUNT(*) FROM unique_files WHERE copied_at = 123").fetchone()[0] == len(expected)
+    # files hashed already keep their hashes
+    assert apply_hash_cache(conn) == 0
+    conn.close()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+import pytest
+
+import collector
+import hasher
+from database import get_directory_path, get_directory_state
+from directory_cache import DirectoryPaths
+from get_volumes import DirectoryVolumeProvider
+from walker import join_relative_path, split_parent_path, split_relative_path, to_native_path
+
+from conftest import scan, write_file
+
+
+def test_backslash_in_a_name_round_trips():
+    path = join_relative_path(join_relative_path("", "a\\b"), "c")
+    assert path == "a/b\\c"
+    assert split_relative_path(path) == ["a\\b", "c"]
+    assert split_parent_path(path) == ("a/b", "c")
+    assert split_parent_path("a\\b/c") == ("a", "b\\c")
+    assert split_relative_path("") == []
+    assert to_native_path("/root", path) == os.path.join("/root", "a\\b", "c")
+
+@pytest.mark.skipif(os.name == "nt", reason="a backslash can't be a part of a name on Windows")
+def test_backslash_names_are_not_nested_directories(tmp_path, db_path, capsys):
+    root = str(tmp_path / "vol")
+    write_file(os.path.join(root, "a\\b", "c.txt"), b"in a\\b")
+    write_file(os.path.join(root, "a", "b", "c.txt"), b"in a/b")
+    write_file(os.path.join(root, "a", "x\\y.txt"), b"escaped file name")
+    scan(db_path, [root])
+
+    conn = sqlite3.connect(db_path)
+    paths = {row[0]: row[1] for row in conn.execute("SELECT id, path FROM directory_paths")}
+    assert sorted(paths.values()) == ["", "a", "a/b", "a\\b"]
+    directory_paths = DirectoryPaths(conn)
+    for dir_id, path in paths.items():
+        assert directory_paths.get(dir_id) == path
+        assert get_directory_path(conn, dir_id) == path
+        assert get_directory_state(conn, 1, path)[0] == dir_id
+    conn.close()
+
+    hasher.hash_index(db_path, provider=DirectoryVolumeProvider([root]))
+    capsys.readouterr()
+    scan(db_path, [root], mode=collector.SCAN_MODE_INCREMENTAL)
+    assert "Files added: 0, updated: 0, removed: 0" in capsys.readouterr().out
+
+    conn = sqlite3.connect(db_path)
+    hashes = conn.execute("""
+        SELECT d.path, f.name, u.partial_hash IS NOT NULL FROM files f
+        JOIN directory_paths d ON d.id = f.directory_id
+        LEFT JOIN unique_files u ON u.file_id = f.id
+        ORDER BY d.path, f.name
+    """).fetchall()
+    conn.close()
+    # the two c.txt have the same size, so both were read through their native paths
+    assert hashes == [("a", "x\\y.txt", False), ("a/b", "c.txt", True), ("a\\b", "c.txt", True)]
\ No newline at end of file
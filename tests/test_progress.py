@@ -0,0 +1,31 @@
+import json
+import os
+
+import console
+from progress import TOTAL_SOURCE_FILESYSTEM, ScanProgress, get_used_bytes
+
+from conftest import scan, write_file
+
+
+def test_quiet_scan_keeps_stdout_json(tmp_path, db_path, capsys, monkeypatch):
+    monkeypatch.setattr(console, "messages_to_stderr", True)
+    write_file(str(tmp_path / "vol" / "a.txt"), b"abc")
+    scan(db_path, [str(tmp_path / "vol")])
+
+    captured = capsys.readouterr()
+    events = [json.loads(line) for line in captured.out.splitlines()]
+    assert events[-1]["event"] == "progress" and events[-1]["final"]
+    assert events[-1]["files"] == 1
+    assert "Scanning completed successfully" in captured.err
+
+def test_used_bytes_only_of_mount_points(tmp_path):
+    assert get_used_bytes([str(tmp_path)]) is None
+    assert get_used_bytes([os.path.abspath(os.sep)]) > 0
+
+def test_eta_names_its_source():
+    progress = ScanProgress(total_bytes=1000, total_source=TOTAL_SOURCE_FILESYSTEM)
+    progress.add_file(100)
+    state = progress.snapshot()
+    assert state["eta_seconds"] is not None
+    assert state["eta_source"] == TOTAL_SOURCE_FILESYSTEM
+    assert ScanProgress().snapshot()["eta_source"] is None
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import collector
+import search
+from database import defer_search_index, has_search_index
+
+from conftest import scan, write_file
+
+
+def found_paths(db_path: str, **filters) -> list[str]:
+    conn = sqlite3.connect(db_path)
+    result = [result.path for result in search.search(conn, search.SearchQuery(**filters))]
+    conn.close()
+    return result
+
+def make_tree(root: str):
+    write_file(os.path.join(root, "Photos", "Holiday 2024", "IMG_0001.JPG"), b"x" * 5000)
+    write_file(os.path.join(root, "Docs", "report.pdf"), b"y")
+
+@pytest.fixture
+def indexed_db(tmp_path, db_path):
+    conn = sqlite3.connect(db_path)
+    if not has_search_index(conn):
+        pytest.skip("SQLite without FTS5 trigram tokenizer")
+    conn.close()
+    return db_path
+
+def check_index(db_path: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO file_names_fts (file_names_fts, rank) VALUES ('integrity-check', 1)")
+    assert conn.execute("SELECT COUNT(*) FROM file_names_fts").fetchone() == \
+        conn.execute("SELECT COUNT(*) FROM files").fetchone()
+    assert set(conn.execute("SELECT rowid, path FROM directory_paths_fts")) == \
+        set(conn.execute("SELECT id, path FROM directory_paths"))
+    conn.close()
+
+def test_full_scan_indexes_names_at_the_end(tmp_path, indexed_db):
+    make_tree(str(tmp_path / "vol"))
+    scan(indexed_db, [str(tmp_path / "vol")])
+
+    conn = sqlite3.connect(indexed_db)
+    assert has_search_index(conn)
+    conn.close()
+    check_index(indexed_db)
+    assert found_paths(indexed_db, name="img_0") == ["Photos\\Holiday 2024\\IMG_0001.JPG"]
+    assert found_paths(indexed_db, path="oliday") == ["Photos\\Holiday 2024\\IMG_0001.JPG"]
+
+def test_deferred_index_is_caught_up_by_the_next_scan(tmp_path, indexed_db):
+    root = str(tmp_path / "vol")
+    make_tree(root)
+    scan(indexed_db, [root])
+    conn = sqlite3.connect(indexed_db)
+    # as left by a scan that was killed before it could catch up
+    defer_search_index(conn)
+    conn.close()
+    write_file(os.path.join(root, "Docs", "later.pdf"), b"z")
+    os.utime(os.path.join(root, "Docs"), ns=(0, 0))
+    scan(indexed_db, [root], mode=collector.SCAN_MODE_INCREMENTAL)
+
+    conn = sqlite3.connect(indexed_db)
+    assert has_search_index(conn)
+    conn.close()
+    check_index(indexed_db)
+    assert found_paths(indexed_db, extension="pdf") == ["Docs\\report.pdf", "Docs\\later.pdf"]
+def test_rows_reusing_ids_of_deleted_rows_are_caught_up(tmp_path, indexed_db):
+    root = str(tmp_path / "vol")
+    make_tree(root)
+    scan(indexed_db, [root])
+    conn = sqlite3.connect(indexed_db)
+    defer_search_index(conn)
+    newest_directory = conn.execute("SELECT path FROM directory_paths ORDER BY id DESC LIMIT 1").fetchone()[0]
+    conn.close()
+    # the newest rows go, the new ones get their ids: below the ids recorded by the deferral
+    shutil.rmtree(os.path.join(root, newest_directory))
+    write_file(os.path.join(root, "Later", "later.pdf"), b"z")
+    os.utime(root, ns=(0, 0))
+    scan(indexed_db, [root], mode=collector.SCAN_MODE_INCREMENTAL)
+
+    check_index(indexed_db)
+    assert found_paths(indexed_db, name="later") == ["Later\\later.pdf"]
+    assert found_paths(indexed_db, path="Later") == ["Later\\later.pdf"]
\ No newline at end of file
@@ -0,0 +1,42 @@
+import os
+import sqlite3
+
+import shards
+from database import has_search_index
+
+from conftest import index_snapshot, make_tree, scan, write_file
+
+
+def check_merged(db_path: str):
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    if has_search_index(conn):
+        assert conn.execute("SELECT COUNT(*) FROM file_names_fts").fetchone() == \
+            conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        assert set(conn.execute("SELECT rowid, path FROM directory_paths_fts")) == \
+            set(conn.execute("SELECT id, path FROM directory_paths"))
+    conn.close()
+
+def test_merged_shards_equal_a_direct_scan(tmp_path, db_path):
+    roots = [str(tmp_path / name) for name in ["a", "b"]]
+    for root in roots:
+        make_tree(root)
+    shard_dir = str(tmp_path / "shards")
+    merged_path = str(tmp_path / "merged.db")
+    scan(db_path, roots)
+    scan(merged_path, roots, shard_dir=shard_dir)
+
+    results = shards.merge_shards(merged_path, shards.find_shards(shard_dir))
+    assert [result.volumes for result in results] == [1, 1]
+    assert sum(result.files for result in results) == 2 * 3 * 3 * 5
+    assert index_snapshot(merged_path) == index_snapshot(db_path)
+    check_merged(merged_path)
+
+    # a rescanned shard replaces its volume instead of adding to it
+    os.remove(os.path.join(roots[0], "dir0", "file0.txt"))
+    write_file(os.path.join(roots[0], "dir0", "new.txt"), b"new")
+    scan(db_path, roots)
+    scan(merged_path, roots, shard_dir=shard_dir)
+    shards.merge_shards(merged_path, shards.find_shards(shard_dir))
+    assert index_snapshot(merged_path) == index_snapshot(db_path)
+    check_merged(merged_path)
\ No newline at end of file
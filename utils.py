@@ -1,16 +1,31 @@
-from datetime import datetime
-import os
-
-
-def to_iso(timestamp: float|None) -> str|None:
-    """Конвертируем timestamp в строку ISO 8601."""
-    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
-
-def format_bytes(bytes_value: int) -> str:
-    bytes_value_f = float(bytes_value)
-    """Converts bytes to a human-readable string (KB, MB, GB)."""
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if bytes_value_f < 1024.0:
-            return f"{bytes_value_f:.2f} {unit}"
-        bytes_value_f /= 1024
+from datetime import datetime
+import os
+
+
+def to_iso(timestamp: float|None) -> str|None:
+    """Конвертируем timestamp в строку ISO 8601."""
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+def to_ns(timestamp: float|None) -> int|None:
+    """Converts a time.time() timestamp to integer nanoseconds."""
+    return int(timestamp * 1_000_000_000) if timestamp is not None else None
+
+def iso_to_ns(value: str|None) -> int|None:
+    """Converts a local time ISO 8601 string written by to_iso back to integer nanoseconds."""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000_000 + moment.microsecond * 1000
+
+def get_created_time_ns(stat_result: os.stat_result) -> int:
+    """Returns the creation time in nanoseconds; falls back to st_ctime_ns where st_birthtime is unavailable (Linux)."""
+    return getattr(stat_result, "st_birthtime_ns", stat_result.st_ctime_ns)
+
+def format_bytes(bytes_value: int) -> str:
+    bytes_value_f = float(bytes_value)
+    """Converts bytes to a human-readable string (KB, MB, GB)."""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if bytes_value_f < 1024.0:
+            return f"{bytes_value_f:.2f} {unit}"
+        bytes_value_f /= 1024
     return f"{bytes_value_f:.2f} PB"
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Чтение содержимого каталогов через os.scandir.
+"""
+
+import os
+
+import instrumentation
+
+
+# Stored relative paths separate the names with a backslash. A backslash inside a name,
+# legal on POSIX, is stored as a slash, which no file system allows in a name, so every
+# path splits back into the names it was joined from.
+PATH_SEPARATOR = "\\"
+ESCAPED_SEPARATOR = "/"
+
+
+class DirectoryListing:
+    """Files and subdirectories of a single directory with their cached stat results."""
+    files: list[tuple[str, os.stat_result]]
+    subdirs: list[tuple[str, os.stat_result]]
+    errors: list[tuple[str, OSError]]
+
+    def __init__(self) -> None:
+        self.files = []
+        self.subdirs = []
+        self.errors = []
+
+    pass
+
+
+def list_directory(abs_path: str, include_files: bool = True, start_after: str|None = None,
+                   device: int|None = None) -> DirectoryListing:
+    """
+    Lists a directory with a single os.scandir call.
+    DirEntry caches the stat result (on Windows it comes with the listing for free),
+    so every entry costs at most one extra syscall.
+    Symlinked directories are not followed to avoid cycles.
+    With include_files=False only subdirectories are collected and files are never stat'ed.
+    With start_after only the files whose names sort after it are stat'ed and collected,
+    which lets a scan continue inside a directory it has partially indexed.
+    With device the subdirectories on another device (see get_volume_device) are left out.
+    Raises OSError (PermissionError included) if the directory itself can't be listed.
+    """
+    listing = DirectoryListing()
+    stat_timer = instrumentation.timer("stat")
+    with os.scandir(abs_path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stat_result = (stat_timer(entry.stat, follow_symlinks=False) if stat_timer
+                                   else entry.stat(follow_symlinks=False))
+                    if device is not None and stat_result.st_dev != device:
+                        continue
+                    listing.subdirs.append((entry.name, stat_result))
+                elif include_files and entry.is_file():
+                    if start_after is not None and entry.name <= start_after:
+                        continue
+                    listing.files.append((entry.name, stat_timer(entry.stat) if stat_timer else entry.stat()))
+            except OSError as e:
+                listing.errors.append((entry.path, e))
+    return listing
+
+def get_volume_device(root_path: str) -> int|None:
+    """
+    st_dev of the volume root, to keep a walk on the volume's own file system: the file systems
+    mounted below it are volumes of their own (see PosixVolumeProvider) or pseudo file systems
+    like /proc. None on Windows, where DirEntry.stat() leaves st_dev zero, and if the root can't
+    be stat'ed; the walk reports that error itself.
+    """
+    if os.name == "nt":
+        return None
+    try:
+        return os.stat(root_path).st_dev
+    except OSError:
+        return None
+
+def join_relative_path(parent_path: str, name: str) -> str:
+    """Joins a stored (backslash separated) relative path with an entry name."""
+    name = name.replace(PATH_SEPARATOR, ESCAPED_SEPARATOR)
+    return f"{parent_path}{PATH_SEPARATOR}{name}" if parent_path else name
+
+def split_relative_path(path: str) -> list[str]:
+    """The entry names of a stored relative path, from the top; the root of a volume has none."""
+    return [name.replace(ESCAPED_SEPARATOR, PATH_SEPARATOR) for name in path.split(PATH_SEPARATOR)] if path else []
+
+def split_parent_path(path: str) -> tuple[str, str]:
+    """(parent path, entry name) of a stored relative path."""
+    parent_path, _, name = path.rpartition(PATH_SEPARATOR)
+    return parent_path, name.replace(ESCAPED_SEPARATOR, PATH_SEPARATOR)
+
+def to_native_path(root_path: str, path: str) -> str:
+    """Converts a stored relative path back to an absolute path under root_path."""
+    return os.path.join(root_path, *split_relative_path(path)) if path else root_path
\ No newline at end of file